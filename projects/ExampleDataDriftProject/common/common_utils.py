@@ -1,6 +1,9 @@
 import os
-import numpy as np
-from environs import Env
+import sys
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict
 
 
 def format_arg_features(features):
@@ -25,3 +28,404 @@ def format_arg_features(features):
     list_of_features = features.rsplit(",")
 
     return list_of_features
+
+
+def to_local_path(path):
+    """ Convert a DBFS URI to its local FUSE mount path.
+
+    Inputs:
+        path (str): Local path or DBFS URI (e.g., 'dbfs:/checkpoints/run').
+
+    Return:
+        local_path (str): Path that can be used with local file operations (e.g., '/dbfs/checkpoints/run').
+    """
+    if path.startswith("dbfs:/"):
+        return "/dbfs/" + path[len("dbfs:/") :].lstrip("/")
+
+    return path
+
+
+def parse_memory_size(size):
+    """ Convert a memory size to a number of bytes.
+
+    Inputs:
+        size (str): Number of bytes, optionally with a KB, MB, GB or TB suffix in powers of 1024 (e.g., '4GB').
+
+    Return:
+        n_bytes (int): Size in bytes.
+    """
+    units = {"TB": 1024 ** 4, "GB": 1024 ** 3, "MB": 1024 ** 2, "KB": 1024, "B": 1}
+
+    size = size.strip().upper()
+    for unit, unit_bytes in units.items():
+        if size.endswith(unit):
+            return int(float(size[: -len(unit)]) * unit_bytes)
+
+    return int(float(size))
+
+
+def start_peak_rss():
+    """ Start measuring the peak resident memory of a job, for get_peak_rss().
+
+    On Linux the peak is reset, so each job of a long-lived process (see common/worker.py) is measured on its
+    own. Elsewhere the peak so far is the baseline, which only a job's own peak can exceed.
+
+    Return:
+        baseline (int): Peak resident set size in bytes to pass to get_peak_rss() (0 after a reset).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return get_peak_rss() or 0
+
+    return 0
+
+
+def get_peak_rss(baseline=0):
+    """ Peak resident memory of this process so far.
+
+    Inputs:
+        baseline (int): Peak when the job started, as returned by start_peak_rss(). A peak no higher than it
+                        was reached before the job, so the job's own peak isn't known.
+
+    Return:
+        peak_rss (int): Peak resident set size in bytes, or None where it isn't available (e.g., on Windows) or
+                        not known for the job.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Reported in kilobytes on Linux and in bytes on macOS
+    peak_rss = peak_rss if sys.platform == "darwin" else peak_rss * 1024
+    if baseline > 0 and peak_rss <= baseline:
+        return None
+
+    return peak_rss
+
+
+def factorize_groups(df, group_cols):
+    """ Build one integer group key for the combinations of several grouping columns.
+
+    Each column is factorized once and the codes are combined column by column, so no string key is
+    built per row. Readable labels are only built once per group.
+
+    Inputs:
+        df (pd.DataFrame): Pandas DataFrame containing the data.
+        group_cols (list of str): Names of the columns to group by (e.g., ['hospitalID', 'dxGroup']).
+
+    Return:
+        group_codes (np.ndarray): Group key of each row, numbered in sorted order of the column values.
+        group_labels (np.ndarray): Label of each group key, its column values joined by "|" (e.g., 'hospital01|CHF').
+    """
+    import numpy as np
+    import pandas as pd
+
+    group_codes = np.zeros(len(df), dtype=np.int64)
+    for col in group_cols:
+        col_codes, uniques = pd.factorize(df[col], sort=True)
+        # Nulls (code -1) are kept as their own value
+        group_codes, _ = pd.factorize(
+            group_codes * (len(uniques) + 1) + col_codes + 1, sort=True
+        )
+
+    first_rows = np.unique(group_codes, return_index=True)[1]
+    group_labels = np.array(
+        [
+            "|".join(str(value) for value in values)
+            for values in df[group_cols].iloc[first_rows].itertuples(index=False)
+        ],
+        dtype=object,
+    )
+
+    return group_codes, group_labels
+
+
+def label_groups(results_df, group_col, group_labels):
+    """ Replace the group keys from factorize_groups() in a results table with their labels.
+
+    Inputs:
+        results_df (pd.DataFrame): Results with group_col and group_value columns.
+        group_col (str): Name of the grouping column(s) as written in the results (e.g., 'hospitalID,dxGroup').
+        group_labels (np.ndarray): Labels returned by factorize_groups().
+
+    Return:
+        results_df (pd.DataFrame): The results, with the labels as group_value of group_col rows.
+    """
+    is_group = results_df["group_col"] == group_col
+    results_df = results_df.copy()
+    results_df["group_value"] = results_df["group_value"].astype(object)
+    results_df.loc[is_group, "group_value"] = group_labels[
+        results_df.loc[is_group, "group_value"].astype(int).to_numpy()
+    ]
+
+    return results_df
+
+
+def get_run_key(params):
+    """ Create a short key identifying a run from its parameters.
+
+    Inputs:
+        params (dict): Run parameters. Values must be JSON serializable.
+
+    Return:
+        run_key (str): Hex digest that only changes when a parameter changes.
+    """
+    serialized = json.dumps(params, sort_keys=True, default=str)
+
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()[:16]
+
+
+def write_csv_atomic(csv_name, df):
+    """ Write a DataFrame to .csv so that readers never see a partially written file.
+
+    Inputs:
+        csv_name (str): Name of csv file to be written.
+        df (pd.DataFrame): Pandas DataFrame to be written.
+    """
+    tmp_name = "{0}.tmp".format(csv_name)
+    df.to_csv(tmp_name, index=False, header=True)
+    os.replace(tmp_name, csv_name)
+
+
+class LRUCache:
+    """ Keep the most recently used values in memory, up to a maximum number of entries.
+
+    Inputs:
+        max_size (int): Maximum number of entries. 0 disables the cache.
+    """
+
+    def __init__(self, max_size=0):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Return the value for key (marking it as recently used), or None if it isn't cached.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return self.entries[key]
+
+    def put(self, key, value):
+        """ Add a value, evicting the least recently used entries beyond max_size.
+        """
+        if self.max_size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        """ Return the number of entries, hits and misses.
+        """
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+# DataFrames returned by read_csv_cached(), kept in memory by long-lived processes (see common/worker.py)
+DATASET_CACHE = LRUCache()
+
+
+def get_csv_cache_dir(data_path, cache_root=None):
+    """ Find the cache directory for a .csv file, which changes whenever the file does.
+
+    Inputs:
+        data_path (str): Path to a local .csv file.
+        cache_root (str): Directory holding all caches. Defaults to the DATA_CACHE_DIR environment variable,
+                          or data_drift_cache in the system temporary directory.
+
+    Return:
+        cache_dir (str): Directory for the cached columns of this version of the file.
+    """
+    if cache_root is None:
+        cache_root = os.environ.get(
+            "DATA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "data_drift_cache")
+        )
+    stat = os.stat(data_path)
+    key = get_run_key(
+        {
+            "path": os.path.abspath(data_path),
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+        }
+    )
+
+    return os.path.join(to_local_path(cache_root), key)
+
+
+def save_cached_column(cache_dir, name, series):
+    """ Save one column of a DataFrame as .npy files that can be memory-mapped.
+
+    Numeric columns are saved as they are. String columns are saved as int32 codes into an array of their
+    distinct values, with -1 for nulls. Other columns (e.g., mixed numbers and strings) aren't saved, since
+    their values couldn't be loaded back with their types, and are read from the .csv each time.
+
+    Inputs:
+        cache_dir (str): Directory for the cached columns of the file.
+        name (str): File name prefix for the column.
+        series (pd.Series): Column to be saved.
+
+    Return:
+        saved (bool): Whether the column was saved.
+    """
+    import numpy as np
+    import pandas as pd
+
+    paths = {}
+    if pd.api.types.is_numeric_dtype(series) and not isinstance(
+        series.dtype, pd.CategoricalDtype
+    ):
+        paths["values"] = series.to_numpy()
+    elif pd.api.types.infer_dtype(series, skipna=True) not in ["string", "empty"]:
+        return False
+    else:
+        codes, uniques = pd.factorize(series)
+        paths["codes"] = codes.astype(np.int32)
+        paths["uniques"] = np.asarray(uniques, dtype=str)
+
+    for kind, values in paths.items():
+        file_name = os.path.join(cache_dir, "{0}.{1}.npy".format(name, kind))
+        tmp_name = "{0}.tmp.npy".format(file_name[: -len(".npy")])
+        np.save(tmp_name, values, allow_pickle=False)
+        os.replace(tmp_name, file_name)
+
+    return True
+
+
+def load_cached_column(cache_dir, name):
+    """ Load one column saved by save_cached_column().
+
+    Numeric columns are memory-mapped read-only without copying. Other columns are rebuilt from their codes.
+
+    Inputs:
+        cache_dir (str): Directory for the cached columns of the file.
+        name (str): File name prefix for the column.
+
+    Return:
+        values (np.ndarray): Values of the column, or None if it isn't cached.
+    """
+    import numpy as np
+
+    values_path = os.path.join(cache_dir, "{0}.values.npy".format(name))
+    codes_path = os.path.join(cache_dir, "{0}.codes.npy".format(name))
+    if os.path.exists(values_path):
+        # Plain ndarray view of the read-only memory map
+        return np.asarray(np.load(values_path, mmap_mode="r"))
+    if not os.path.exists(codes_path):
+        return None
+
+    codes = np.load(codes_path, mmap_mode="r")
+    uniques = np.load(os.path.join(cache_dir, "{0}.uniques.npy".format(name)))
+    values = np.append(uniques.astype(object), np.nan)[codes]
+
+    return values
+
+
+def read_csv_cached(data_path, columns=None, cache_root=None):
+    """ Read a .csv file through a local columnar cache.
+
+    The first read of each column parses the .csv and saves the column as .npy files. Later reads of the
+    same version of the file (same path, modification time and size) load the columns from the cache,
+    memory-mapping numeric columns instead of parsing. Paths that aren't local files (e.g., URLs) are read
+    directly. If DATASET_CACHE is enabled, the returned DataFrame is also kept in memory and returned as is
+    by later calls, so it must not be modified.
+
+    Inputs:
+        data_path (str): Path to data in .csv format (filepath or URL).
+        columns (list of str): Columns to load. Defaults to all columns.
+        cache_root (str): Directory holding all caches (see get_csv_cache_dir()).
+
+    Return:
+        df (pd.DataFrame): The requested columns of the .csv, in file order.
+    """
+    import pandas as pd
+
+    if not os.path.isfile(data_path):
+        return pd.read_csv(data_path, usecols=columns)
+
+    cache_dir = get_csv_cache_dir(data_path, cache_root)
+    memory_key = (cache_dir, None if columns is None else tuple(sorted(columns)))
+    df = DATASET_CACHE.get(memory_key)
+    if df is not None:
+        return df
+
+    header_path = os.path.join(cache_dir, "header.json")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(header_path):
+            with open(header_path) as f:
+                header = json.load(f)
+        else:
+            header = list(pd.read_csv(data_path, nrows=0).columns)
+            with open("{0}.tmp".format(header_path), "w") as f:
+                json.dump(header, f)
+            os.replace("{0}.tmp".format(header_path), header_path)
+    except OSError:
+        return pd.read_csv(data_path, usecols=columns)
+
+    # Cached columns are named by position, so any column name can be cached
+    wanted = header if columns is None else [col for col in header if col in columns]
+    names = {col: "col{0}".format(header.index(col)) for col in wanted}
+    data = {col: load_cached_column(cache_dir, names[col]) for col in wanted}
+
+    missing = [col for col in wanted if data[col] is None]
+    if columns is not None and len(set(columns) - set(header)) > 0:
+        # Let pandas raise its usual error for unknown columns
+        missing = list(columns)
+    if len(missing) > 0:
+        df_missing = pd.read_csv(data_path, usecols=missing)
+        for col in missing:
+            try:
+                save_cached_column(cache_dir, names[col], df_missing[col])
+            except OSError:
+                pass
+            data[col] = df_missing[col]
+
+    df = pd.DataFrame(data, columns=wanted, copy=False)
+    DATASET_CACHE.put(memory_key, df)
+
+    return df
+
+
+def read_grouped_data(data_path, columns, group_col):
+    """ Read the needed columns of the data, with several grouping columns turned into one group key.
+
+    Inputs:
+        data_path (str): Path to the .csv data.
+        columns (list of str): Names of the needed columns, other than the grouping columns.
+        group_col (str): Name of column to group results by, or comma separated names of several
+                         (e.g., 'hospitalID,dxGroup').
+
+    Return:
+        df (pd.DataFrame): The data. With several grouping columns, a group_col column holds the integer
+                           group key of each row (see factorize_groups()). If DATASET_CACHE is enabled, it is
+                           kept with the data it was built from, so the same DataFrame is returned by later
+                           calls and data prepared from it can be reused.
+        group_labels (np.ndarray): Label of each group key, or None with a single grouping column.
+    """
+    group_cols = format_arg_features(group_col) if group_col != "" else []
+    df = read_csv_cached(data_path, columns=list(dict.fromkeys(columns + group_cols)))
+    if len(group_cols) < 2:
+        return df, None
+
+    memory_key = ("grouped", id(df), group_col)
+    cached = DATASET_CACHE.get(memory_key)
+    # The data is kept with the entry, so its id can't be reused by another DataFrame
+    if cached is not None and cached[0] is df:
+        return cached[1], cached[2]
+
+    group_codes, group_labels = factorize_groups(df, group_cols)
+    grouped_df = df.assign(**{group_col: group_codes})
+    DATASET_CACHE.put(memory_key, (df, grouped_df, group_labels))
+
+    return grouped_df, group_labels
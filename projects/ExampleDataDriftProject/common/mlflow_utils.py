@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class AsyncMlflowLogger:
+    """ Log artifacts and metrics to the active mlflow run from background threads.
+
+    Uploads to a remote artifact store no longer block the job: log_artifact() and log_metric() return
+    immediately and the uploads run on a small thread pool while the job keeps computing, several at a time.
+    Metrics are sent in batches. The number of pending uploads is bounded, so a job producing files faster
+    than they can be uploaded waits instead of piling them up. Use as a context manager inside
+    mlflow.start_run() so everything is flushed before the run ends:
+
+        with mlflow.start_run(), AsyncMlflowLogger() as logger:
+            logger.log_artifact("results.csv")
+
+    Inputs:
+        max_queue_size (int): Maximum number of pending uploads.
+        metric_batch_size (int): Number of metrics sent in each batch.
+        n_threads (int): Number of uploads run at the same time.
+    """
+
+    def __init__(self, max_queue_size=8, metric_batch_size=100, n_threads=4):
+        import mlflow
+        from mlflow.tracking import MlflowClient
+
+        self.run_id = mlflow.active_run().info.run_id
+        self.client = MlflowClient()
+        self.metric_batch_size = metric_batch_size
+        self.pending_metrics = []
+        self.pending = []
+        self.slots = threading.BoundedSemaphore(max_queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=n_threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # Don't mask the error of the with block with an upload error
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _upload(self, kind, payload):
+        """ Run one queued upload.
+        """
+        try:
+            if kind == "artifact":
+                self.client.log_artifact(self.run_id, payload)
+            else:
+                self.client.log_batch(self.run_id, metrics=payload)
+        finally:
+            self.slots.release()
+
+    def _submit(self, kind, payload):
+        """ Queue an upload, waiting while max_queue_size uploads are pending.
+        """
+        self.slots.acquire()
+        self.pending.append(self.executor.submit(self._upload, kind, payload))
+
+    def log_artifact(self, local_path):
+        """ Queue a local file to be uploaded as an artifact of the run.
+
+        Inputs:
+            local_path (str): Path to the file. It must not be modified until flush() or close() returns.
+        """
+        self._submit("artifact", local_path)
+
+    def log_metric(self, key, value, step=0):
+        """ Add a metric to the current batch, which is queued once it is full.
+
+        Inputs:
+            key (str): Metric name.
+            value (float): Metric value.
+            step (int): Metric step.
+        """
+        from mlflow.entities import Metric
+
+        self.pending_metrics.append(
+            Metric(key, float(value), int(time.time() * 1000), step)
+        )
+        if len(self.pending_metrics) >= self.metric_batch_size:
+            self._submit("metrics", self.pending_metrics)
+            self.pending_metrics = []
+
+    def log_metrics(self, metrics, step=0):
+        """ Add several metrics to the current batch.
+
+        Inputs:
+            metrics (dict): Metric values by name.
+            step (int): Metric step.
+        """
+        for key, value in metrics.items():
+            self.log_metric(key, value, step)
+
+    def flush(self):
+        """ Wait until everything queued so far is uploaded.
+
+        Raises the first upload error, if any, so a failed upload still fails the job.
+        """
+        if len(self.pending_metrics) > 0:
+            self._submit("metrics", self.pending_metrics)
+            self.pending_metrics = []
+        pending, self.pending = self.pending, []
+        wait(pending)
+
+        errors = [future.exception() for future in pending if future.exception() is not None]
+        if len(errors) > 0:
+            raise errors[0]
+
+    def close(self):
+        """ Flush all uploads and stop the background threads.
+        """
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,92 @@
+""" Run independent tasks of very different sizes on a pool of threads
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def run_tasks(run, tasks, costs=None, n_workers=1, sizes=None, budget=None):
+    """ Run tasks on n_workers threads, largest first, and yield their results as they finish.
+
+    Tasks are not split between workers up front. They wait in one queue ordered by decreasing cost and
+    each worker takes the next one as soon as it is free, so workers that drew small tasks pick up the
+    remaining work instead of idling while another finishes a large one. With tasks ordered largest first,
+    the wall time is at most the total cost divided by n_workers plus the cost of the largest task, which
+    callers keep small by splitting very large tasks.
+
+    With a memory budget, a free worker takes the next task that fits in the budget next to the tasks
+    already running, and waits if none does. A task larger than the budget only starts when no other
+    task is running.
+
+    Inputs:
+        run (callable): Function called with each task, in a worker thread.
+        tasks (list): Tasks to run.
+        costs (list of float): Estimated cost of each task. Tasks are taken in the given order if not provided.
+        n_workers (int): Number of worker threads. With 1, tasks run one by one in the calling thread.
+        sizes (list of float): Estimated memory of each task, in the same unit as budget.
+        budget (float): Maximum total size of the tasks running at the same time. No limit if not provided.
+
+    Yields:
+        index (int): Position of the finished task in tasks.
+        result: Return value of run, or None if it raised an exception.
+        error (Exception): Exception raised by run, or None.
+    """
+    order = list(range(len(tasks)))
+    if costs is not None:
+        # Stable, so tasks of equal cost keep their order
+        order.sort(key=lambda i: -costs[i])
+
+    if n_workers <= 1:
+        for i in order:
+            try:
+                result = run(tasks[i])
+            except Exception as e:
+                yield i, None, e
+            else:
+                yield i, result, None
+        return
+
+    if sizes is None or budget is None:
+        sizes, budget = [0] * len(tasks), float("inf")
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        running = {}
+        in_use = 0
+        while len(order) > 0 or len(running) > 0:
+            # Start the largest waiting tasks that fit next to the running ones
+            for i in list(order):
+                if len(running) >= n_workers:
+                    break
+                if len(running) > 0 and in_use + sizes[i] > budget:
+                    continue
+                running[executor.submit(run, tasks[i])] = i
+                in_use += sizes[i]
+                order.remove(i)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                in_use -= sizes[i]
+                error = future.exception()
+                yield i, None if error is not None else future.result(), error
+
+
+def split_costly_tasks(costs, n_workers, max_parts):
+    """ Decide how many parts to split each task into so no part is much larger than a worker's fair share.
+
+    Inputs:
+        costs (list of float): Estimated cost of each task.
+        n_workers (int): Number of worker threads.
+        max_parts (int): Maximum number of parts of a task (e.g., its number of features).
+
+    Returns:
+        n_parts (list of int): Number of parts for each task, 1 for tasks that aren't split.
+    """
+    total = float(sum(costs))
+    if n_workers <= 1 or total == 0:
+        return [1] * len(costs)
+
+    fair_share = total / n_workers
+
+    return [
+        int(min(max(1, -(-cost // fair_share)), max_parts, n_workers)) for cost in costs
+    ]
@@ -0,0 +1,275 @@
+""" Long-lived worker that runs drift and validation jobs with datasets kept warm in memory
+
+Start the worker from the project directory:
+
+    python common/worker.py --port 8765
+
+and point the scripts at it with DRIFT_WORKER_URL=http://127.0.0.1:8765. The scripts then send their command
+line arguments to the worker instead of importing mlflow and loading the data themselves.
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import ipaddress
+import json
+import os
+import sys
+import threading
+import traceback
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Scripts that can run on the worker, by job name
+JOB_MODULES = {
+    "calculate_all_drift": "distribution.calculate_all_drift",
+    "validate_fips": "validation.model_input.validate_fips",
+    "validate_cases": "validation.model_input.validate_cases",
+    "validate_deaths": "validation.model_input.validate_deaths",
+}
+
+# Environment variables of the client that apply to the job (e.g., the mlflow run started by `mlflow run`)
+FORWARDED_ENV_PREFIXES = ("MLFLOW_", "DATA_CACHE_DIR", "AZURE_", "DATABRICKS_")
+
+
+def is_loopback_host(host):
+    """ Check whether a host name or address refers to this machine only.
+
+    Inputs:
+        host (str): Host name or IP address.
+
+    Returns:
+        is_loopback (bool): True for localhost and loopback addresses (127.0.0.0/8, ::1).
+    """
+    if host is None:
+        return False
+    if host.lower() == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+# ----------------------
+# Client
+# ----------------------
+
+
+def submit_to_worker(job, argv):
+    """ Run a job on the worker set by the DRIFT_WORKER_URL environment variable.
+
+    Inputs:
+        job (str): Job name (key of JOB_MODULES).
+        argv (list of str): Command line arguments of the script.
+
+    Returns:
+        returncode (int): Exit code of the job, or None if no worker is set, it isn't on this machine or it
+                          can't be reached, in which case the caller runs the job itself.
+    """
+    worker_url = os.environ.get("DRIFT_WORKER_URL", "")
+    if worker_url == "":
+        return None
+
+    # The request carries the client's credentials and the worker has no authentication, so only a worker on
+    # this machine is trusted with it
+    if not is_loopback_host(urllib.parse.urlsplit(worker_url).hostname):
+        print("Worker at {0} is not on localhost, running locally".format(worker_url))
+        return None
+
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key.startswith(FORWARDED_ENV_PREFIXES)
+    }
+    request = urllib.request.Request(
+        worker_url.rstrip("/") + "/jobs",
+        data=json.dumps(
+            {"job": job, "argv": list(argv), "cwd": os.getcwd(), "env": env}
+        ).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            result = json.loads(response.read().decode("utf-8"))
+    except (urllib.error.URLError, ConnectionError) as e:
+        print("Worker at {0} unavailable ({1}), running locally".format(worker_url, e))
+        return None
+
+    print(result["output"], end="")
+    return result["returncode"]
+
+
+# ----------------------
+# Worker
+# ----------------------
+
+
+def run_job(job, argv, cwd, env):
+    """ Run a job in this process, as if its script had been run from cwd with env.
+
+    Jobs change the working directory and environment of the process, so only one runs at a time. The
+    worker's own forwarded variables (see FORWARDED_ENV_PREFIXES) that the client didn't send are unset for
+    the job, so jobs never use the worker's credentials or cache directory.
+
+    Inputs:
+        job (str): Job name (key of JOB_MODULES).
+        argv (list of str): Command line arguments of the script.
+        cwd (str): Working directory of the client, where output files are written.
+        env (dict): Environment variables of the client to set for the job.
+
+    Returns:
+        result (dict): Exit code ("returncode") and printed output ("output") of the job.
+    """
+    module = importlib.import_module(JOB_MODULES[job])
+
+    previous_cwd = os.getcwd()
+    job_keys = set(env) | {
+        key for key in os.environ if key.startswith(FORWARDED_ENV_PREFIXES)
+    }
+    previous_env = {key: os.environ.get(key) for key in job_keys}
+    output = io.StringIO()
+    returncode = 0
+    try:
+        os.chdir(cwd)
+        for key in job_keys - set(env):
+            os.environ.pop(key, None)
+        os.environ.update(env)
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            try:
+                module.main(argv, use_worker=False)
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+    finally:
+        os.chdir(previous_cwd)
+        for key, value in previous_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    return {"returncode": returncode, "output": output.getvalue()}
+
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    """ Handle job requests (POST /jobs) and cache statistics (GET /status).
+    """
+
+    job_lock = threading.Lock()
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/status":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        from common.common_utils import DATASET_CACHE
+        from distribution.calculate_all_drift import PREPARED_CACHE
+
+        self.send_json(
+            200, {"datasets": DATASET_CACHE.stats(), "prepared": PREPARED_CACHE.stats()}
+        )
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if request.get("job") not in JOB_MODULES:
+            self.send_json(400, {"error": "unknown job {0}".format(request.get("job"))})
+            return
+
+        with self.job_lock:
+            result = run_job(
+                request["job"],
+                request.get("argv", []),
+                request.get("cwd", os.getcwd()),
+                request.get("env", {}),
+            )
+        self.send_json(200, result)
+
+
+def create_worker(host="127.0.0.1", port=8765, max_datasets=4, max_prepared=4):
+    """ Create the worker's HTTP server and enable the in-memory caches.
+
+    The worker has no authentication and runs jobs with the credentials clients send, so it only listens on
+    loopback addresses.
+
+    Inputs:
+        host (str): Loopback address to listen on.
+        port (int): Port to listen on (0 for any free port).
+        max_datasets (int): Number of loaded datasets (DataFrames) kept in memory.
+        max_prepared (int): Number of prepared (parsed and sorted) datasets kept in memory for drift jobs.
+
+    Returns:
+        server (ThreadingHTTPServer): Server ready for serve_forever().
+    """
+    if not is_loopback_host(host):
+        raise ValueError("Worker must listen on a loopback address, not {0}".format(host))
+
+    # Job modules are imported by name, the validators also import validation_utils directly
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for path in [project_dir, os.path.join(project_dir, "validation", "model_input")]:
+        if path not in sys.path:
+            sys.path.append(path)
+
+    from common.common_utils import DATASET_CACHE
+    from distribution.calculate_all_drift import PREPARED_CACHE
+
+    DATASET_CACHE.max_size = max_datasets
+    PREPARED_CACHE.max_size = max_prepared
+
+    # Import everything the jobs need now, rather than during the first job
+    import mlflow  # noqa: F401
+
+    for module in JOB_MODULES.values():
+        importlib.import_module(module)
+
+    return ThreadingHTTPServer((host, port), WorkerHandler)
+
+
+# ----------------------
+# Main
+# ----------------------
+
+if __name__ == "__main__":
+    # Read in arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--host", type=str, required=False, default="127.0.0.1", help="Loopback address to listen on",
+    )
+    parser.add_argument(
+        "--port", type=int, required=False, default=8765, help="Port to listen on",
+    )
+    parser.add_argument(
+        "--maxDatasets",
+        type=int,
+        required=False,
+        default=4,
+        help="Number of loaded datasets kept in memory",
+    )
+    parser.add_argument(
+        "--maxPrepared",
+        type=int,
+        required=False,
+        default=4,
+        help="Number of parsed and sorted datasets kept in memory for drift jobs",
+    )
+    args = parser.parse_args()
+
+    server = create_worker(args.host, args.port, args.maxDatasets, args.maxPrepared)
+    print("Worker listening on http://{0}:{1}".format(*server.server_address))
+    server.serve_forever()
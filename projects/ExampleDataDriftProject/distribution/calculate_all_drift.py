@@ -6,16 +6,71 @@ import numpy as np
 import datetime
 import argparse
 import decimal
-import mlflow
+import json
 import os
 import sys
-from environs import Env
+import zlib
 
 # ----------------------
 # Import Common Functions
 # ----------------------
 sys.path.append(os.getcwd())
-from common.common_utils import format_arg_features  # noqa: E402
+from common.common_utils import (  # noqa: E402
+    format_arg_features,
+    to_local_path,
+    parse_memory_size,
+    start_peak_rss,
+    get_peak_rss,
+    get_run_key,
+    write_csv_atomic,
+    read_grouped_data,
+    label_groups,
+    LRUCache,
+)
+from common.mlflow_utils import AsyncMlflowLogger  # noqa: E402
+from common.scheduler import run_tasks, split_costly_tasks  # noqa: E402
+from common.worker import submit_to_worker  # noqa: E402
+from distribution.drift_utils import (  # noqa: E402
+    ks_pvalues,
+    ks_rolling_statistics,
+    mmd_drift_test,
+    adjust_pvalues,
+    stratified_sample_indices,
+    get_null_matrix,
+    get_compact_categories,
+    compact_column,
+    value_counts_column,
+    ks_drift_predict_counts,
+    ks_drift_predict_columns,
+    random_sample_indices,
+    get_accuracy_sample_size,
+    choose_ks_strategy,
+    drift_metrics,
+    DRIFT_METRICS,
+)
+from distribution.drift_cube import (  # noqa: E402
+    build_drift_cube,
+    save_drift_cube,
+    load_drift_cube,
+    get_cube_group_bounds,
+    get_cube_date_range,
+    query_drift_cube,
+)
+
+# Name used in the feature column for multivariate drift results
+MULTIVARIATE_MMD_FEATURE = "multivariate_mmd"
+
+# Results column of each additional drift metric (see drift_utils.drift_metrics())
+METRIC_COLUMNS = {"psi": "psi", "wasserstein": "wassersteinDistance", "js": "jsDivergence"}
+
+# Bytes per value in memory estimates (a float64 or an object pointer), see estimate_group_memory()
+VALUE_BYTES = 8
+
+# Fewest rows sampled from a window to fit a group in a memory budget, see get_memory_sample_caps()
+MIN_MEMORY_SAMPLES = 1000
+
+# Prepared data for recently used datasets, kept in memory by long-lived processes (see common/worker.py)
+PREPARED_CACHE = LRUCache()
 
 # ----------------------
 # Functions
@@ -29,6 +84,7 @@ def get_baseline_target_range(
     baseline_end="",
     target_start="",
     target_end="",
+    date_range=None,
 ):
     """ If not provided, find default baseline and target ranges.
 
@@ -42,6 +98,8 @@ def get_baseline_target_range(
         baseline_end (str): Empty string or baseline end date in YYYY-MM-DD format (e.g., '2018-01-01').
         target_start (str): Empty string or target start date in YYYY-MM-DD format (e.g., '2018-01-01').
         target_end (str): Empty string or target end date in YYYY-MM-DD format (e.g., '2020-01-01').
+        date_range (tuple): Earliest and latest datetime of the data, if already known (e.g., from a drift cube).
+                            df isn't read in that case.
 
     Returns:
         baseline_start (str): Baseline start date in YYYY-MM-DD format (e.g., '2015-01-01').
@@ -51,10 +109,12 @@ def get_baseline_target_range(
     """
 
     # Get min and max datetime range
-    dates = list(df[datetime_col].apply(pd.to_datetime))
-
-    range_min = np.min(dates)
-    range_max = np.max(dates)
+    if date_range is None:
+        dates = pd.to_datetime(df[datetime_col])
+        range_min = dates.min()
+        range_max = dates.max()
+    else:
+        range_min, range_max = date_range
 
     # Assign start and end dates if not specified
     if baseline_start == "":
@@ -142,29 +202,45 @@ def validate_datetime_range(
     return datetime_status, range_min, range_max
 
 
-def initialize_df():
+def initialize_df(metrics=None, strategy=False):
     """ Initialize the dictionary that will store results.
 
+    Input:
+        metrics (list of str): Additional drift metrics (from DRIFT_METRICS), whose columns are added after
+                               isSignificantDrift.
+        strategy (bool): Add the ksStrategy column, after the metrics (see detect_drift_by_ID(auto_strategy)).
+
     Returns:
         df (dataframe)
     """
+    metric_columns = [METRIC_COLUMNS[metric] for metric in (metrics or [])]
+    if strategy:
+        metric_columns.append("ksStrategy")
 
     df = pd.DataFrame(
         columns=[
             "group_col",
             "group_value",
+            "windowID",
             "feature",
+            "status",
+            "skipReason",
             "pValue",
             "isSignificantDrift",
+        ]
+        + metric_columns
+        + [
             "baselineSamples",
             "baselineNullValues",
             "baselineRemoved",
+            "baselineSamplesUsed",
             "baselineValues",
             "baselineValueCounts",
             "baselineValuePercentages",
             "targetSamples",
             "targetNullValues",
             "targetRemoved",
+            "targetSamplesUsed",
             "targetValues",
             "targetValueCounts",
             "targetValuePercentages",
@@ -178,6 +254,8 @@ def retrieve_data(
 ):
     """ Retrieve data for one feature from a specific group over a specified datetime range.
 
+    The input DataFrame is not modified.
+
     Input:
         features (list of str): Names of the features (columns) of interest.
         df (pd.DataFrame): Pandas DataFrame containing data.
@@ -190,31 +268,540 @@ def retrieve_data(
     Returns:
         df_out (pd.DataFrame): Pandas DataFrame containing the feature data and associated datetime.
     """
+    dates = pd.to_datetime(df[datetime_col])
+    mask = (dates >= start_datetime) & (dates <= end_datetime)
+    if group_col != "":
+        mask = mask & (df[group_col] == group_value)
+
+    df_out = df.loc[mask, features]
+    if datetime_col in features:
+        df_out = df_out.assign(**{datetime_col: dates[mask]})
+
+    return df_out
+
+
+def prepare_data(df, datetime_col, group_col, features):
+    """ Parse, project and sort the data once so windows can be retrieved without copying.
+
+    Input:
+        df (pd.DataFrame): Pandas DataFrame containing data.
+        datetime_col (str): Name of column in df containing datetime information.
+        group_col (str): Name of column to group results by.
+        features (list of str): Names of the features (columns) of interest.
+
+    Returns:
+        prepared (dict): The projected data with a parsed datetime column, sorted by group and datetime ("df"),
+                         its datetimes as a datetime64[ns] array ("dates"), and the first and last + 1 row
+                         of each group ("group_bounds"). Rows without a group or datetime are left out.
+    """
+    columns = list(dict.fromkeys(features + [datetime_col]))
+    if group_col != "":
+        columns = list(dict.fromkeys(columns + [group_col]))
+
+    df_prepared = df[columns].copy()
+    df_prepared[datetime_col] = pd.to_datetime(df_prepared[datetime_col])
+    # Rows without a datetime are in no window, and would sort last and hide the latest datetime of their group
+    df_prepared = df_prepared[df_prepared[datetime_col].notna()]
+
     if group_col == "":
-        df_out = df
-        df_out[datetime_col] = list(df_out[datetime_col].apply(pd.to_datetime))
+        df_prepared = df_prepared.sort_values(datetime_col, kind="mergesort")
+        group_bounds = {"": (0, len(df_prepared))}
+    else:
+        # Rows without a group belong to none, and would break the sorted group codes
+        df_prepared = df_prepared[df_prepared[group_col].notna()]
+        df_prepared = df_prepared.sort_values([group_col, datetime_col], kind="mergesort")
+        codes, uniques = pd.factorize(df_prepared[group_col])
+        firsts = np.searchsorted(codes, np.arange(len(uniques)), side="left")
+        lasts = np.searchsorted(codes, np.arange(len(uniques)), side="right")
+        group_bounds = {
+            group_value: (first, last)
+            for group_value, first, last in zip(uniques, firsts, lasts)
+        }
+
+    prepared = {
+        "df": df_prepared,
+        "dates": df_prepared[datetime_col].to_numpy(dtype="datetime64[ns]"),
+        "group_bounds": group_bounds,
+    }
+
+    return prepared
+
+
+def get_prepared_data(df, datetime_col, group_col, features):
+    """ Return prepare_data() for df, reusing the result of an earlier call on the same DataFrame if it's in
+    PREPARED_CACHE.
+
+    Input:
+        See prepare_data().
+
+    Returns:
+        prepared (dict): Data as returned by prepare_data().
+    """
+    key = (id(df), datetime_col, group_col, tuple(features))
+    cached = PREPARED_CACHE.get(key)
+    # The DataFrame is kept with the entry, so its id can't be reused by another DataFrame
+    if cached is not None and cached[0] is df:
+        return cached[1]
+
+    prepared = prepare_data(df, datetime_col, group_col, features)
+    PREPARED_CACHE.put(key, (df, prepared))
+
+    return prepared
+
+
+def retrieve_prepared_data(prepared, group_value, start_datetime, end_datetime):
+    """ Retrieve the rows of a specific group over a specified datetime range from prepared data.
+
+    Rows are found with a binary search on the sorted datetimes and returned as a positional slice,
+    so nothing is parsed, masked or copied. A rollup group (e.g., a state over its counties) is given
+    as the list of its child groups, and its rows are the child slices put together.
+
+    Input:
+        prepared (dict): Data as returned by prepare_data().
+        group_value (str or list of str): Name of a specific group in group_col ("" if not grouping),
+                                          or names of the groups that make up a rollup group.
+        start_datetime (str): Starting datetime (e.g., 2011-02-22).
+        end_datetime (str): Ending datetime (e.g., 2011-02-23).
+
+    Returns:
+        df_out (pd.DataFrame): Slice of the prepared data containing the features and associated datetime.
+    """
+    start_datetime = np.datetime64(pd.Timestamp(start_datetime), "ns")
+    end_datetime = np.datetime64(pd.Timestamp(end_datetime), "ns")
+
+    def get_slice(group_value):
+        first, last = prepared["group_bounds"].get(group_value, (0, 0))
+        dates = prepared["dates"][first:last]
+        start = first + np.searchsorted(dates, start_datetime, side="left")
+        end = first + np.searchsorted(dates, end_datetime, side="right")
+
+        return start, end
+
+    if not isinstance(group_value, list):
+        start, end = get_slice(group_value)
+        return prepared["df"].iloc[start:end]
+
+    slices = [get_slice(child_value) for child_value in group_value]
+    positions = np.concatenate(
+        [np.arange(start, end) for start, end in slices] + [np.array([], dtype=int)]
+    )
+
+    return prepared["df"].iloc[positions]
+
+
+def get_group_fingerprint(prepared, group_value, columns, start_datetime, end_datetime):
+    """ Fingerprint the rows of a group over a datetime range, to recognize groups whose data hasn't changed.
+
+    Prepared data is sorted by group and datetime, so each column of a group's rows is a contiguous slice
+    that is hashed straight from its buffer with zlib's CRC-32 and Adler-32 (fast, non-cryptographic checksums).
+    Object columns (e.g., strings) hold pointers, so their values are first hashed with pd.util.hash_array().
+
+    Input:
+        prepared (dict): Data as returned by prepare_data().
+        group_value (str or list of str): Name of a specific group in group_col ("" if not grouping),
+                                          or names of the groups that make up a rollup group.
+        columns (list of str): Columns of prepared["df"] to fingerprint (e.g., the features and datetime column).
+        start_datetime (str): Starting datetime (e.g., 2011-02-22).
+        end_datetime (str): Ending datetime (e.g., 2011-02-23).
+
+    Returns:
+        fingerprint (str): Number of rows and checksums of the columns (e.g., "1500-3f2a9c01b7d4e210").
+    """
+    df_window = retrieve_prepared_data(prepared, group_value, start_datetime, end_datetime)
+
+    crc = 0
+    adler = 1
+    for col in columns:
+        values = df_window[col].to_numpy()
+        if values.dtype == object:
+            values = pd.util.hash_array(values)
+        buffer = np.ascontiguousarray(values).view(np.uint8)
+        crc = zlib.crc32(buffer, crc)
+        adler = zlib.adler32(buffer, adler)
+
+    return "{0}-{1:08x}{2:08x}".format(len(df_window), crc, adler)
+
+
+def get_categories_fingerprint(categories):
+    """ Fingerprint the categories of compact features, which are found over all groups.
+
+    Input:
+        categories (dict): Output of drift_utils.get_compact_categories().
+
+    Returns:
+        fingerprint (str): Checksum of the features and their categories (e.g., "3f2a9c01").
+    """
+    crc = 0
+    for feature in sorted(categories):
+        crc = zlib.crc32(str(feature).encode("utf-8"), crc)
+        hashes = pd.util.hash_array(np.asarray(categories[feature], dtype=object))
+        crc = zlib.crc32(np.ascontiguousarray(hashes).view(np.uint8), crc)
+
+    return "{0:08x}".format(crc)
+
+
+def get_rollup_groups(df, group_col, rollup_col):
+    """ Find the child groups (values of group_col) that make up each group of a coarser column.
+
+    Input:
+        df (pd.DataFrame): Pandas DataFrame containing the data.
+        group_col (str): Name of column to group results by (e.g., county).
+        rollup_col (str): Name of a column whose groups are unions of group_col groups (e.g., state).
+
+    Returns:
+        rollup_groups (dict): List of child groups, keyed by rollup group.
+    """
+    pairs = df[[rollup_col, group_col]].dropna().drop_duplicates()
+    shared = pairs[group_col].duplicated(keep=False)
+    if shared.any():
+        raise ValueError(
+            "{0} groups can't be rolled up to {1}, they belong to several: {2}".format(
+                group_col, rollup_col, sorted(pairs.loc[shared, group_col].astype(str).unique())
+            )
+        )
+
+    rollup_groups = {}
+    for rollup_value, group_value in zip(pairs[rollup_col], pairs[group_col]):
+        rollup_groups.setdefault(rollup_value, []).append(group_value)
+
+    return rollup_groups
+
+
+def get_window_eligibility(prepared, group_values, windows, rollup_groups=None):
+    """ Decide which groups have data for each baseline/target window, for all groups at once.
+
+    Applies the same rule as validate_datetime_range() (each range must start before the group's latest
+    datetime, end after its earliest datetime, and start before it ends). Because prepared data is sorted by
+    group and datetime, the earliest and latest datetimes of each group are the ends of its rows, and the
+    number of rows in each range comes from one pass over the datetimes per window. Rollup groups combine
+    the date ranges and row counts of their child groups.
+
+    Input:
+        prepared (dict): Data as returned by prepare_data().
+        group_values (list of str): Names of specific groups in group_col ("" if not grouping).
+        windows (list of dict): Baseline/target windows as returned by resolve_windows().
+        rollup_groups (dict): If set, group_values are rollup groups, made of these child groups
+                              (see get_rollup_groups()).
+
+    Returns:
+        eligibility (dict): Arrays with one row per group: the earliest ("range_min") and latest ("range_max")
+                            datetimes (NaT for groups without rows), and, with one column per window, whether
+                            the window is valid ("eligible") and the number of baseline ("baseline_counts") and
+                            target ("target_counts") rows.
+    """
+    if rollup_groups is None:
+        members = [[group_value] for group_value in group_values]
     else:
-        df_out = df.loc[df[group_col] == group_value]
-        df_out[datetime_col] = list(
-            df_out.loc[df[group_col] == group_value][datetime_col].apply(pd.to_datetime)
+        members = [rollup_groups.get(group_value, []) for group_value in group_values]
+    # Position of each group's first child, every group has at least one (possibly missing) child
+    members = [child_values if len(child_values) > 0 else [None] for child_values in members]
+    offsets = np.cumsum([0] + [len(child_values) for child_values in members[:-1]])
+
+    dates = prepared["dates"]
+    bounds = np.array(
+        [
+            prepared["group_bounds"].get(child_value, (0, 0))
+            for child_values in members
+            for child_value in child_values
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    firsts, lasts = bounds[:, 0], bounds[:, 1]
+    child_has_rows = lasts > firsts
+
+    child_min = np.full(len(bounds), np.datetime64("NaT"), dtype="datetime64[ns]")
+    child_max = child_min.copy()
+    child_min[child_has_rows] = dates[firsts[child_has_rows]]
+    child_max[child_has_rows] = dates[lasts[child_has_rows] - 1]
+    if len(bounds) > 0:
+        # fmin/fmax skip the NaT of children without rows
+        range_min = np.fmin.reduceat(child_min, offsets)
+        range_max = np.fmax.reduceat(child_max, offsets)
+        has_rows = np.logical_or.reduceat(child_has_rows, offsets)
+    else:
+        range_min, range_max, has_rows = child_min, child_max, child_has_rows
+
+    def to_datetime64(value):
+        return np.datetime64(pd.Timestamp(value), "ns")
+
+    def count_rows(start, end):
+        in_range = (dates >= start) & (dates <= end)
+        cumulative = np.concatenate([[0], np.cumsum(in_range)])
+        child_counts = cumulative[lasts] - cumulative[firsts]
+        return np.add.reduceat(child_counts, offsets) if len(bounds) > 0 else child_counts
+
+    shape = (len(group_values), len(windows))
+    eligibility = {
+        "range_min": range_min,
+        "range_max": range_max,
+        "eligible": np.zeros(shape, dtype=bool),
+        "baseline_counts": np.zeros(shape, dtype=np.int64),
+        "target_counts": np.zeros(shape, dtype=np.int64),
+    }
+    for w, window in enumerate(windows):
+        eligible = has_rows.copy()
+        for period in ["baseline", "target"]:
+            start = to_datetime64(window[period + "Start"])
+            end = to_datetime64(window[period + "End"])
+            # Comparisons with NaT are False, so groups without rows are never eligible
+            eligible &= (start < range_max) & (end > range_min) & (start < end)
+            eligibility[period + "_counts"][:, w] = count_rows(start, end)
+        eligibility["eligible"][:, w] = eligible
+
+    return eligibility
+
+
+def estimate_group_costs(eligibility, windows, n_features):
+    """ Estimate the drift work of each group from its row counts.
+
+    Each group sorts its rows once per distinct baseline range and once per target window, for each feature,
+    and sorting n values takes about n log n steps.
+
+    Input:
+        eligibility (dict): Output of get_window_eligibility() for the groups and windows.
+        windows (list of dict): Baseline/target windows as returned by resolve_windows().
+        n_features (int): Number of features tested.
+
+    Returns:
+        costs (np.ndarray): Estimated cost of each group, in the same units for all groups.
+    """
+
+    def sort_cost(counts):
+        return counts * np.log2(counts + 2.0)
+
+    eligible = eligibility["eligible"]
+    costs = (sort_cost(eligibility["target_counts"]) * eligible).sum(axis=1)
+
+    baseline_keys = [
+        (window["baselineStart"], window["baselineEnd"]) for window in windows
+    ]
+    for baseline_key in set(baseline_keys):
+        shared = [w for w, key in enumerate(baseline_keys) if key == baseline_key]
+        costs += sort_cost(eligibility["baseline_counts"][:, shared[0]]) * eligible[
+            :, shared
+        ].any(axis=1)
+
+    return costs * n_features
+
+
+def estimate_group_memory(
+    eligibility, windows, n_features, max_baseline_samples=None, max_target_samples=None
+):
+    """ Estimate the peak memory of computing drift for each group from its row counts.
+
+    A group keeps each distinct baseline range it uses while it works through its target windows one at a
+    time. Every row of a window takes a null flag and a value per feature (VALUE_BYTES, for the copies of
+    rollup windows and value statistics), and every sampled row two more values per feature (the tested
+    values and their sorted copy).
+
+    Input:
+        eligibility (dict): Output of get_window_eligibility() for the groups and windows.
+        windows (list of dict): Baseline/target windows as returned by resolve_windows().
+        n_features (int): Number of features tested.
+        max_baseline_samples (int or np.ndarray): Maximum baseline rows sampled, for all groups or for each
+                                                  group. If None, all rows are used.
+        max_target_samples (int or np.ndarray): Maximum target rows sampled, for all groups or for each group.
+
+    Returns:
+        memory (np.ndarray): Estimated peak bytes of each group.
+    """
+
+    def window_bytes(counts, max_samples):
+        used = counts
+        if max_samples is not None:
+            used = np.minimum(counts, np.reshape(max_samples, (-1, 1)))
+        return n_features * (counts * (1 + VALUE_BYTES) + used * 2 * VALUE_BYTES)
+
+    eligible = eligibility["eligible"]
+    memory = (
+        window_bytes(eligibility["target_counts"], max_target_samples) * eligible
+    ).max(axis=1, initial=0)
+
+    baseline_bytes = window_bytes(eligibility["baseline_counts"], max_baseline_samples)
+    baseline_keys = [
+        (window["baselineStart"], window["baselineEnd"]) for window in windows
+    ]
+    for baseline_key in set(baseline_keys):
+        shared = [w for w, key in enumerate(baseline_keys) if key == baseline_key]
+        memory += baseline_bytes[:, shared[0]] * eligible[:, shared].any(axis=1)
+
+    return memory
+
+
+def get_memory_sample_caps(
+    eligibility,
+    windows,
+    n_features,
+    memory_budget,
+    max_baseline_samples=None,
+    max_target_samples=None,
+):
+    """ Find the sample size that keeps each group within a memory budget.
+
+    Groups estimated above the budget (see estimate_group_memory()) are given the largest number of rows
+    sampled from each of their windows that brings them within it, and no fewer than MIN_MEMORY_SAMPLES.
+
+    Input:
+        eligibility (dict): Output of get_window_eligibility() for the groups and windows.
+        windows (list of dict): Baseline/target windows as returned by resolve_windows().
+        n_features (int): Number of features tested.
+        memory_budget (int): Memory budget in bytes.
+        max_baseline_samples (int): Maximum baseline rows sampled for all groups. If None, all rows are used.
+        max_target_samples (int): Maximum target rows sampled for all groups. If None, all rows are used.
+
+    Returns:
+        sample_caps (np.ndarray): Maximum rows sampled from each window of each group, 0 for groups within
+                                  the budget.
+    """
+    memory = estimate_group_memory(
+        eligibility, windows, n_features, max_baseline_samples, max_target_samples
+    )
+    sample_caps = np.zeros(len(memory), dtype=np.int64)
+
+    for g in np.flatnonzero(memory > memory_budget):
+        group_eligibility = {key: value[g : g + 1] for key, value in eligibility.items()}
+
+        def fits(cap):
+            return (
+                estimate_group_memory(
+                    group_eligibility,
+                    windows,
+                    n_features,
+                    cap if max_baseline_samples is None else min(cap, max_baseline_samples),
+                    cap if max_target_samples is None else min(cap, max_target_samples),
+                )[0]
+                <= memory_budget
+            )
+
+        # Memory grows with the sample size, so the largest size that fits is found by bisection
+        low = MIN_MEMORY_SAMPLES
+        high = max(
+            low,
+            int(eligibility["baseline_counts"][g].max(initial=0)),
+            int(eligibility["target_counts"][g].max(initial=0)),
         )
-    df_out = df_out.loc[df_out[datetime_col] >= start_datetime]
-    df_out = df_out.loc[df_out[datetime_col] <= end_datetime]
-    df_out = df_out[features]
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits(middle):
+                low = middle
+            else:
+                high = middle - 1
+        sample_caps[g] = low
 
-    return df_out
+    return sample_caps
+
+
+def get_feature_stats(df, features):
+    """ Cheap statistics of each feature used to choose its Kolmogorov-Smirnov strategy.
+
+    Input:
+        df (pd.DataFrame): Pandas DataFrame containing the data.
+        features (list of str): Names of the features (columns) of interest.
+
+    Returns:
+        feature_stats (dict): Number of distinct non-null values ("distinct") and whether the values are
+                              integers ("integer"), keyed by feature.
+    """
+    return {
+        "distinct": {feature: int(df[feature].nunique()) for feature in features},
+        "integer": {
+            feature: pd.api.types.is_integer_dtype(df[feature])
+            or pd.api.types.is_bool_dtype(df[feature])
+            for feature in features
+        },
+    }
+
+
+def choose_group_strategies(
+    eligibility, feature_stats, features, sample_size, categories=None
+):
+    """ Choose the Kolmogorov-Smirnov strategy of each feature for each group (see drift_utils.choose_ks_strategy()).
+
+    The choice is made from the group's largest baseline and target windows and the feature's distinct values
+    over all groups, which bound its distinct values in any group.
+
+    Input:
+        eligibility (dict): Output of get_window_eligibility() for the groups and windows.
+        feature_stats (dict): Output of get_feature_stats().
+        features (list of str): Names of the features tested.
+        sample_size (int): Rows drawn from each window by the sampled strategy (see get_accuracy_sample_size()).
+        categories (dict): Output of get_compact_categories() if features are compacted, whose categorical
+                           features are then tested as integer codes.
+
+    Returns:
+        strategies (list of dict): Strategy of each feature, for each group.
+    """
+    eligible = eligibility["eligible"]
+    n_baseline = (eligibility["baseline_counts"] * eligible).max(axis=1, initial=0)
+    n_target = (eligibility["target_counts"] * eligible).max(axis=1, initial=0)
+    is_integer = {
+        feature: feature_stats["integer"][feature]
+        or (categories is not None and feature in categories)
+        for feature in features
+    }
+
+    return [
+        {
+            feature: choose_ks_strategy(
+                n_base,
+                n_tar,
+                feature_stats["distinct"][feature],
+                is_integer[feature],
+                sample_size,
+            )
+            for feature in features
+        }
+        for n_base, n_tar in zip(n_baseline, n_target)
+    ]
+
+
+def report_ineligible_groups(group_col, group_values, windows, eligibility):
+    """ Print the groups and windows that can't be tested because of their date ranges, in one summary.
+
+    Input:
+        group_col (str): Name of column to group results by.
+        group_values (list of str): Names of specific groups in group_col.
+        windows (list of dict): Baseline/target windows as returned by resolve_windows().
+        eligibility (dict): Output of get_window_eligibility() for group_values and windows.
+    """
+    for w, window in enumerate(windows):
+        ineligible = [
+            group_value
+            for group_value, eligible in zip(group_values, eligibility["eligible"][:, w])
+            if not eligible
+        ]
+        if len(ineligible) > 0:
+            print(
+                (
+                    "Baseline date range {0} to {1} or target date range {2} to {3} invalid for {4} of {5} {6} "
+                    "groups: {7}"
+                ).format(
+                    window["baselineStart"],
+                    window["baselineEnd"],
+                    window["targetStart"],
+                    window["targetEnd"],
+                    len(ineligible),
+                    len(group_values),
+                    group_col,
+                    ineligible,
+                )
+            )
 
 
-def rank_feature_drift(preds, feature_names, p_val=0.05):
+def rank_feature_drift(preds, feature_names, p_val=0.05, as_frame=True):
     """ Rank likely drift contribution by feature.
 
     Inputs:
         preds (dict): dfdf.
         feature_names (list of str): List of feature names.
         p_val (float): p-value threshold being used in prediction.
+        as_frame (bool): Return the ranked DataFrame. If False, return arrays aligned with feature_names instead,
+                         so results can be read by position without building a DataFrame.
 
     Returns:
-        drift_by_feature (pd.DataFrame): Ranked list of likely contributors.
+        drift_by_feature (pd.DataFrame or dict): Ranked list of likely contributors, or a dict with "p_val",
+                                                 "is_significant_drift" and "rank" (ascending p-value order)
+                                                 arrays in the order of feature_names.
     """
 
     vals = preds["data"]["p_val"]
@@ -228,6 +815,12 @@ def rank_feature_drift(preds, feature_names, p_val=0.05):
     # Sort from lowest to highest p-value
     # Lowest p-value indicates greatest confidence in distribution difference
     sort_index = np.argsort(vals)  # argsort is in ascending order by default
+    if not as_frame:
+        return {
+            "p_val": vals,
+            "is_significant_drift": vals < p_val,
+            "rank": sort_index,
+        }
     features_sorted = [feature_names[idx] for idx in sort_index]
     vals_sorted = vals[sort_index]
 
@@ -245,243 +838,1670 @@ def rank_feature_drift(preds, feature_names, p_val=0.05):
     return drift_by_feature
 
 
-def detect_drift_by_ID(
-    group_col,
-    group_values,
+def format_arg_windows(windows):
+    """ Parse the baseline/target windows provided on the command line.
+
+    Input:
+        windows (str): JSON list of windows, or path to a .json file containing one. Each window is
+                       either a list [baselineStart, baselineEnd, targetStart, targetEnd] or a dict with
+                       any of the keys windowID, baselineStart, baselineEnd, targetStart, targetEnd and
+                       targetDays (e.g., '[{"targetDays": 7}, {"targetDays": 30}]').
+
+    Returns:
+        list_of_windows (list of dict): Windows as dictionaries.
+    """
+    if os.path.isfile(windows):
+        with open(windows) as f:
+            windows = f.read()
+
+    list_of_windows = []
+    for window in json.loads(windows):
+        if isinstance(window, (list, tuple)):
+            window = dict(
+                zip(["baselineStart", "baselineEnd", "targetStart", "targetEnd"], window)
+            )
+        list_of_windows.append(window)
+
+    return list_of_windows
+
+
+def resolve_windows(
     df,
     datetime_col,
-    features,
-    baseline_start,
-    baseline_end,
-    target_start,
-    target_end,
-    output_df,
-    p_val,
+    windows,
+    baseline_start="",
+    baseline_end="",
+    target_start="",
+    target_end="",
+    date_range=None,
 ):
-    """ Detect drift for each feature for a given ID.
+    """ Fill in the dates for each baseline/target window.
+
+    Dates missing from a window fall back to the provided baseline/target dates, then to the
+    defaults from get_baseline_target_range(). A window with targetDays uses the most recent
+    targetDays days of data as its target.
 
     Input:
-        group_col (str): Name of column to group results by.
-        group_value (str): Name of a specific group in group_col.
         df (pd.DataFrame): Pandas DataFrame containing the data.
         datetime_col (str): Name of column in df containing datetime information.
-        features (list of str): Names of the features (columns) of interest.
-        baseline_start (str): Baseline start date in YYYY-MM-DD format (e.g., '2015-01-01').
-        baseline_end (str): Baseline end date in YYYY-MM-DD format (e.g., '2018-01-01').
-        target_start (str): Target start date in YYYY-MM-DD format (e.g., '2018-01-01').
-        target_end (str): Target end date in YYYY-MM-DD format (e.g., '2020-01-01').
-        output_df (pd.DataFrame): DataFrame containing drift results.
-        p_val (float): p-value to use for determining drift significance.
+        windows (list of dict): Windows as returned by format_arg_windows().
+        baseline_start (str): Empty string or baseline start date in YYYY-MM-DD format (e.g., '2015-01-01').
+        baseline_end (str): Empty string or baseline end date in YYYY-MM-DD format (e.g., '2018-01-01').
+        target_start (str): Empty string or target start date in YYYY-MM-DD format (e.g., '2018-01-01').
+        target_end (str): Empty string or target end date in YYYY-MM-DD format (e.g., '2020-01-01').
+        date_range (tuple): Earliest and latest datetime of the data, if already known
+                            (see get_baseline_target_range()).
 
     Returns:
-        output_df (pd.DataFrame): The updated output DataFrame.
+        resolved (list of dict): Windows with windowID, baselineStart, baselineEnd, targetStart and targetEnd set.
     """
-    # Import inside function to avoid import error when doing unit tests
-    from alibi_detect.cd import KSDrift
+    if date_range is None:
+        dates = pd.to_datetime(df[datetime_col])
+        date_range = (dates.min(), dates.max())
+    range_max = date_range[1]
+
+    resolved = []
+    for window in windows:
+        window_baseline_start = window.get("baselineStart", baseline_start)
+        window_baseline_end = window.get("baselineEnd", baseline_end)
+        window_target_start = window.get("targetStart", target_start)
+        window_target_end = window.get("targetEnd", target_end)
+
+        if "targetDays" in window:
+            days = int(window["targetDays"])
+            window_target_start = str(range_max - datetime.timedelta(days=days)).rsplit(
+                " "
+            )[0]
+            window_target_end = str(range_max).rsplit(" ")[0]
 
-    for group_value in group_values:
-        # ---------------------------------------------------
-        # Retrieve data
-        # ---------------------------------------------------
-        # Ensure date range is valid for current ID
-        baseline_datetime_status, _, _ = validate_datetime_range(
-            baseline_start, baseline_end, df, datetime_col, group_col, group_value,
+        (
+            window_baseline_start,
+            window_baseline_end,
+            window_target_start,
+            window_target_end,
+        ) = get_baseline_target_range(
+            df,
+            datetime_col,
+            window_baseline_start,
+            window_baseline_end,
+            window_target_start,
+            window_target_end,
+            date_range,
         )
-        target_datetime_status, _, _ = validate_datetime_range(
-            target_start, target_end, df, datetime_col, group_col, group_value,
+
+        window_id = window.get(
+            "windowID",
+            "{0}_{1}_{2}_{3}".format(
+                window_baseline_start,
+                window_baseline_end,
+                window_target_start,
+                window_target_end,
+            ),
         )
 
-        try:
-            assert baseline_datetime_status is True
-            assert target_datetime_status is True
+        resolved.append(
+            {
+                "windowID": str(window_id),
+                "baselineStart": window_baseline_start,
+                "baselineEnd": window_baseline_end,
+                "targetStart": window_target_start,
+                "targetEnd": window_target_end,
+            }
+        )
 
-            # Retrieve data for baseline and target
-            df_baseline = retrieve_data(
-                features,
-                df,
-                datetime_col,
-                group_col,
-                group_value,
-                baseline_start,
-                baseline_end,
-            )
+    return resolved
 
-            df_target = retrieve_data(
-                features,
-                df,
-                datetime_col,
-                group_col,
-                group_value,
-                target_start,
-                target_end,
-            )
-            print("len(df): {0}".format(len(df)))
-            print("len(df_baseline): {0}".format(len(df_baseline)))
-            print("len(df_target): {0}".format(len(df_target)))
-
-            # ---------------------------------------------------
-            # Drift detection
-            # ---------------------------------------------------
-            X_baseline = df_baseline[features].dropna().to_numpy()
-            X_target = df_target[features].dropna().to_numpy()
-
-            if X_target.size == 0:
-                return output_df
-
-            # Initialize drift monitor using Kolmogorov-Smirnov test
-            # https://docs.seldon.io/projects/alibi-detect/en/latest/methods/ksdrift.html
-            cd = KSDrift(p_val=p_val, X_ref=X_baseline, alternative="two-sided")
-
-            # Get ranked list of feature by drift (ranked by p-value)
-            preds_h0 = cd.predict(X_target, return_p_val=True)
-            drift_by_feature = rank_feature_drift(preds_h0, features)
-
-            # ---------------------------------------------------
-            # Update output dataframe
-            # ---------------------------------------------------
-            len_baseline = len(df_baseline)
-            len_target = len(df_target)
-
-            for feature in features:
-                # loop through each feature and generate means for baseline and target
-                # function to generate mean statistics
-
-                # loop through each feature and generate means for baseline and target
-                # only produce statistics for string features, assign nan for numeric features
-                featurevalues_base = df_baseline[feature].dropna().to_numpy()
-                if type(featurevalues_base[0]) == str:
-                    uniqueValue_base, valueCount_base = np.unique(
-                        featurevalues_base, return_counts=True
-                    )
-                    valuePct_base = valueCount_base * 100 / len(featurevalues_base)
-
-                    # Convert from np.ndarray to list
-                    uniqueValue_base = list(uniqueValue_base)
-                    valueCount_base = list(valueCount_base)
-                    valuePct_base = list(valuePct_base)
-                else:
-                    uniqueValue_base = list()
-                    valueCount_base = list()
-                    valuePct_base = list()
-
-                featurevalues_tar = df_target[feature].dropna().to_numpy()
-                if type(featurevalues_tar[0]) == str:
-                    featurevalues_tar = df_target[feature].dropna().to_numpy()
-                    uniqueValue_tar, valueCount_tar = np.unique(
-                        featurevalues_tar, return_counts=True
-                    )
-                    valuePct_tar = valueCount_tar * 100 / len(featurevalues_tar)
-
-                    # Convert from np.ndarray to list
-                    uniqueValue_tar = list(uniqueValue_tar)
-                    valueCount_tar = list(valueCount_tar)
-                    valuePct_tar = list(valuePct_tar)
-                else:
-                    uniqueValue_tar = list()
-                    valueCount_tar = list()
-                    valuePct_tar = list()
-
-                # manually add values that are only in one of the comparison samples and set count/pct to 0
-                for value in uniqueValue_tar:
-                    valueCount_base.append(
-                        0
-                    ) if value not in uniqueValue_base else valueCount_base
-                    valuePct_base.append(
-                        0
-                    ) if value not in uniqueValue_base else valuePct_base
-                    uniqueValue_base.append(
-                        value
-                    ) if value not in uniqueValue_base else uniqueValue_base
-                for value in uniqueValue_base:
-                    valueCount_tar.append(
-                        0
-                    ) if value not in uniqueValue_tar else valueCount_tar
-                    valuePct_tar.append(
-                        0
-                    ) if value not in uniqueValue_tar else valuePct_tar
-                    uniqueValue_tar.append(
-                        value
-                    ) if value not in uniqueValue_tar else uniqueValue_tar
 
-                row = {}
-                row["group_col"] = group_col
-                row["group_value"] = group_value
-                row["feature"] = feature
-                row["pValue"] = float(
-                    drift_by_feature.loc[drift_by_feature["feature"] == feature][
-                        "p_val"
-                    ].values
-                )
-                row["isSignificantDrift"] = bool(
-                    drift_by_feature.loc[drift_by_feature["feature"] == feature][
-                        "is_significant_drift"
-                    ].values
-                )
-                row["baselineSamples"] = len_baseline
-                row["baselineNullValues"] = df_baseline[feature].isna().sum()
-                row["baselineRemoved"] = len_baseline - len(df_baseline.dropna())
-                row["baselineValues"] = str(uniqueValue_base)
-                row["baselineValueCounts"] = str(valueCount_base)
-                row["baselineValuePercentages"] = str(valuePct_base)
-                row["targetSamples"] = len_target
-                row["targetNullValues"] = df_target[feature].isna().sum()
-                row["targetRemoved"] = len_target - len(df_target.dropna())
-                row["targetValues"] = str(uniqueValue_tar)
-                row["targetValueCounts"] = str(valueCount_tar)
-                row["targetValuePercentages"] = str(valuePct_tar)
-
-                output_df = output_df.append(row, ignore_index=True)
-
-            # Print progress for now
-            print("{0}: {1} done".format(group_col, group_value))
-
-        except AssertionError:
-            print(
-                "Baseline date range {0} to {1} or target date range {2} to {3} invalid for {4}: {5}".format(
-                    baseline_start,
-                    baseline_end,
-                    target_start,
-                    target_end,
-                    group_col,
-                    group_value,
-                )
-            )
-            pass
+def get_categorical_value_stats(
+    featurevalues_base, featurevalues_tar, counts_base=None, counts_tar=None
+):
+    """ Get value counts and percentages for a categorical (string) feature in baseline and target.
 
-    return output_df
+    Only produce statistics for string features, empty lists are returned for numeric features.
+    Values only present in one of the two samples are added to the other with a count/percentage of 0.
 
+    Input:
+        featurevalues_base (np.ndarray): Non-null baseline values for the feature.
+        featurevalues_tar (np.ndarray): Non-null target values for the feature.
+        counts_base (np.ndarray): If set, featurevalues_base are the sorted distinct values and these their counts.
+        counts_tar (np.ndarray): If set, featurevalues_tar are the sorted distinct values and these their counts.
 
-# ----------------------
-# Main
-# ----------------------
+    Returns:
+        value_stats (dict): Lists of values, counts and percentages for baseline and target, keyed by results
+                            column name.
+    """
 
+    def value_stats(featurevalues, counts):
+        if len(featurevalues) == 0 or type(featurevalues[0]) != str:
+            return list(), list(), list()
+        if counts is None:
+            uniqueValue, valueCount = np.unique(featurevalues, return_counts=True)
+        else:
+            uniqueValue, valueCount = np.asarray(featurevalues), np.asarray(counts)
+        valuePct = valueCount * 100 / valueCount.sum()
 
-if __name__ == "__main__":
+        # Convert from np.ndarray to list
+        return uniqueValue.tolist(), valueCount.tolist(), valuePct.tolist()
 
-    # Read in arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "-i", "--modelID", type=int, required=True, help="Model ID number",
-    )
-    parser.add_argument(
-        "-x",
-        "--dataPath",
-        type=str,
-        required=True,
-        help="Path to data in .csv format (filepath or URL)",
+    uniqueValue_base, valueCount_base, valuePct_base = value_stats(
+        featurevalues_base, counts_base
     )
-    parser.add_argument(
-        "-f",
-        "--features",
-        type=str,
-        required=True,
-        help="Comma separated list of features to monitor (e.g., featureName1,featureName2)",
+    uniqueValue_tar, valueCount_tar, valuePct_tar = value_stats(
+        featurevalues_tar, counts_tar
     )
-    parser.add_argument(
-        "-t",
-        "--datetimeCol",
-        type=str,
-        required=True,
+
+    # manually add values that are only in one of the comparison samples and set count/pct to 0
+    for value in uniqueValue_tar:
+        if value not in uniqueValue_base:
+            valueCount_base.append(0)
+            valuePct_base.append(0)
+            uniqueValue_base.append(value)
+    for value in uniqueValue_base:
+        if value not in uniqueValue_tar:
+            valueCount_tar.append(0)
+            valuePct_tar.append(0)
+            uniqueValue_tar.append(value)
+
+    value_stats = {
+        "baselineValues": str(uniqueValue_base),
+        "baselineValueCounts": str(valueCount_base),
+        "baselineValuePercentages": str(valuePct_base),
+        "targetValues": str(uniqueValue_tar),
+        "targetValueCounts": str(valueCount_tar),
+        "targetValuePercentages": str(valuePct_tar),
+    }
+
+    return value_stats
+
+
+def append_rows(output_df, rows):
+    """ Append a list of result rows to the output DataFrame.
+
+    Input:
+        output_df (pd.DataFrame): DataFrame containing drift results.
+        rows (list of dict): Rows to add, keyed by column name.
+
+    Returns:
+        output_df (pd.DataFrame): The updated output DataFrame.
+    """
+    if len(rows) == 0:
+        return output_df
+
+    new_df = pd.DataFrame(rows, columns=output_df.columns)
+    if output_df.empty:
+        return new_df
+
+    return pd.concat([output_df, new_df], ignore_index=True)
+
+
+def sample_by_date(df_window, rows, datetime_col, max_samples=None, random_state=0):
+    """ Sample rows of a window down to max_samples, stratified by date.
+
+    Only row positions are sampled, so the feature values are then copied at the sampled size.
+
+    Input:
+        df_window (pd.DataFrame): Rows of a group and date range (see retrieve_prepared_data()).
+        rows (np.ndarray): Positions in df_window of the rows to sample from.
+        datetime_col (str): Name of column in df_window containing datetime information.
+        max_samples (int): Maximum number of rows to keep. If None, all rows are kept.
+        random_state (int): Seed for the random draw.
+
+    Returns:
+        rows (np.ndarray): Positions of the sampled rows, in their original order.
+    """
+    if max_samples is None or len(rows) <= max_samples:
+        return rows
+
+    dates = (
+        df_window[datetime_col]
+        .to_numpy(dtype="datetime64[ns]")[rows]
+        .astype("datetime64[D]")
+    )
+    indices = stratified_sample_indices(dates, max_samples, random_state)
+
+    return rows[indices]
+
+
+def get_test_columns(
+    df_window, rows, features, strategies, categories=None, sample_size=None, random_state=0
+):
+    """ Build the column each feature is tested on, with its Kolmogorov-Smirnov strategy.
+
+    Input:
+        df_window (pd.DataFrame): Rows of a group and date range (see retrieve_prepared_data()).
+        rows (np.ndarray): Positions in df_window of the rows to test.
+        features (list of str): Names of the features to test.
+        strategies (dict): Strategy of each feature, from KS_STRATEGIES (see drift_utils.choose_ks_strategy()).
+        categories (dict): Output of get_compact_categories(). If provided, values are converted with
+                           compact_column() first.
+        sample_size (int): Rows drawn at random from rows for the features with the sampled strategy.
+        random_state (int): Seed for the random draw.
+
+    Returns:
+        test_cols (list): Sorted values, or (unique_values, counts) for the weighted strategy, of each feature.
+        n_used (list of int): Number of rows tested for each feature.
+    """
+    sampled_rows = rows
+    if sample_size is not None and "sampled" in strategies.values():
+        sampled_rows = rows[random_sample_indices(len(rows), sample_size, random_state)]
+
+    test_cols = []
+    n_used = []
+    for feature in features:
+        feature_rows = sampled_rows if strategies[feature] == "sampled" else rows
+        values = df_window[feature].to_numpy()[feature_rows]
+        if categories is not None:
+            values = compact_column(values, categories.get(feature))
+        test_cols.append(
+            value_counts_column(values)
+            if strategies[feature] == "weighted"
+            else np.sort(values)
+        )
+        n_used.append(len(feature_rows))
+
+    return test_cols, n_used
+
+
+def check_feature_data(df_window, features, null_counts=None):
+    """ Find features that can't be tested in a window of data.
+
+    Input:
+        df_window (pd.DataFrame): Feature data for one group and date range.
+        features (list of str): Names of the features (columns) of interest.
+        null_counts (np.ndarray): Number of nulls for each feature, computed from df_window if not provided.
+
+    Returns:
+        skipped_features (dict): Reason code ("all_null" or "bad_dtype") for each feature that can't be tested.
+    """
+    sortable_dtypes = [
+        "string",
+        "floating",
+        "integer",
+        "mixed-integer-float",
+        "boolean",
+        "decimal",
+        "datetime64",
+        "datetime",
+        "date",
+    ]
+
+    if null_counts is None:
+        null_counts = get_null_matrix(df_window, features).sum(axis=0)
+
+    skipped_features = {}
+    for feature, null_count in zip(features, null_counts):
+        if null_count == len(df_window):
+            skipped_features[feature] = "all_null"
+        elif (
+            pd.api.types.infer_dtype(df_window[feature], skipna=True)
+            not in sortable_dtypes
+        ):
+            skipped_features[feature] = "bad_dtype"
+
+    return skipped_features
+
+
+def construct_skipped_row(
+    group_col, group_value, window_id, feature, reason, len_baseline=0, len_target=0
+):
+    """ Create a results row for a feature that was skipped.
+
+    Input:
+        group_col (str): Name of column to group results by.
+        group_value (str): Name of a specific group in group_col.
+        window_id (str): Identifier of the baseline/target window.
+        feature (str): Name of feature.
+        reason (str): Reason code (e.g., "empty_target").
+        len_baseline (int): Number of baseline rows.
+        len_target (int): Number of target rows.
+
+    Returns:
+        row (dict): A dictionary representation of the row.
+    """
+    row = {}
+    row["group_col"] = group_col
+    row["group_value"] = group_value
+    row["windowID"] = window_id
+    row["feature"] = feature
+    row["status"] = "skipped"
+    row["skipReason"] = reason
+    row["pValue"] = np.nan
+    row["isSignificantDrift"] = False
+    row["baselineSamples"] = len_baseline
+    row["baselineSamplesUsed"] = 0
+    row["targetSamples"] = len_target
+    row["targetSamplesUsed"] = 0
+
+    return row
+
+
+def detect_drift_for_group(
+    group_col,
+    group_value,
+    df,
+    datetime_col,
+    features,
+    windows,
+    p_val,
+    multivariate_test="",
+    multivariate_max_samples=5000,
+    max_baseline_samples=None,
+    max_target_samples=None,
+    random_state=0,
+    prepared=None,
+    compact=False,
+    eligible=None,
+    weighted_ks=False,
+    metrics=None,
+    child_values=None,
+    feature_subset=None,
+    strategies=None,
+    sample_size=None,
+):
+    """ Detect drift for each feature and window for a single group.
+
+    Windows or features that can't be tested are returned as skipped rows with a reason code.
+    See detect_drift_by_ID() for a description of the inputs. prepared is the output of
+    prepare_data() for df, which is computed here if not provided. eligible holds whether each
+    window is valid for the group (see get_window_eligibility()), also computed here if not provided.
+    child_values are the groups of prepared that make up group_value when it is a rollup group
+    (e.g., the counties of a state), whose rows are put together from the child groups' rows.
+    feature_subset limits the features tested and returned, so a large group can be split across
+    workers; rows with a null in any feature are still removed, so results don't depend on the split.
+    strategies sets the Kolmogorov-Smirnov strategy of each feature (see choose_group_strategies()), which is
+    recorded in the ksStrategy column, and sample_size the rows drawn by the sampled strategy. Without
+    strategies, all features are tested exactly, or weighted with weighted_ks.
+
+    Returns:
+        rows (list of dict): Results rows for the group.
+    """
+    if prepared is None:
+        prepared = prepare_data(df, datetime_col, group_col, features)
+    # Baseline and target are drawn with their own seeds, so windows of the same size don't sample the same positions
+    baseline_seed, target_seed = [
+        int(seed) for seed in np.random.SeedSequence(random_state).generate_state(2)
+    ]
+    categories = None
+    if compact:
+        if "categories" not in prepared:
+            prepared["categories"] = get_compact_categories(prepared["df"], features)
+        categories = prepared["categories"]
+    rollup_groups = None
+    retrieved_value = group_value
+    if child_values is not None:
+        rollup_groups = {group_value: child_values}
+        retrieved_value = list(child_values)
+    if eligible is None:
+        eligible = get_window_eligibility(
+            prepared, [group_value], windows, rollup_groups
+        )["eligible"][0]
+
+    feature_strategies = strategies
+    if strategies is None:
+        feature_strategies = {
+            feature: "weighted" if weighted_ks else "exact" for feature in features
+        }
+
+    output_features = features
+    if feature_subset is not None:
+        output_features = [feature for feature in features if feature in feature_subset]
+
+    rows = []
+
+    # Baseline data and sorted feature columns, keyed by (baselineStart, baselineEnd)
+    baselines = {}
+    baseline_tests = {}
+
+    for w, window in enumerate(windows):
+        # ---------------------------------------------------
+        # Retrieve data
+        # ---------------------------------------------------
+        baseline_key = (window["baselineStart"], window["baselineEnd"])
+
+        # Ensure date range is valid for current ID (reported for all groups by report_ineligible_groups())
+        if not eligible[w]:
+            for feature in output_features:
+                rows.append(
+                    construct_skipped_row(
+                        group_col,
+                        group_value,
+                        window["windowID"],
+                        feature,
+                        "invalid_date_range",
+                    )
+                )
+            continue
+
+        # Retrieve baseline and its null matrix once per baseline range
+        if baseline_key not in baselines:
+            df_baseline = retrieve_prepared_data(
+                prepared,
+                retrieved_value,
+                window["baselineStart"],
+                window["baselineEnd"],
+            )
+            baselines[baseline_key] = (
+                df_baseline,
+                get_null_matrix(df_baseline, features),
+            )
+        df_baseline, null_baseline = baselines[baseline_key]
+
+        df_target = retrieve_prepared_data(
+            prepared, retrieved_value, window["targetStart"], window["targetEnd"],
+        )
+        null_target = get_null_matrix(df_target, features)
+        print("len(df): {0}".format(len(df)))
+        print("len(df_baseline): {0}".format(len(df_baseline)))
+        print("len(df_target): {0}".format(len(df_target)))
+
+        len_baseline = len(df_baseline)
+        len_target = len(df_target)
+        null_counts_baseline = null_baseline.sum(axis=0)
+        null_counts_target = null_target.sum(axis=0)
+
+        # Leave out features that are all null or can't be compared in this window
+        skipped_features = {}
+        if len_baseline > 0 and len_target > 0:
+            skipped_features = check_feature_data(
+                df_baseline, features, null_counts_baseline
+            )
+            for feature, reason in check_feature_data(
+                df_target, features, null_counts_target
+            ).items():
+                skipped_features.setdefault(feature, reason)
+        tested_features = [
+            feature for feature in features if feature not in skipped_features
+        ]
+        tested_idx = [features.index(feature) for feature in tested_features]
+
+        # Rows without a null in any tested feature
+        complete_baseline = ~null_baseline[:, tested_idx].any(axis=1)
+        complete_target = ~null_target[:, tested_idx].any(axis=1)
+        removed_baseline = len_baseline - int(complete_baseline.sum())
+        removed_target = len_target - int(complete_target.sum())
+
+        # Only this share of the features is tested, from the same complete rows
+        if feature_subset is not None:
+            tested_features = [
+                feature for feature in tested_features if feature in feature_subset
+            ]
+            tested_idx = [features.index(feature) for feature in tested_features]
+
+        # ---------------------------------------------------
+        # Drift detection
+        # ---------------------------------------------------
+        # Sort (or count) baseline values once per baseline range and set of tested features
+        baseline_test_key = (baseline_key, tuple(tested_features))
+        if baseline_test_key not in baseline_tests:
+            # Rows are sampled before the values are copied
+            sample_baseline = sample_by_date(
+                df_baseline,
+                np.flatnonzero(complete_baseline),
+                datetime_col,
+                max_baseline_samples,
+                baseline_seed,
+            )
+            baseline_tests[baseline_test_key] = (sample_baseline,) + get_test_columns(
+                df_baseline,
+                sample_baseline,
+                tested_features,
+                feature_strategies,
+                categories,
+                sample_size,
+                baseline_seed,
+            )
+        sample_baseline, baseline_test_cols, baseline_used = baseline_tests[
+            baseline_test_key
+        ]
+
+        sample_target = sample_by_date(
+            df_target,
+            np.flatnonzero(complete_target),
+            datetime_col,
+            max_target_samples,
+            target_seed,
+        )
+        target_test_cols, target_used = get_test_columns(
+            df_target,
+            sample_target,
+            tested_features,
+            feature_strategies,
+            categories,
+            sample_size,
+            target_seed,
+        )
+
+        if len(sample_baseline) == 0 or len(sample_target) == 0:
+            reason = "empty_baseline" if len(sample_baseline) == 0 else "empty_target"
+            skipped_features.update({feature: reason for feature in tested_features})
+            tested_features = []
+
+        for feature in output_features:
+            if feature in skipped_features:
+                rows.append(
+                    construct_skipped_row(
+                        group_col,
+                        group_value,
+                        window["windowID"],
+                        feature,
+                        skipped_features[feature],
+                        len_baseline,
+                        len_target,
+                    )
+                )
+
+        if len(tested_features) == 0:
+            continue
+
+        # Kolmogorov-Smirnov test for each feature against the sorted baseline
+        # https://docs.seldon.io/projects/alibi-detect/en/latest/methods/ksdrift.html
+        preds_h0 = ks_drift_predict_columns(baseline_test_cols, target_test_cols)
+
+        # Get ranked list of feature by drift (ranked by p-value)
+        drift_by_feature = rank_feature_drift(
+            preds_h0, tested_features, p_val, as_frame=False
+        )
+
+        # ---------------------------------------------------
+        # Update output dataframe
+        # ---------------------------------------------------
+        for k, (feature, j) in enumerate(zip(tested_features, tested_idx)):
+            row = {}
+            row["group_col"] = group_col
+            row["group_value"] = group_value
+            row["windowID"] = window["windowID"]
+            row["feature"] = feature
+            row["status"] = "ok"
+            row["skipReason"] = ""
+            row["pValue"] = float(drift_by_feature["p_val"][k])
+            row["isSignificantDrift"] = bool(
+                drift_by_feature["is_significant_drift"][k]
+            )
+            if strategies is not None:
+                row["ksStrategy"] = feature_strategies[feature]
+            # Additional metrics from the same sorted (or counted) columns as the KS test
+            if metrics:
+                results = drift_metrics(
+                    baseline_test_cols[k],
+                    target_test_cols[k],
+                    metrics,
+                    categorical=not pd.api.types.is_numeric_dtype(df_baseline[feature]),
+                )
+                for metric, value in results.items():
+                    row[METRIC_COLUMNS[metric]] = value
+            row["baselineSamples"] = len_baseline
+            row["baselineNullValues"] = null_counts_baseline[j]
+            row["baselineRemoved"] = removed_baseline
+            row["baselineSamplesUsed"] = baseline_used[k]
+            row["targetSamples"] = len_target
+            row["targetNullValues"] = null_counts_target[j]
+            row["targetRemoved"] = removed_target
+            row["targetSamplesUsed"] = target_used[k]
+            row.update(
+                get_categorical_value_stats(
+                    df_baseline[feature].to_numpy()[~null_baseline[:, j]],
+                    df_target[feature].to_numpy()[~null_target[:, j]],
+                )
+            )
+
+            rows.append(row)
+
+        # Multivariate drift over all tested features jointly
+        if multivariate_test == "mmd" and feature_subset is None:
+            result = mmd_drift_test(
+                df_baseline.iloc[
+                    sample_baseline, df_baseline.columns.get_indexer(tested_features)
+                ],
+                df_target.iloc[
+                    sample_target, df_target.columns.get_indexer(tested_features)
+                ],
+                max_samples=multivariate_max_samples,
+                random_state=random_state,
+            )
+
+            row = {}
+            row["group_col"] = group_col
+            row["group_value"] = group_value
+            row["windowID"] = window["windowID"]
+            row["feature"] = MULTIVARIATE_MMD_FEATURE
+            row["status"] = "ok"
+            row["skipReason"] = ""
+            row["pValue"] = result["p_val"]
+            row["isSignificantDrift"] = result["p_val"] < p_val
+            row["baselineSamples"] = len_baseline
+            row["baselineNullValues"] = removed_baseline
+            row["baselineRemoved"] = removed_baseline
+            row["baselineSamplesUsed"] = result["n_baseline"]
+            row["targetSamples"] = len_target
+            row["targetNullValues"] = removed_target
+            row["targetRemoved"] = removed_target
+            row["targetSamplesUsed"] = result["n_target"]
+            row.update(get_categorical_value_stats([], []))
+
+            rows.append(row)
+
+        # Print progress for now
+        print("{0}: {1} ({2}) done".format(group_col, group_value, window["windowID"]))
+
+    return rows
+
+
+def detect_drift_by_ID(
+    group_col,
+    group_values,
+    df,
+    datetime_col,
+    features,
+    baseline_start,
+    baseline_end,
+    target_start,
+    target_end,
+    output_df,
+    p_val,
+    windows=None,
+    multivariate_test="",
+    multivariate_max_samples=5000,
+    max_baseline_samples=None,
+    max_target_samples=None,
+    random_state=0,
+    completed_groups=None,
+    checkpoint_path=None,
+    checkpoint_every=50,
+    compact=False,
+    weighted_ks=False,
+    metrics=None,
+    rollups=None,
+    n_workers=1,
+    memory_budget=None,
+    auto_strategy=False,
+    max_statistic_error=0.02,
+    result_cache=None,
+    over_budget_groups=None,
+):
+    """ Detect drift for each feature for a given ID.
+
+    Drift is computed for every baseline/target window pair. Within a group, the baseline data is
+    retrieved and sorted once per distinct baseline range and reused for all target windows that share it.
+
+    Each group is processed independently: windows and features that can't be tested (invalid date range,
+    empty window, all-null feature or unsupported values) and groups that raise an error are recorded as
+    skipped rows with a reason code, and the remaining groups are still processed.
+
+    Input:
+        group_col (str): Name of column to group results by.
+        group_value (str): Name of a specific group in group_col.
+        df (pd.DataFrame): Pandas DataFrame containing the data.
+        datetime_col (str): Name of column in df containing datetime information.
+        features (list of str): Names of the features (columns) of interest.
+        baseline_start (str): Baseline start date in YYYY-MM-DD format (e.g., '2015-01-01').
+        baseline_end (str): Baseline end date in YYYY-MM-DD format (e.g., '2018-01-01').
+        target_start (str): Target start date in YYYY-MM-DD format (e.g., '2018-01-01').
+        target_end (str): Target end date in YYYY-MM-DD format (e.g., '2020-01-01').
+        output_df (pd.DataFrame): DataFrame containing drift results.
+        p_val (float): p-value to use for determining drift significance.
+        windows (list of dict): Baseline/target windows as returned by resolve_windows().
+                                Defaults to the single window given by the baseline and target dates.
+        multivariate_test (str): Multivariate drift test to add as an extra row per group and window ("" or "mmd").
+        multivariate_max_samples (int): Maximum number of baseline and target rows used by the multivariate test.
+        max_baseline_samples (int): If set, the baseline rows used for drift detection are sampled down to this
+                                    size, stratified by date. Null counts and value statistics still use all rows.
+        max_target_samples (int): If set, the target rows are sampled down to this size, stratified by date.
+        random_state (int): Seed for sampling and the multivariate test.
+        completed_groups (list of str): Groups already in output_df from a previous partial run, which are not
+                                        recomputed.
+        checkpoint_path (str): If set, the results so far are written to this .csv every checkpoint_every groups.
+        checkpoint_every (int): Number of computed groups between checkpoints.
+        compact (bool): Convert features to float32 values or int32 category codes before the Kolmogorov-Smirnov
+                        test, which halves the memory of the sorted samples. Categorical results are unchanged,
+                        numeric values are compared to about 7 significant digits.
+        weighted_ks (bool): Compress each window into distinct values and their counts before the
+                            Kolmogorov-Smirnov test. Results are identical, but features with many repeated
+                            values use far less memory and sorting.
+        metrics (list of str): Additional drift metrics to compute for each feature (from DRIFT_METRICS: "psi",
+                               "wasserstein", "js"). output_df must have their columns (see initialize_df()).
+        rollups (dict): Coarser grouping columns to also compute drift for, each with its groups made of
+                        group_col groups (e.g., {"state": get_rollup_groups(df, "county", "state")}). Their rows
+                        are put together from the child groups' prepared rows, so the data is only sorted once.
+                        completed_groups and checkpoints only apply to group_col.
+        n_workers (int): Number of groups computed at the same time, in threads. Each group's cost is estimated
+                         from its row counts, the largest groups start first and free workers take the next
+                         group, and groups larger than an even share of the work are split by feature.
+                         Results are the same as with one worker.
+        memory_budget (int): If set, memory in bytes for the groups computed at the same time. Each group's
+                             peak memory is estimated from its row counts, workers only start groups that fit
+                             next to the running ones, and groups that don't fit on their own are sampled down
+                             (stratified by date) until they do.
+        auto_strategy (bool): Choose how each feature is tested for each group, from the group's row counts and
+                              the feature's distinct values and dtype: exactly on sorted values, weighted on
+                              distinct values and counts, or on rows sampled at random. The strategy is recorded
+                              in the ksStrategy column, which output_df must have (see initialize_df()).
+                              weighted_ks is ignored.
+        max_statistic_error (float): With auto_strategy, largest difference in a Kolmogorov-Smirnov statistic
+                                     from sampling (with 95% confidence), which sets the number of rows sampled.
+        result_cache (dict): Results rows of a previous run with the same parameters and windows, keyed by
+                             (group_col, group_value, fingerprint) (see get_group_fingerprint() and
+                             load_result_cache()). The fingerprint also covers the group's eligible windows,
+                             its strategies and the compact categories, which depend on data outside its rows.
+                             Groups whose rows over the windows are unchanged are served from it instead of being
+                             recomputed. It is updated in place to hold the rows of the groups of this run (except
+                             groups that failed).
+        over_budget_groups (list): If set, (group_col, group_value) of the groups estimated above memory_budget
+                                   even with MIN_MEMORY_SAMPLES rows per window are appended to it.
+
+    Returns:
+        output_df (pd.DataFrame): The updated output DataFrame.
+    """
+    if checkpoint_every < 1:
+        raise ValueError("checkpoint_every must be at least 1, got {0}".format(checkpoint_every))
+    if windows is None:
+        windows = [
+            {
+                "windowID": "{0}_{1}_{2}_{3}".format(
+                    baseline_start, baseline_end, target_start, target_end
+                ),
+                "baselineStart": baseline_start,
+                "baselineEnd": baseline_end,
+                "targetStart": target_start,
+                "targetEnd": target_end,
+            }
+        ]
+    completed_groups = set(str(group) for group in (completed_groups or []))
+
+    # Parse and sort once, each window is then a slice of the prepared data
+    prepared = get_prepared_data(df, datetime_col, group_col, features)
+    if compact and "categories" not in prepared:
+        prepared["categories"] = get_compact_categories(prepared["df"], features)
+    sample_size = None
+    if auto_strategy:
+        if "feature_stats" not in prepared:
+            prepared["feature_stats"] = get_feature_stats(prepared["df"], features)
+        sample_size = get_accuracy_sample_size(max_statistic_error)
+
+    # Only rows within the windows change the results of a group
+    if result_cache is not None:
+        periods = ["baseline", "target"]
+        span_start = min(
+            pd.Timestamp(window[period + "Start"]) for window in windows for period in periods
+        )
+        span_end = max(
+            pd.Timestamp(window[period + "End"]) for window in windows for period in periods
+        )
+        categories_fingerprint = (
+            get_categories_fingerprint(prepared["categories"]) if compact else ""
+        )
+
+    # Child groups first, then each rollup level from the same prepared rows
+    levels = [(group_col, group_values, None)] + [
+        (rollup_col, list(rollup_groups), rollup_groups)
+        for rollup_col, rollup_groups in (rollups or {}).items()
+    ]
+
+    # Results rows of each group, in output order (None until computed)
+    group_rows = []
+    n_computed = 0
+
+    def finish_group(slot, rows):
+        nonlocal n_computed
+        group_rows[slot] = rows
+        n_computed += 1
+
+        # Periodically save completed groups so an interrupted run can be resumed
+        if (
+            checkpoint_path is not None
+            and n_computed % checkpoint_every == 0
+            and None in group_rows
+        ):
+            write_csv_atomic(
+                checkpoint_path,
+                append_rows(
+                    output_df, [row for done in group_rows if done for row in done]
+                ),
+            )
+            print("Checkpoint written to {0}".format(checkpoint_path))
+
+    def construct_group_skipped_rows(level_col, group_value, reason):
+        return [
+            construct_skipped_row(
+                level_col, group_value, window["windowID"], feature, reason
+            )
+            for window in windows
+            for feature in features
+        ]
+
+    # Decide which windows each group has data for, and how much work it is, before computing any
+    groups = []
+    for level_col, level_values, rollup_groups in levels:
+        eligibility = get_window_eligibility(
+            prepared, level_values, windows, rollup_groups
+        )
+        report_ineligible_groups(level_col, level_values, windows, eligibility)
+        costs = estimate_group_costs(eligibility, windows, len(features))
+
+        # Groups too large for the memory budget are sampled down until they fit
+        sample_caps = np.zeros(len(level_values), dtype=np.int64)
+        if memory_budget is not None:
+            sample_caps = get_memory_sample_caps(
+                eligibility,
+                windows,
+                len(features),
+                memory_budget,
+                max_baseline_samples,
+                max_target_samples,
+            )
+        group_max_baseline_samples = [
+            max_baseline_samples if cap == 0 else min(cap, max_baseline_samples or cap)
+            for cap in sample_caps
+        ]
+        group_max_target_samples = [
+            max_target_samples if cap == 0 else min(cap, max_target_samples or cap)
+            for cap in sample_caps
+        ]
+        memory = estimate_group_memory(
+            eligibility,
+            windows,
+            len(features),
+            np.array(
+                [np.inf if cap is None else cap for cap in group_max_baseline_samples]
+            ),
+            np.array(
+                [np.inf if cap is None else cap for cap in group_max_target_samples]
+            ),
+        )
+        # Sampling can't reduce the null flags and values of the full windows, so some groups never fit
+        over_budget = np.zeros(len(level_values), dtype=bool)
+        if memory_budget is not None:
+            over_budget = memory > memory_budget
+        if ((sample_caps > 0) & ~over_budget).any():
+            print(
+                "{0}: {1} groups sampled to fit the memory budget".format(
+                    level_col, int(((sample_caps > 0) & ~over_budget).sum())
+                )
+            )
+        if over_budget.any():
+            print(
+                (
+                    "Warning: {0}: {1} groups exceed the memory budget even at the minimum sample "
+                    "of {2} rows: {3}"
+                ).format(
+                    level_col,
+                    int(over_budget.sum()),
+                    MIN_MEMORY_SAMPLES,
+                    [str(level_values[g]) for g in np.flatnonzero(over_budget)],
+                )
+            )
+            if over_budget_groups is not None:
+                over_budget_groups.extend(
+                    (level_col, str(level_values[g])) for g in np.flatnonzero(over_budget)
+                )
+        strategies = [None] * len(level_values)
+        if auto_strategy:
+            strategies = choose_group_strategies(
+                eligibility,
+                prepared["feature_stats"],
+                features,
+                sample_size,
+                prepared["categories"] if compact else None,
+            )
+            chosen = pd.Series(
+                [
+                    strategy
+                    for group_strategies, eligible in zip(
+                        strategies, eligibility["eligible"]
+                    )
+                    if eligible.any()
+                    for strategy in group_strategies.values()
+                ],
+                dtype=object,
+            ).value_counts()
+            print(
+                "{0}: (group, feature) strategies {1}".format(
+                    level_col, dict(chosen.items())
+                )
+            )
+
+        for g, group_value in enumerate(level_values):
+            if rollup_groups is None and str(group_value) in completed_groups:
+                print(
+                    "{0}: {1} already completed, skipping".format(level_col, group_value)
+                )
+                continue
+
+            cache_key = None
+            if result_cache is not None:
+                # Also the inputs from outside the group's rows over the windows: windows eligible from its
+                # full date range, strategies chosen from the distinct values of all groups, and categories
+                # of compact features over all groups
+                fingerprint = "-".join(
+                    [
+                        get_group_fingerprint(
+                            prepared,
+                            group_value
+                            if rollup_groups is None
+                            else list(rollup_groups[group_value]),
+                            features + [datetime_col],
+                            span_start,
+                            span_end,
+                        ),
+                        "".join(
+                            "1" if eligible else "0"
+                            for eligible in eligibility["eligible"][g]
+                        ),
+                        ""
+                        if strategies[g] is None
+                        else ",".join(
+                            strategies[g].get(feature, "") for feature in features
+                        ),
+                        categories_fingerprint,
+                    ]
+                )
+                cache_key = (level_col, str(group_value), fingerprint)
+
+            group_rows.append(None)
+            groups.append(
+                {
+                    "slot": len(group_rows) - 1,
+                    "group_col": level_col,
+                    "group_value": group_value,
+                    "eligible": eligibility["eligible"][g],
+                    "child_values": None
+                    if rollup_groups is None
+                    else rollup_groups[group_value],
+                    "cost": costs[g],
+                    "memory": memory[g],
+                    "max_baseline_samples": group_max_baseline_samples[g],
+                    "max_target_samples": group_max_target_samples[g],
+                    "strategies": strategies[g],
+                    "cache_key": cache_key,
+                }
+            )
+
+    # Large groups are split by feature so they don't hold back the run (not with the multivariate test,
+    # which needs all features together)
+    n_parts = split_costly_tasks(
+        [group["cost"] for group in groups],
+        n_workers,
+        len(features) if multivariate_test == "" else 1,
+    )
+    tasks = []
+    n_cached = 0
+    for group, group_parts in zip(groups, n_parts):
+        # Groups whose data is unchanged since the cached run
+        if result_cache is not None and group["cache_key"] in result_cache:
+            finish_group(group["slot"], result_cache[group["cache_key"]])
+            n_cached += 1
+            continue
+
+        # Groups without any valid window need no drift work
+        if not group["eligible"].any():
+            finish_group(
+                group["slot"],
+                construct_group_skipped_rows(
+                    group["group_col"], group["group_value"], "invalid_date_range"
+                ),
+            )
+            continue
+
+        group["parts"] = group["pending"] = group_parts
+        group["rows"] = []
+        group["error"] = None
+        for part in range(group_parts):
+            tasks.append(
+                {
+                    "group": group,
+                    "feature_subset": None
+                    if group_parts == 1
+                    else features[part::group_parts],
+                    "cost": group["cost"] / group_parts,
+                    "memory": group["memory"] / group_parts,
+                }
+            )
+
+    def run_task(task):
+        group = task["group"]
+        return detect_drift_for_group(
+            group["group_col"],
+            group["group_value"],
+            df,
+            datetime_col,
+            features,
+            windows,
+            p_val,
+            multivariate_test=multivariate_test,
+            multivariate_max_samples=multivariate_max_samples,
+            max_baseline_samples=group["max_baseline_samples"],
+            max_target_samples=group["max_target_samples"],
+            random_state=random_state,
+            prepared=prepared,
+            compact=compact,
+            eligible=group["eligible"],
+            weighted_ks=weighted_ks,
+            metrics=metrics,
+            child_values=group["child_values"],
+            feature_subset=task["feature_subset"],
+            strategies=group["strategies"],
+            sample_size=sample_size,
+        )
+
+    for t, task_rows, error in run_tasks(
+        run_task,
+        tasks,
+        [task["cost"] for task in tasks],
+        n_workers,
+        [task["memory"] for task in tasks],
+        memory_budget,
+    ):
+        group = tasks[t]["group"]
+        group["pending"] -= 1
+        if error is not None:
+            group["error"] = group["error"] or error
+        else:
+            group["rows"].extend(task_rows)
+        if group["pending"] > 0:
+            continue
+
+        if group["error"] is not None:
+            # Failures aren't cached, so the group is retried by the next run
+            group["cache_key"] = None
+            e = group["error"]
+            print(
+                "Drift detection failed for {0}: {1} ({2}: {3})".format(
+                    group["group_col"], group["group_value"], type(e).__name__, e
+                )
+            )
+            finish_group(
+                group["slot"],
+                construct_group_skipped_rows(
+                    group["group_col"],
+                    group["group_value"],
+                    "error: {0}".format(type(e).__name__),
+                ),
+            )
+        elif group["parts"] == 1:
+            finish_group(group["slot"], group["rows"])
+        else:
+            # Parts of a split group are put back in window and feature order
+            window_ids = [window["windowID"] for window in windows]
+            finish_group(
+                group["slot"],
+                sorted(
+                    group["rows"],
+                    key=lambda row: (
+                        window_ids.index(row["windowID"]),
+                        features.index(row["feature"]),
+                    ),
+                ),
+            )
+
+    if result_cache is not None:
+        print(
+            "{0} groups unchanged and served from the result cache, {1} computed".format(
+                n_cached, len(groups) - n_cached
+            )
+        )
+        # Keep exactly the groups of this run
+        result_cache.clear()
+        result_cache.update(
+            {
+                group["cache_key"]: group_rows[group["slot"]]
+                for group in groups
+                if group["cache_key"] is not None
+            }
+        )
+
+    rows = [row for done in group_rows for row in done]
+
+    return append_rows(output_df, rows)
+
+
+def detect_drift_from_cube(
+    group_col,
+    group_values,
+    cube,
+    features,
+    windows,
+    output_df,
+    p_val,
+    metrics=None,
+    rollups=None,
+):
+    """ Detect drift for each feature, window and group from a drift cube, without the raw data.
+
+    Each baseline and target window is the sum of the cube's day slices, so its cost depends on the number of
+    days and distinct values, not rows. The Kolmogorov-Smirnov test is the same as with --weightedKS, except for
+    features the cube keeps as histograms, which are tested on their bins and are approximate (see
+    drift_cube.build_drift_cube()). Nulls are removed per feature (rows with a null in another feature are kept),
+    and windows cover whole days.
+
+    Input:
+        group_col (str): Name of column to group results by.
+        group_values (list of str): Names of specific groups in group_col ("" if not grouping).
+        cube (dict): Cube built from the data by drift_cube.build_drift_cube().
+        features (list of str): Names of the features (columns) of interest, all present in the cube.
+        windows (list of dict): Baseline/target windows as returned by resolve_windows().
+        output_df (pd.DataFrame): DataFrame containing drift results.
+        p_val (float): p-value to use for determining drift significance.
+        metrics (list of str): Additional drift metrics to compute for each feature (see detect_drift_by_ID()).
+        rollups (dict): Coarser grouping columns to also compute drift for (see detect_drift_by_ID()), usually
+                        the cube's "rollups". Their counts are merged from the child groups' counts.
+
+    Returns:
+        output_df (pd.DataFrame): The updated output DataFrame.
+    """
+    group_bounds = get_cube_group_bounds(cube)
+
+    # Eligibility only needs each group's first and last day, which the cube has in the same sorted layout
+    days = {
+        "dates": cube["group_days"][:, 1]
+        .astype("datetime64[D]")
+        .astype("datetime64[ns]"),
+        "group_bounds": group_bounds,
+    }
+
+    # Child groups first, then each rollup level from the child groups' counts
+    levels = [(group_col, group_values, None)] + [
+        (rollup_col, list(rollup_groups), rollup_groups)
+        for rollup_col, rollup_groups in (rollups or {}).items()
+    ]
+
+    rows = []
+    for level_col, level_values, rollup_groups in levels:
+        eligibility = get_window_eligibility(days, level_values, windows, rollup_groups)
+        report_ineligible_groups(level_col, level_values, windows, eligibility)
+
+        for g, group_value in enumerate(level_values):
+            for w, window in enumerate(windows):
+                if not eligibility["eligible"][g, w]:
+                    for feature in features:
+                        rows.append(
+                            construct_skipped_row(
+                                level_col,
+                                group_value,
+                                window["windowID"],
+                                feature,
+                                "invalid_date_range",
+                            )
+                        )
+                    continue
+
+                summaries = {
+                    feature: [
+                        query_drift_cube(
+                            cube,
+                            group_bounds,
+                            feature,
+                            group_value
+                            if rollup_groups is None
+                            else rollup_groups[group_value],
+                            window[period + "Start"],
+                            window[period + "End"],
+                        )
+                        for period in ["baseline", "target"]
+                    ]
+                    for feature in features
+                }
+
+                # Same reason codes as detect_drift_for_group()
+                tested_features = []
+                for feature in features:
+                    baseline, target = summaries[feature]
+                    reason = ""
+                    if baseline["rows"] == 0:
+                        reason = "empty_baseline"
+                    elif target["rows"] == 0:
+                        reason = "empty_target"
+                    elif (
+                        baseline["nulls"] == baseline["rows"]
+                        or target["nulls"] == target["rows"]
+                    ):
+                        reason = "all_null"
+                    elif baseline["values"] is None:
+                        reason = "bad_dtype"
+                    if reason != "":
+                        rows.append(
+                            construct_skipped_row(
+                                level_col,
+                                group_value,
+                                window["windowID"],
+                                feature,
+                                reason,
+                                baseline["rows"],
+                                target["rows"],
+                            )
+                        )
+                    else:
+                        tested_features.append(feature)
+
+                if len(tested_features) == 0:
+                    continue
+
+                baseline_test_cols = [
+                    (summaries[feature][0]["values"], summaries[feature][0]["counts"])
+                    for feature in tested_features
+                ]
+                target_test_cols = [
+                    (summaries[feature][1]["values"], summaries[feature][1]["counts"])
+                    for feature in tested_features
+                ]
+                drift_by_feature = rank_feature_drift(
+                    ks_drift_predict_counts(baseline_test_cols, target_test_cols),
+                    tested_features,
+                    p_val,
+                    as_frame=False,
+                )
+
+                for k, feature in enumerate(tested_features):
+                    baseline, target = summaries[feature]
+                    row = {}
+                    row["group_col"] = level_col
+                    row["group_value"] = group_value
+                    row["windowID"] = window["windowID"]
+                    row["feature"] = feature
+                    row["status"] = "ok"
+                    row["skipReason"] = ""
+                    row["pValue"] = float(drift_by_feature["p_val"][k])
+                    row["isSignificantDrift"] = bool(
+                        drift_by_feature["is_significant_drift"][k]
+                    )
+                    if metrics:
+                        results = drift_metrics(
+                            baseline_test_cols[k],
+                            target_test_cols[k],
+                            metrics,
+                            categorical=not pd.api.types.is_numeric_dtype(
+                                baseline["values"].dtype
+                            ),
+                        )
+                        for metric, value in results.items():
+                            row[METRIC_COLUMNS[metric]] = value
+                    row["baselineSamples"] = baseline["rows"]
+                    row["baselineNullValues"] = baseline["nulls"]
+                    row["baselineRemoved"] = baseline["nulls"]
+                    row["baselineSamplesUsed"] = baseline["rows"] - baseline["nulls"]
+                    row["targetSamples"] = target["rows"]
+                    row["targetNullValues"] = target["nulls"]
+                    row["targetRemoved"] = target["nulls"]
+                    row["targetSamplesUsed"] = target["rows"] - target["nulls"]
+                    row.update(
+                        get_categorical_value_stats(
+                            baseline["values"],
+                            target["values"],
+                            baseline["counts"],
+                            target["counts"],
+                        )
+                    )
+
+                    rows.append(row)
+
+                print(
+                    "{0}: {1} ({2}) done".format(
+                        level_col, group_value, window["windowID"]
+                    )
+                )
+
+    return append_rows(output_df, rows)
+
+
+def load_completed_results(results_path, metrics=None, strategy=False):
+    """ Load the results of the groups completed by a previous (partial) run.
+
+    Input:
+        results_path (str): Path to the results .csv of the previous run.
+        metrics (list of str): Additional drift metrics of the run (see initialize_df()).
+        strategy (bool): Whether the run has the ksStrategy column (see initialize_df()).
+
+    Returns:
+        output_df (pd.DataFrame): Results rows of the completed groups.
+        completed_groups (list of str): Completed values of group_col.
+    """
+    string_cols = ["group_col", "group_value", "windowID", "feature", "skipReason"]
+    previous_df = pd.read_csv(results_path, dtype={col: str for col in string_cols})
+    previous_df[string_cols] = previous_df[string_cols].fillna("")
+
+    completed_groups = get_completed_groups(previous_df)
+    output_df = append_rows(
+        initialize_df(metrics, strategy),
+        previous_df.loc[previous_df["group_value"].isin(completed_groups)].to_dict(
+            "records"
+        ),
+    )
+
+    return output_df, completed_groups
+
+
+def load_result_cache(cache_path, metrics=None, strategy=False):
+    """ Load the results rows saved by save_result_cache(), keyed by group and fingerprint.
+
+    Input:
+        cache_path (str): Path to the .csv of cached results.
+        metrics (list of str): Additional drift metrics of the run (see initialize_df()).
+        strategy (bool): Whether the run has the ksStrategy column (see initialize_df()).
+
+    Returns:
+        result_cache (dict): Results rows (list of dict) keyed by (group_col, group_value, fingerprint),
+                             empty if there is no cache yet.
+    """
+    if not os.path.isfile(cache_path):
+        return {}
+
+    string_cols = [
+        "group_col",
+        "group_value",
+        "windowID",
+        "feature",
+        "skipReason",
+        "groupFingerprint",
+    ]
+    # Floats are parsed exactly as written, so cached rows are the same as computed ones
+    cached_df = pd.read_csv(
+        cache_path,
+        dtype={col: str for col in string_cols},
+        float_precision="round_trip",
+    )
+    cached_df[string_cols] = cached_df[string_cols].fillna("")
+    columns = list(initialize_df(metrics, strategy).columns)
+
+    result_cache = {}
+    for row in cached_df.to_dict("records"):
+        key = (row["group_col"], row["group_value"], row["groupFingerprint"])
+        result_cache.setdefault(key, []).append({col: row.get(col) for col in columns})
+
+    return result_cache
+
+
+def save_result_cache(cache_path, result_cache, output_df):
+    """ Save results rows keyed by group and fingerprint, for load_result_cache().
+
+    Input:
+        cache_path (str): Path to the .csv of cached results.
+        result_cache (dict): Results rows (list of dict) keyed by (group_col, group_value, fingerprint).
+        output_df (pd.DataFrame): DataFrame with the results columns (see initialize_df()).
+    """
+    rows = [
+        dict(row, groupFingerprint=fingerprint)
+        for (_, _, fingerprint), group_rows in result_cache.items()
+        for row in group_rows
+    ]
+    cached_df = pd.DataFrame(
+        rows, columns=list(output_df.columns) + ["groupFingerprint"]
+    )
+    write_csv_atomic(cache_path, cached_df)
+
+
+def get_completed_groups(output_df):
+    """ Get the groups of a previous (partial) run that don't need to be recomputed.
+
+    Groups with any row that failed with an error are left out so they are retried.
+
+    Input:
+        output_df (pd.DataFrame): DataFrame containing drift results from a previous run.
+
+    Returns:
+        completed_groups (list of str): Completed values of group_col.
+    """
+    group_values = output_df["group_value"].fillna("").astype(str)
+    failed = output_df["skipReason"].fillna("").astype(str).str.startswith("error")
+    completed_groups = sorted(set(group_values) - set(group_values[failed]))
+
+    return completed_groups
+
+
+def get_time_series_windows(target_start, target_end, window_days=7, step="day"):
+    """ Get the rolling target windows between target_start and target_end.
+
+    Each window covers window_days days (inclusive) and ends one step (day or week) after the previous one.
+    The first window ends window_days - 1 days after target_start, the last one on or before target_end.
+
+    Input:
+        target_start (str or datetime.datetime): Target start date in YYYY-MM-DD format (e.g., '2018-01-01').
+        target_end (str or datetime.datetime): Target end date in YYYY-MM-DD format (e.g., '2020-01-01').
+        window_days (int): Number of days in each rolling target window.
+        step (str): Distance between consecutive windows, either "day" or "week".
+
+    Returns:
+        windows (list of tuple): (window_start, window_end) of each window as pd.Timestamp.
+    """
+    target_start = pd.Timestamp(target_start)
+    target_end = pd.Timestamp(target_end)
+    step_days = {"day": 1, "week": 7}[step]
+
+    windows = []
+    window_end = min(
+        target_start + datetime.timedelta(days=window_days - 1), target_end
+    )
+    while window_end <= target_end:
+        window_start = max(
+            window_end - datetime.timedelta(days=window_days - 1), target_start
+        )
+        windows.append((window_start, window_end))
+        window_end = window_end + datetime.timedelta(days=step_days)
+
+    return windows
+
+
+def initialize_time_series_df():
+    """ Initialize the dataframe that will store time series results.
+
+    Returns:
+        df (dataframe)
+    """
+
+    df = pd.DataFrame(
+        columns=[
+            "group_col",
+            "group_value",
+            "feature",
+            "windowStart",
+            "windowEnd",
+            "ksStatistic",
+            "pValue",
+            "isSignificantDrift",
+            "baselineSamples",
+            "targetSamples",
+        ]
+    )
+    return df
+
+
+def detect_drift_time_series(
+    group_col,
+    group_values,
+    df,
+    datetime_col,
+    features,
+    baseline_start,
+    baseline_end,
+    target_start,
+    target_end,
+    output_df,
+    p_val,
+    window_days=7,
+    step="day",
+):
+    """ Detect drift for each feature for a rolling target window against a fixed baseline.
+
+    The baseline and full target range are retrieved once per group. Each feature is then swept
+    across the rolling windows using ks_rolling_statistics(), so steps don't rescan the window.
+
+    Input:
+        group_col (str): Name of column to group results by.
+        group_values (str): Names of specific groups in group_col.
+        df (pd.DataFrame): Pandas DataFrame containing the data.
+        datetime_col (str): Name of column in df containing datetime information.
+        features (list of str): Names of the features (columns) of interest.
+        baseline_start (str): Baseline start date in YYYY-MM-DD format (e.g., '2015-01-01').
+        baseline_end (str): Baseline end date in YYYY-MM-DD format (e.g., '2018-01-01').
+        target_start (str): Target start date in YYYY-MM-DD format (e.g., '2018-01-01').
+        target_end (str): Target end date in YYYY-MM-DD format (e.g., '2020-01-01').
+        output_df (pd.DataFrame): DataFrame containing time series results (see initialize_time_series_df()).
+        p_val (float): p-value to use for determining drift significance.
+        window_days (int): Number of days in each rolling target window, at least 1.
+        step (str): Distance between consecutive windows, either "day" or "week".
+
+    Returns:
+        output_df (pd.DataFrame): The updated output DataFrame, one row per group, feature and window.
+                                  Groups whose drift can't be computed are printed and left out.
+    """
+    if window_days < 1:
+        raise ValueError("window_days must be at least 1, got {0}".format(window_days))
+
+    windows = get_time_series_windows(target_start, target_end, window_days, step)
+    range_start = pd.Timestamp(target_start)
+    window_bounds = [
+        ((start - range_start).days, (end - range_start).days + 1)
+        for start, end in windows
+    ]
+
+    # Parse and sort once, each window is then a slice of the prepared data
+    prepared = get_prepared_data(df, datetime_col, group_col, features)
+
+    # Decide which groups have data for the baseline and target ranges up front
+    full_range = [
+        {
+            "baselineStart": baseline_start,
+            "baselineEnd": baseline_end,
+            "targetStart": target_start,
+            "targetEnd": target_end,
+        }
+    ]
+    eligibility = get_window_eligibility(prepared, group_values, full_range)
+    report_ineligible_groups(group_col, group_values, full_range, eligibility)
+
+    def compute_group_rows(group_value):
+        X_baseline = retrieve_prepared_data(
+            prepared, group_value, baseline_start, baseline_end
+        )[features].dropna()
+        df_target = retrieve_prepared_data(
+            prepared, group_value, target_start, target_end
+        ).dropna(subset=features)
+        target_days = (df_target[datetime_col] - range_start).dt.days.to_numpy()
+
+        if len(X_baseline) == 0:
+            return []
+
+        statistics = []
+        n_target = []
+        for feature in features:
+            feature_statistics, feature_n_target = ks_rolling_statistics(
+                X_baseline[feature].to_numpy(),
+                df_target[feature].to_numpy(),
+                target_days,
+                window_bounds,
+            )
+            statistics.append(feature_statistics)
+            n_target.append(feature_n_target)
+
+        # p-values for all features and windows of this group in one call
+        statistics = np.array(statistics)
+        n_target = np.array(n_target)
+        p_vals = ks_pvalues(statistics, len(X_baseline), n_target)
+
+        group_rows = []
+        for i, feature in enumerate(features):
+            for j, (window_start, window_end) in enumerate(windows):
+                if n_target[i, j] == 0:
+                    continue
+
+                row = {}
+                row["group_col"] = group_col
+                row["group_value"] = group_value
+                row["feature"] = feature
+                row["windowStart"] = str(window_start).rsplit(" ")[0]
+                row["windowEnd"] = str(window_end).rsplit(" ")[0]
+                row["ksStatistic"] = statistics[i, j]
+                row["pValue"] = p_vals[i, j]
+                row["isSignificantDrift"] = bool(p_vals[i, j] < p_val)
+                row["baselineSamples"] = len(X_baseline)
+                row["targetSamples"] = n_target[i, j]
+                group_rows.append(row)
+
+        return group_rows
+
+    rows = []
+    for g, group_value in enumerate(group_values):
+        if not eligibility["eligible"][g, 0]:
+            continue
+
+        # A group that fails (e.g., values of mixed types) is left out, the other groups are still processed
+        try:
+            rows.extend(compute_group_rows(group_value))
+        except Exception as e:
+            print(
+                "Drift detection failed for {0}: {1} ({2}: {3})".format(
+                    group_col, group_value, type(e).__name__, e
+                )
+            )
+            continue
+
+        # Print progress for now
+        print("{0}: {1} done".format(group_col, group_value))
+
+    return append_rows(output_df, rows)
+
+
+def apply_multiple_testing_correction(output_df, p_val, method):
+    """ Correct drift significance for the number of tests across all groups, windows and features.
+
+    Adds an adjustedPValue column after pValue and recomputes isSignificantDrift from it.
+
+    Input:
+        output_df (pd.DataFrame): DataFrame containing drift results for the whole run.
+        p_val (float): p-value to use for determining drift significance.
+        method (str): "bonferroni" or "bh" (Benjamini-Hochberg).
+
+    Returns:
+        output_df (pd.DataFrame): The updated output DataFrame.
+    """
+    output_df = output_df.copy()
+    adjusted = adjust_pvalues(output_df["pValue"].to_numpy(dtype=float), method)
+
+    if "adjustedPValue" in output_df.columns:
+        output_df["adjustedPValue"] = adjusted
+    else:
+        output_df.insert(
+            list(output_df.columns).index("pValue") + 1, "adjustedPValue", adjusted
+        )
+    output_df["isSignificantDrift"] = adjusted < p_val
+
+    return output_df
+
+
+# ----------------------
+# Main
+# ----------------------
+
+
+def main(argv=None, use_worker=True):
+    """ Calculate distribution drift with the given command line arguments.
+
+    Input:
+        argv (list of str): Command line arguments. Defaults to sys.argv[1:].
+        use_worker (bool): Run on the worker daemon set by DRIFT_WORKER_URL, if any.
+    """
+
+    # Read in arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--modelID", type=int, required=True, help="Model ID number",
+    )
+    parser.add_argument(
+        "-x",
+        "--dataPath",
+        type=str,
+        required=True,
+        help="Path to data in .csv format (filepath or URL)",
+    )
+    parser.add_argument(
+        "-f",
+        "--features",
+        type=str,
+        required=True,
+        help="Comma separated list of features to monitor (e.g., featureName1,featureName2)",
+    )
+    parser.add_argument(
+        "-t",
+        "--datetimeCol",
+        type=str,
+        required=True,
         help="Name of column in data that contains datetime information",
     )
     parser.add_argument(
@@ -490,7 +2510,10 @@ if __name__ == "__main__":
         type=str,
         required=False,
         default="",
-        help="Name of column in data to group by.",
+        help=(
+            "Name of column in data to group by, or comma separated names of several columns to group by their "
+            "combinations (e.g., hospitalID,dxGroup)"
+        ),
     )
     parser.add_argument(
         "-a",
@@ -532,8 +2555,229 @@ if __name__ == "__main__":
         default=0.05,
         help="Alpha value that will be set as threshold for determining statistical significance (e.g., 0.05)",
     )
+    parser.add_argument(
+        "-w",
+        "--windows",
+        type=str,
+        required=False,
+        default="",
+        help=(
+            'JSON list (or path to .json file) of baseline/target windows to evaluate in one pass (e.g., '
+            '\'[{"targetDays": 7}, {"targetDays": 30}]\')'
+        ),
+    )
+
+    parser.add_argument(
+        "-s",
+        "--timeSeriesStep",
+        type=str,
+        required=False,
+        default="",
+        choices=["", "day", "week"],
+        help=(
+            "Compute drift for a rolling target window stepped by day or week over the target period instead of a "
+            "single comparison"
+        ),
+    )
+    parser.add_argument(
+        "-n",
+        "--timeSeriesWindowDays",
+        type=int,
+        required=False,
+        default=7,
+        help="Number of days in each rolling target window when using --timeSeriesStep (e.g., 7)",
+    )
+    parser.add_argument(
+        "-m",
+        "--multivariateTest",
+        type=str,
+        required=False,
+        default="",
+        choices=["", "mmd"],
+        help="Multivariate drift test run on all features jointly, added as an extra row per group (e.g., mmd)",
+    )
+    parser.add_argument(
+        "--multivariateMaxSamples",
+        type=int,
+        required=False,
+        default=5000,
+        help="Maximum number of baseline and target rows randomly subsampled for the multivariate test (e.g., 5000)",
+    )
+    parser.add_argument(
+        "-r",
+        "--correction",
+        type=str,
+        required=False,
+        default="",
+        choices=["", "bonferroni", "bh"],
+        help=(
+            "Multiple testing correction applied across all groups and features before comparing to pValue (bonferroni "
+            "or bh for Benjamini-Hochberg)"
+        ),
+    )
+    parser.add_argument(
+        "--maxBaselineSamples",
+        type=int,
+        required=False,
+        default=None,
+        help=(
+            "Maximum number of baseline rows per group used for drift detection, sampled stratified by date (e.g., "
+            "100000)"
+        ),
+    )
+    parser.add_argument(
+        "--maxTargetSamples",
+        type=int,
+        required=False,
+        default=None,
+        help=(
+            "Maximum number of target rows per group used for drift detection, sampled stratified by date (e.g., "
+            "100000)"
+        ),
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        required=False,
+        default=0,
+        help="Random seed for sampling and the multivariate test",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help=(
+            "Run the Kolmogorov-Smirnov tests on float32 values and int32 category codes to reduce memory. Numeric "
+            "features are compared to about 7 significant digits"
+        ),
+    )
+    parser.add_argument(
+        "--weightedKS",
+        action="store_true",
+        help=(
+            "Run the Kolmogorov-Smirnov tests on distinct values and their counts. Same results, faster for features "
+            "with many repeated values (e.g., counts or scores)"
+        ),
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        required=False,
+        default="",
+        help=(
+            "Comma separated list of additional drift metrics to compute for each feature: psi, wasserstein, js (e.g., "
+            "psi,wasserstein)"
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help=(
+            "Number of groups computed at the same time. The largest groups start first and very large groups are "
+            "split by feature (e.g., 8)"
+        ),
+    )
+    parser.add_argument(
+        "--autoStrategy",
+        action="store_true",
+        help=(
+            "Choose how each feature is tested for each group (exact, weighted or sampled) from row counts, distinct "
+            "values and dtype, and record it in the ksStrategy column"
+        ),
+    )
+    parser.add_argument(
+        "--maxStatisticError",
+        type=float,
+        required=False,
+        default=0.02,
+        help=(
+            "With --autoStrategy, largest difference in a Kolmogorov-Smirnov statistic from sampling, with 95%% "
+            "confidence (e.g., 0.02)"
+        ),
+    )
+    parser.add_argument(
+        "--memoryBudget",
+        type=str,
+        required=False,
+        default="",
+        help=(
+            "Memory for the groups computed at the same time (e.g., 4GB). Workers only start groups that fit, and "
+            "groups too large on their own are sampled down by date"
+        ),
+    )
+    parser.add_argument(
+        "--rollupCols",
+        type=str,
+        required=False,
+        default="",
+        help=(
+            "Comma separated list of coarser columns whose groups are unions of group_col groups (e.g., state with "
+            "--group_col county). Drift is also computed for their groups in the same run"
+        ),
+    )
+    parser.add_argument(
+        "--cubeDir",
+        type=str,
+        required=False,
+        default="",
+        help=(
+            "Local or DBFS directory for a daily aggregate of the data (drift cube). It is built on the first run, "
+            "later runs with the same data answer any window from it without reading the raw data"
+        ),
+    )
+    parser.add_argument(
+        "--resultCacheDir",
+        type=str,
+        required=False,
+        default="",
+        help=(
+            "Local or DBFS directory for the results of each group, keyed by a fingerprint of its data. Groups whose "
+            "data is unchanged since the last run with the same parameters are not recomputed"
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        required=False,
+        default="",
+        help="Path to the results .csv of a partially completed run. Its groups are kept and not recomputed",
+    )
+    parser.add_argument(
+        "--checkpointDir",
+        type=str,
+        required=False,
+        default="",
+        help=(
+            "Local or DBFS directory (e.g., dbfs:/tmp/drift_checkpoints) for periodic checkpoints. A restarted run "
+            "with the same parameters resumes from its checkpoint"
+        ),
+    )
+    parser.add_argument(
+        "--checkpointEvery",
+        type=int,
+        required=False,
+        default=50,
+        help="Number of groups computed between checkpoints (e.g., 50)",
+    )
+
+    args = parser.parse_args(argv)
+
+    # Hand the job to the worker daemon if one is set (see common/worker.py)
+    if use_worker:
+        returncode = submit_to_worker(
+            "calculate_all_drift", sys.argv[1:] if argv is None else argv
+        )
+        if returncode is not None:
+            sys.exit(returncode)
+
+    # Peak memory of this run only, also when the process runs several jobs (see common/worker.py)
+    rss_baseline = start_peak_rss()
+
+    # Deferred so that importing this module and argument errors don't pay for mlflow's startup
+    import mlflow
+    from environs import Env
 
-    args = parser.parse_args()
     env = Env()
     env.read_env()
 
@@ -542,19 +2786,154 @@ if __name__ == "__main__":
     data_path = args.dataPath
     features = format_arg_features(args.features)
     datetime_col = args.datetimeCol
+    # Several grouping columns are written as one normalized name (e.g., hospitalID,dxGroup)
     group_col = args.group_col
+    if group_col != "":
+        group_col = ",".join(format_arg_features(group_col))
     baseline_start = args.baselineStart
     baseline_end = args.baselineEnd
     target_start = args.targetStart
     target_end = args.targetEnd
     p_val = args.pValue
-
-    with mlflow.start_run():
+    windows = format_arg_windows(args.windows) if args.windows != "" else None
+    time_series_step = args.timeSeriesStep
+    time_series_window_days = args.timeSeriesWindowDays
+    if time_series_window_days < 1:
+        parser.error("--timeSeriesWindowDays must be at least 1")
+    multivariate_test = args.multivariateTest
+    multivariate_max_samples = args.multivariateMaxSamples
+    correction = args.correction
+    max_baseline_samples = args.maxBaselineSamples
+    max_target_samples = args.maxTargetSamples
+    seed = args.seed
+    compact = args.compact
+    weighted_ks = args.weightedKS
+    metrics = format_arg_features(args.metrics) if args.metrics != "" else []
+    for metric in metrics:
+        if metric not in DRIFT_METRICS:
+            parser.error(
+                "Unknown metric {0}, expected one of {1}".format(metric, DRIFT_METRICS)
+            )
+    resume_path = args.resume
+    checkpoint_dir = args.checkpointDir
+    checkpoint_every = args.checkpointEvery
+    if checkpoint_every < 1:
+        parser.error("--checkpointEvery must be at least 1")
+    rollup_cols = format_arg_features(args.rollupCols) if args.rollupCols != "" else []
+    if len(rollup_cols) > 0:
+        if group_col == "":
+            parser.error("--rollupCols needs --group_col")
+        # Resuming and checkpoints track groups of group_col only
+        for arg, is_set in {
+            "--timeSeriesStep": time_series_step != "",
+            "--resume": resume_path != "",
+            "--checkpointDir": checkpoint_dir != "",
+        }.items():
+            if is_set:
+                parser.error("{0} can't be used with --rollupCols".format(arg))
+    n_workers = args.workers
+    auto_strategy = args.autoStrategy
+    max_statistic_error = args.maxStatisticError
+    if auto_strategy:
+        if not 0 < max_statistic_error < 1:
+            parser.error("--maxStatisticError must be between 0 and 1")
+        for arg, is_set in {
+            "--timeSeriesStep": time_series_step != "",
+            "--weightedKS": weighted_ks,
+        }.items():
+            if is_set:
+                parser.error("{0} can't be used with --autoStrategy".format(arg))
+    memory_budget = None
+    if args.memoryBudget != "":
+        try:
+            memory_budget = parse_memory_size(args.memoryBudget)
+        except ValueError:
+            parser.error("Invalid --memoryBudget {0}".format(args.memoryBudget))
+        if time_series_step != "":
+            parser.error("--memoryBudget can't be used with --timeSeriesStep")
+    result_cache_dir = args.resultCacheDir
+    if result_cache_dir != "" and time_series_step != "":
+        parser.error("--resultCacheDir can't be used with --timeSeriesStep")
+    cube_dir = args.cubeDir
+    if cube_dir != "":
+        # The cube keeps counts per day, not rows
+        unsupported = {
+            "--timeSeriesStep": time_series_step != "",
+            "--multivariateTest": multivariate_test != "",
+            "--maxBaselineSamples": max_baseline_samples is not None,
+            "--maxTargetSamples": max_target_samples is not None,
+            "--memoryBudget": memory_budget is not None,
+            "--autoStrategy": auto_strategy,
+            "--resultCacheDir": result_cache_dir != "",
+            "--compact": compact,
+            "--resume": resume_path != "",
+            "--checkpointDir": checkpoint_dir != "",
+        }
+        for arg, is_set in unsupported.items():
+            if is_set:
+                parser.error("{0} can't be used with --cubeDir".format(arg))
+
+    # Artifacts and metrics are uploaded in the background and flushed before the run ends
+    with mlflow.start_run(), AsyncMlflowLogger() as mlflow_logger:
         # ------------------------------------
         # 1. Load in data
         # ------------------------------------
 
-        df = pd.read_csv(data_path)
+        # Only the needed columns, from the local columnar cache after the first read
+        columns = features + [datetime_col] + rollup_cols
+        group_labels = None
+        rollups = {}
+        cube = None
+        date_range = None
+        # Version of the data file in cube and checkpoint keys, so a rewritten file isn't mistaken for the old one
+        data_modified = None
+        if os.path.isfile(data_path):
+            stat = os.stat(data_path)
+            data_modified = [stat.st_mtime_ns, stat.st_size]
+        if cube_dir != "":
+            # The cube is rebuilt whenever the data or the columns it aggregates change
+            cube_params = {
+                "dataPath": data_path,
+                "datetimeCol": datetime_col,
+                "group_col": group_col,
+                "features": features,
+                "rollupCols": rollup_cols,
+            }
+            if data_modified is not None:
+                cube_params["dataModified"] = data_modified
+            cube_key = get_run_key(cube_params)
+            cube_path = os.path.join(to_local_path(cube_dir), cube_key)
+            cube = load_drift_cube(cube_path, cube_key)
+            if cube is None:
+                print("Building drift cube in {0}".format(cube_path))
+                df, group_labels = read_grouped_data(data_path, columns, group_col)
+                rollups = {
+                    rollup_col: get_rollup_groups(df, group_col, rollup_col)
+                    for rollup_col in rollup_cols
+                }
+                cube = build_drift_cube(df, datetime_col, group_col, features, rollups)
+                # The cube keeps the labels of group keys
+                if group_labels is not None:
+                    cube["groups"] = group_labels[cube["groups"].astype(int)]
+                    for rollup_groups in cube["rollups"].values():
+                        for rollup_value, group_values in rollup_groups.items():
+                            rollup_groups[rollup_value] = list(
+                                group_labels[np.asarray(group_values, dtype=int)]
+                            )
+                    group_labels = None
+                save_drift_cube(cube, cube_path, cube_key)
+                cube = load_drift_cube(cube_path, cube_key)
+            else:
+                print("Using drift cube in {0}".format(cube_path))
+            date_range = get_cube_date_range(cube)
+            rollups = cube["rollups"]
+            df = None
+        else:
+            df, group_labels = read_grouped_data(data_path, columns, group_col)
+            rollups = {
+                rollup_col: get_rollup_groups(df, group_col, rollup_col)
+                for rollup_col in rollup_cols
+            }
 
         # ------------------------------------
         # 2. Initialize dataframe
@@ -567,39 +2946,285 @@ if __name__ == "__main__":
             target_start,
             target_end,
         ) = get_baseline_target_range(
-            df, datetime_col, baseline_start, baseline_end, target_start, target_end,
+            df,
+            datetime_col,
+            baseline_start,
+            baseline_end,
+            target_start,
+            target_end,
+            date_range,
         )
 
+        # Resolve dates for each baseline/target window
+        if windows is not None:
+            windows = resolve_windows(
+                df,
+                datetime_col,
+                windows,
+                baseline_start,
+                baseline_end,
+                target_start,
+                target_end,
+                date_range,
+            )
+
         # Set arguments
         if group_col == "":
             group_values = [""]
+        elif cube is not None:
+            group_values = list(cube["groups"])
         else:
             group_values = list(df[group_col].unique())
 
-        # Initialize
-        drift_results_df = initialize_df()
+        # Checkpoint keyed by all parameters that change the results
+        checkpoint_path = None
+        if checkpoint_dir != "" and time_series_step == "":
+            run_params = {
+                arg: value
+                for arg, value in vars(args).items()
+                if arg
+                not in [
+                    "resume",
+                    "checkpointDir",
+                    "checkpointEvery",
+                    "resultCacheDir",
+                    "workers",
+                ]
+            }
+            run_params["resolvedDates"] = [
+                baseline_start,
+                baseline_end,
+                target_start,
+                target_end,
+                windows,
+            ]
+            if data_modified is not None:
+                run_params["dataModified"] = data_modified
+            run_key = get_run_key(run_params)
+            os.makedirs(to_local_path(checkpoint_dir), exist_ok=True)
+            checkpoint_path = os.path.join(
+                to_local_path(checkpoint_dir),
+                "model-{0}_distribution_drift_checkpoint_{1}.csv".format(
+                    modelID, run_key
+                ),
+            )
+            if resume_path == "" and os.path.isfile(checkpoint_path):
+                resume_path = checkpoint_path
+
+        # Result cache keyed by the parameters that change the results, so a new data file can use it
+        result_cache_path = None
+        result_cache = None
+        over_budget_groups = []
+        if result_cache_dir != "":
+            cache_params = {
+                arg: value
+                for arg, value in vars(args).items()
+                if arg
+                not in [
+                    "dataPath",
+                    "resume",
+                    "checkpointDir",
+                    "checkpointEvery",
+                    "resultCacheDir",
+                    "workers",
+                ]
+            }
+            cache_params["resolvedDates"] = [
+                baseline_start,
+                baseline_end,
+                target_start,
+                target_end,
+                windows,
+            ]
+            os.makedirs(to_local_path(result_cache_dir), exist_ok=True)
+            result_cache_path = os.path.join(
+                to_local_path(result_cache_dir),
+                "model-{0}_distribution_drift_cache_{1}.csv".format(
+                    modelID, get_run_key(cache_params)
+                ),
+            )
+            result_cache = load_result_cache(result_cache_path, metrics, auto_strategy)
 
         # ------------------------------------
         # 3. Update output dataframe
         # ------------------------------------
-        drift_results_df = detect_drift_by_ID(
-            group_col=group_col,
-            group_values=group_values,
-            df=df,
-            datetime_col=datetime_col,
-            features=features,
-            baseline_start=baseline_start,
-            baseline_end=baseline_end,
-            target_start=target_start,
-            target_end=target_end,
-            output_df=drift_results_df,
-            p_val=p_val,
-        )
+        if time_series_step != "":
+            # Rolling target windows over the target period
+            drift_results_df = detect_drift_time_series(
+                group_col=group_col,
+                group_values=group_values,
+                df=df,
+                datetime_col=datetime_col,
+                features=features,
+                baseline_start=baseline_start,
+                baseline_end=baseline_end,
+                target_start=target_start,
+                target_end=target_end,
+                output_df=initialize_time_series_df(),
+                p_val=p_val,
+                window_days=time_series_window_days,
+                step=time_series_step,
+            )
+            results_file_name = "model-{0}_distribution_drift_time_series.csv".format(
+                modelID
+            )
+        elif cube is not None:
+            # Every window from the daily aggregate
+            if windows is None:
+                windows = resolve_windows(
+                    df,
+                    datetime_col,
+                    [{}],
+                    baseline_start,
+                    baseline_end,
+                    target_start,
+                    target_end,
+                    date_range,
+                )
+            drift_results_df = detect_drift_from_cube(
+                group_col=group_col,
+                group_values=group_values,
+                cube=cube,
+                features=features,
+                windows=windows,
+                output_df=initialize_df(metrics),
+                p_val=p_val,
+                metrics=metrics,
+                rollups=rollups,
+            )
+            results_file_name = "model-{0}_distribution_drift_results.csv".format(
+                modelID
+            )
+        else:
+            # Keep the groups already completed by a previous partial run
+            drift_results_df = initialize_df(metrics, auto_strategy)
+            completed_groups = []
+
+            if resume_path != "":
+                drift_results_df, completed_groups = load_completed_results(
+                    resume_path, metrics, auto_strategy
+                )
+                print(
+                    "Resuming from {0}: {1} groups already completed".format(
+                        resume_path, len(completed_groups)
+                    )
+                )
+                # Results hold group labels, this run uses group keys (checkpoints already hold keys)
+                if group_labels is not None:
+                    group_keys = {
+                        label: str(key) for key, label in enumerate(group_labels)
+                    }
+                    completed_groups = [
+                        group_keys.get(group_value, group_value)
+                        for group_value in completed_groups
+                    ]
+                    drift_results_df["group_value"] = [
+                        group_keys.get(group_value, group_value)
+                        for group_value in drift_results_df["group_value"]
+                    ]
+
+            drift_results_df = detect_drift_by_ID(
+                group_col=group_col,
+                group_values=group_values,
+                df=df,
+                datetime_col=datetime_col,
+                features=features,
+                baseline_start=baseline_start,
+                baseline_end=baseline_end,
+                target_start=target_start,
+                target_end=target_end,
+                output_df=drift_results_df,
+                p_val=p_val,
+                windows=windows,
+                multivariate_test=multivariate_test,
+                multivariate_max_samples=multivariate_max_samples,
+                max_baseline_samples=max_baseline_samples,
+                max_target_samples=max_target_samples,
+                random_state=seed,
+                completed_groups=completed_groups,
+                checkpoint_path=checkpoint_path,
+                checkpoint_every=checkpoint_every,
+                compact=compact,
+                weighted_ks=weighted_ks,
+                metrics=metrics,
+                rollups=rollups,
+                n_workers=n_workers,
+                memory_budget=memory_budget,
+                auto_strategy=auto_strategy,
+                max_statistic_error=max_statistic_error,
+                result_cache=result_cache,
+                over_budget_groups=over_budget_groups,
+            )
+            # Groups that don't fit the memory budget even when sampled down are marked in the results
+            if memory_budget is not None:
+                over_budget_keys = set(over_budget_groups)
+                drift_results_df["exceedsMemoryBudget"] = [
+                    (level_col, str(group_value)) in over_budget_keys
+                    for level_col, group_value in zip(
+                        drift_results_df["group_col"], drift_results_df["group_value"]
+                    )
+                ]
+            results_file_name = "model-{0}_distribution_drift_results.csv".format(
+                modelID
+            )
+
+        # Group keys are only turned into readable labels for the output
+        if group_labels is not None:
+            drift_results_df = label_groups(drift_results_df, group_col, group_labels)
+
+        # Correct for multiple testing over the whole results table
+        if correction != "":
+            drift_results_df = apply_multiple_testing_correction(
+                drift_results_df, p_val, correction
+            )
+
+        # Peak memory of the run, against the budget if one was set
+        peak_rss = get_peak_rss(rss_baseline)
+        memory_metrics = {}
+        if peak_rss is not None:
+            memory_metrics["peakMemoryMB"] = peak_rss / 1024 ** 2
+        if memory_budget is not None:
+            memory_metrics["memoryBudgetMB"] = memory_budget / 1024 ** 2
+            memory_metrics["groupsOverMemoryBudget"] = len(over_budget_groups)
+            drift_results_df["peakMemoryMB"] = memory_metrics.get("peakMemoryMB")
 
         # ------------------------------------
         # 4. Write results
         # ------------------------------------
-        results_file_name = "model-{0}_distribution_drift_results.csv".format(modelID)
         drift_results_df.to_csv(results_file_name, index=False, header=True)
-        mlflow.log_artifact(results_file_name)
+        # Queued as soon as it is written, so the upload overlaps the rest of the run
+        mlflow_logger.log_artifact(results_file_name)
+        if result_cache_path is not None:
+            save_result_cache(
+                result_cache_path, result_cache, initialize_df(metrics, auto_strategy)
+            )
+        if "status" in drift_results_df.columns:
+            tested = drift_results_df["status"] == "ok"
+            mlflow_logger.log_metrics(
+                {
+                    "rowsTested": tested.sum(),
+                    "rowsSkipped": (~tested).sum(),
+                    "rowsSignificantDrift": (
+                        tested & drift_results_df["isSignificantDrift"].astype(bool)
+                    ).sum(),
+                }
+            )
+        if len(memory_metrics) > 0:
+            mlflow_logger.log_metrics(memory_metrics)
+        if peak_rss is not None:
+            print(
+                "Peak memory: {0:.0f} MB{1}".format(
+                    memory_metrics["peakMemoryMB"],
+                    ""
+                    if memory_budget is None
+                    else " (budget {0:.0f} MB)".format(memory_metrics["memoryBudgetMB"]),
+                )
+            )
+
+        # Results are complete, the checkpoint is no longer needed
+        if checkpoint_path is not None and os.path.isfile(checkpoint_path):
+            os.remove(checkpoint_path)
 
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+""" Daily aggregate ("cube") of feature values per group, for drift windows that don't re-read raw data
+
+The cube holds, for every (group, day), the number of rows and, for every feature, the number of nulls and
+the count of each distinct value. Counting distinct values keeps the Kolmogorov-Smirnov test exact while being
+far smaller than the raw data when values repeat. Numeric features with more distinct values than that (e.g.,
+continuous measurements) are counted in fixed-edge histogram bins instead, so the cube stays small and their
+tests are approximate. A window of any length is answered by summing the counts of its day slices.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CUBE_FORMAT_VERSION = 2
+
+# Numeric features with more distinct values are counted in histogram bins, with edges at quantiles of the
+# feature so each bin holds about the same share of rows
+CUBE_MAX_EXACT_VALUES = 1000
+CUBE_HISTOGRAM_BINS = 256
+
+
+def get_histogram_edges(values, n_bins=CUBE_HISTOGRAM_BINS):
+    """ Edges of histogram bins at quantiles of the values.
+
+    Input:
+        values (np.ndarray): Non-null numeric values of the feature.
+        n_bins (int): Number of bins. Bins of repeated values are merged, so there may be fewer.
+
+    Returns:
+        edges (np.ndarray): Sorted distinct edges, from the smallest to the largest value.
+    """
+    return np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)))
+
+
+def get_histogram_codes(values, edges):
+    """ Bin of each value, the last bin including the largest edge.
+
+    Input:
+        values (np.ndarray): Non-null numeric values.
+        edges (np.ndarray): Edges as returned by get_histogram_edges().
+
+    Returns:
+        codes (np.ndarray): Index of the bin of each value.
+    """
+    return np.searchsorted(edges[1:-1], values, side="right")
+
+
+def get_count_dtype(max_value):
+    """ Smallest unsigned integer type that holds values up to max_value.
+
+    Input:
+        max_value (int): Largest value to store.
+
+    Returns:
+        dtype (np.dtype): Unsigned integer type.
+    """
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+
+    return np.dtype(np.uint64)
+
+
+def build_drift_cube(
+    df,
+    datetime_col,
+    group_col,
+    features,
+    rollups=None,
+    max_exact_values=CUBE_MAX_EXACT_VALUES,
+    n_bins=CUBE_HISTOGRAM_BINS,
+):
+    """ Aggregate raw data into per-(group, day) row counts and per-(group, day, value) feature counts.
+
+    Input:
+        df (pd.DataFrame): Pandas DataFrame containing the data.
+        datetime_col (str): Name of column in df containing datetime information.
+        group_col (str): Name of column to group results by ("" for a single group).
+        features (list of str): Names of the features (columns) of interest.
+        rollups (dict): Groups of coarser columns, each with the group_col groups that make it up
+                        (see calculate_all_drift.get_rollup_groups()), kept with the cube.
+        max_exact_values (int): Numeric features with more distinct values are counted in histogram bins.
+        n_bins (int): Number of histogram bins (see get_histogram_edges()).
+
+    Returns:
+        cube (dict): "groups" (sorted group values), "group_days" (group index and day of each (group, day), sorted),
+                     "row_counts" (rows per (group, day)), and for each feature under "features":
+                     "values" (sorted distinct values, or the midpoints of the histogram bins, None if they can't
+                     be ordered), "nulls" (nulls per (group, day)), "entry_offsets" (first entry of each
+                     (group, day), and the number of entries last), "entry_codes" (index into values) and
+                     "entry_counts", and "edges" for histograms, and the "rollups".
+    """
+    # Rows without a datetime or group can't be placed in the cube
+    keep = df[datetime_col].notna()
+    if group_col != "":
+        keep &= df[group_col].notna()
+    df = df[keep]
+
+    days = (
+        pd.to_datetime(df[datetime_col])
+        .to_numpy(dtype="datetime64[ns]")
+        .astype("datetime64[D]")
+        .astype(np.int64)
+    )
+    if group_col == "":
+        group_codes = np.zeros(len(df), dtype=np.int64)
+        groups = np.array([""], dtype=object)
+    else:
+        group_codes, groups = pd.factorize(df[group_col], sort=True)
+        groups = np.asarray(groups, dtype=object)
+
+    # One entry per (group, day), sorted by group then day
+    day_min = days.min() if len(days) > 0 else 0
+    n_days = (days.max() - day_min + 1) if len(days) > 0 else 1
+    group_day_keys, group_day_index, row_counts = np.unique(
+        group_codes * n_days + (days - day_min), return_inverse=True, return_counts=True
+    )
+    group_days = np.column_stack(
+        [group_day_keys // n_days, group_day_keys % n_days + day_min]
+    )
+
+    cube = {
+        "groups": groups,
+        "group_days": group_days,
+        "row_counts": row_counts,
+        "features": {},
+        "rollups": rollups or {},
+    }
+    for feature in features:
+        values = df[feature].to_numpy()
+        is_null = df[feature].isna().to_numpy()
+        nulls = np.bincount(group_day_index[is_null], minlength=len(group_days))
+        try:
+            distinct, codes = np.unique(values[~is_null], return_inverse=True)
+        except TypeError:
+            # Values of mixed types can't be ordered or tested
+            cube["features"][feature] = {"values": None, "nulls": nulls}
+            continue
+        data = {"values": distinct, "nulls": nulls}
+        if len(distinct) > max_exact_values and distinct.dtype != object:
+            data["edges"] = get_histogram_edges(values[~is_null], n_bins)
+            data["values"] = (data["edges"][:-1] + data["edges"][1:]) / 2
+            codes = get_histogram_codes(values[~is_null], data["edges"])
+
+        # One entry per (group, day, value), sorted by group, day and value
+        n_codes = max(len(data["values"]), 1)
+        entry_keys, entry_counts = np.unique(
+            group_day_index[~is_null].astype(np.int64) * n_codes + codes,
+            return_counts=True,
+        )
+        data["entry_offsets"] = np.searchsorted(
+            entry_keys // n_codes, np.arange(len(group_days) + 1), side="left"
+        )
+        data["entry_codes"] = (entry_keys % n_codes).astype(get_count_dtype(n_codes - 1))
+        data["entry_counts"] = entry_counts.astype(
+            get_count_dtype(entry_counts.max() if len(entry_counts) > 0 else 0)
+        )
+        cube["features"][feature] = data
+
+    return cube
+
+
+def save_drift_cube(cube, cube_dir, key=""):
+    """ Save a cube as .npy files and a metadata .json in a directory.
+
+    Input:
+        cube (dict): Cube as returned by build_drift_cube().
+        cube_dir (str): Directory to save the cube to.
+        key (str): Identifier of the data and parameters the cube was built from (see get_run_key()).
+    """
+    os.makedirs(cube_dir, exist_ok=True)
+
+    def save(name, values):
+        file_name = os.path.join(cube_dir, "{0}.npy".format(name))
+        tmp_name = os.path.join(cube_dir, "{0}.tmp.npy".format(name))
+        np.save(tmp_name, values, allow_pickle=False)
+        os.replace(tmp_name, file_name)
+
+    save("groups", np.asarray(cube["groups"], dtype=str))
+    save("group_days", cube["group_days"])
+    save("row_counts", cube["row_counts"])
+
+    # Features are saved by position, so any feature name can be saved
+    # Group values are saved as strings, so are the rollup groups
+    meta = {
+        "version": CUBE_FORMAT_VERSION,
+        "key": key,
+        "features": [],
+        "rollups": {
+            rollup_col: [
+                [str(rollup_value), [str(group_value) for group_value in group_values]]
+                for rollup_value, group_values in rollup_groups.items()
+            ]
+            for rollup_col, rollup_groups in cube.get("rollups", {}).items()
+        },
+    }
+    for i, (feature, data) in enumerate(cube["features"].items()):
+        name = "feature{0}".format(i)
+        save(name + ".nulls", data["nulls"])
+        if data["values"] is None:
+            meta["features"].append({"name": feature, "kind": "unsupported"})
+            continue
+        kind = "string" if data["values"].dtype == object else "numeric"
+        if "edges" in data:
+            kind = "histogram"
+            save(name + ".edges", data["edges"])
+        save(
+            name + ".values",
+            data["values"].astype(str) if kind == "string" else data["values"],
+        )
+        for array in ["entry_offsets", "entry_codes", "entry_counts"]:
+            save("{0}.{1}".format(name, array), data[array])
+        meta["features"].append({"name": feature, "kind": kind})
+
+    # Metadata last, so a cube is only seen as complete once everything is written
+    tmp_meta = os.path.join(cube_dir, "meta.json.tmp")
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, os.path.join(cube_dir, "meta.json"))
+
+
+def load_drift_cube(cube_dir, key=""):
+    """ Load a cube saved by save_drift_cube(), memory-mapping its arrays.
+
+    Input:
+        cube_dir (str): Directory the cube was saved to.
+        key (str): Expected identifier of the data and parameters (see save_drift_cube()).
+
+    Returns:
+        cube (dict): Cube as returned by build_drift_cube(), or None if there is no complete cube for key.
+    """
+    meta_path = os.path.join(cube_dir, "meta.json")
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("version") != CUBE_FORMAT_VERSION or meta.get("key") != key:
+        return None
+
+    def load(name):
+        return np.asarray(
+            np.load(os.path.join(cube_dir, "{0}.npy".format(name)), mmap_mode="r")
+        )
+
+    cube = {
+        "groups": load("groups").astype(object),
+        "group_days": load("group_days"),
+        "row_counts": load("row_counts"),
+        "features": {},
+        "rollups": {
+            rollup_col: dict(pairs) for rollup_col, pairs in meta["rollups"].items()
+        },
+    }
+    for i, feature_meta in enumerate(meta["features"]):
+        name = "feature{0}".format(i)
+        data = {"values": None, "nulls": load(name + ".nulls")}
+        if feature_meta["kind"] != "unsupported":
+            values = load(name + ".values")
+            data["values"] = (
+                values.astype(object) if feature_meta["kind"] == "string" else values
+            )
+            if feature_meta["kind"] == "histogram":
+                data["edges"] = load(name + ".edges")
+            for array in ["entry_offsets", "entry_codes", "entry_counts"]:
+                data[array] = load("{0}.{1}".format(name, array))
+        cube["features"][feature_meta["name"]] = data
+
+    return cube
+
+
+def get_cube_group_bounds(cube):
+    """ First and last + 1 (group, day) entry of each group.
+
+    Input:
+        cube (dict): Cube as returned by build_drift_cube().
+
+    Returns:
+        group_bounds (dict): (first, last) index into cube["group_days"], keyed by group value.
+    """
+    group_index = cube["group_days"][:, 0]
+    firsts = np.searchsorted(group_index, np.arange(len(cube["groups"])), side="left")
+    lasts = np.searchsorted(group_index, np.arange(len(cube["groups"])), side="right")
+
+    return {
+        group_value: (first, last)
+        for group_value, first, last in zip(cube["groups"], firsts, lasts)
+    }
+
+
+def get_cube_date_range(cube):
+    """ Earliest and latest day in the cube.
+
+    Input:
+        cube (dict): Cube as returned by build_drift_cube().
+
+    Returns:
+        range_min (pd.Timestamp): Earliest day.
+        range_max (pd.Timestamp): Latest day.
+    """
+    days = cube["group_days"][:, 1].astype("datetime64[D]")
+
+    return pd.Timestamp(days.min()), pd.Timestamp(days.max())
+
+
+def query_drift_cube(cube, group_bounds, feature, group_value, start, end):
+    """ Summarize one feature of one group over a range of days by summing its day slices.
+
+    Input:
+        cube (dict): Cube as returned by build_drift_cube().
+        group_bounds (dict): Output of get_cube_group_bounds() for the cube.
+        feature (str): Name of the feature.
+        group_value (str or list of str): Name of a specific group ("" if not grouping), or names of the groups
+                                          that make up a rollup group, whose counts are merged.
+        start (str): First day of the range (e.g., 2011-02-22).
+        end (str): Last day of the range, included (e.g., 2011-02-23).
+
+    Returns:
+        summary (dict): Number of rows ("rows") and nulls ("nulls") in the range, and the sorted distinct
+                        non-null values ("values") and their counts ("counts"), which are None if the
+                        feature's values can't be ordered. For histograms, the values are the midpoints of
+                        the bins.
+    """
+    start_day = np.datetime64(pd.Timestamp(start), "D").astype(np.int64)
+    end_day = np.datetime64(pd.Timestamp(end), "D").astype(np.int64)
+    data = cube["features"][feature]
+
+    # (group, day) range of each group
+    ranges = []
+    for child_value in group_value if isinstance(group_value, list) else [group_value]:
+        first, last = group_bounds.get(child_value, (0, 0))
+        days = cube["group_days"][first:last, 1]
+        ranges.append(
+            (
+                first + np.searchsorted(days, start_day, side="left"),
+                first + np.searchsorted(days, end_day, side="right"),
+            )
+        )
+
+    summary = {
+        "rows": int(sum(cube["row_counts"][lo:hi].sum() for lo, hi in ranges)),
+        "nulls": int(sum(data["nulls"][lo:hi].sum() for lo, hi in ranges)),
+        "values": None,
+        "counts": None,
+    }
+    if data["values"] is None:
+        return summary
+
+    entry_ranges = [
+        (data["entry_offsets"][lo], data["entry_offsets"][hi]) for lo, hi in ranges
+    ]
+    codes = np.concatenate(
+        [data["entry_codes"][lo:hi] for lo, hi in entry_ranges]
+        + [np.array([], dtype=np.int64)]
+    ).astype(np.int64)
+    weights = np.concatenate(
+        [data["entry_counts"][lo:hi] for lo, hi in entry_ranges]
+        + [np.array([], dtype=np.int64)]
+    ).astype(np.int64)
+    if len(data["values"]) <= CUBE_MAX_EXACT_VALUES:
+        # Few values or bins: count over all of them
+        counts = np.bincount(codes, weights=weights, minlength=len(data["values"]))
+        present = np.flatnonzero(counts)
+        counts = counts[present]
+    else:
+        # Many distinct strings: only count the values in the range
+        present, inverse = np.unique(codes, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights, minlength=len(present))
+    summary["values"] = data["values"][present]
+    summary["counts"] = counts.astype(np.int64)
+
+    return summary
@@ -0,0 +1,708 @@
+""" Common functions for distribution drift calculations
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def get_compact_categories(df, features):
+    """ Sorted distinct values of each non-numeric feature, used to encode them as integer codes.
+
+    Input:
+        df (pd.DataFrame): Pandas DataFrame containing the feature data.
+        features (list of str): Names of the features (columns) of interest.
+
+    Returns:
+        categories (dict): Sorted np.ndarray of distinct non-null values for each non-numeric feature.
+                           Features whose values can't be ordered (mixed types) are left out.
+    """
+    categories = {}
+    for feature in features:
+        if pd.api.types.is_numeric_dtype(df[feature]):
+            continue
+        try:
+            categories[feature] = np.unique(df[feature].dropna().to_numpy())
+        except TypeError:
+            continue
+
+    return categories
+
+
+def compact_column(values, categories=None):
+    """ Convert the values of a feature to a compact numeric array.
+
+    Numeric values become float32. Values of a categorical feature become int32 codes into its sorted
+    categories, which preserves their order so the Kolmogorov-Smirnov statistic is unchanged. Rounding to
+    float32 keeps about 7 significant digits: distinct values closer than that become ties, which can move
+    the statistic by at most the fraction of samples involved in those ties.
+
+    Input:
+        values (np.ndarray): Values of the feature (nulls already removed).
+        categories (np.ndarray): Sorted distinct values for a categorical feature, None for a numeric one.
+
+    Returns:
+        compact_values (np.ndarray): float32 or int32 array.
+    """
+    if categories is not None:
+        return np.searchsorted(categories, values).astype(np.int32)
+
+    return values.astype(np.float32)
+
+
+def ks_statistic_sorted(baseline_sorted, target_sorted):
+    """ Two-sample Kolmogorov-Smirnov statistic for presorted samples.
+
+    Both empirical CDFs are step functions that can only change at data points, so the largest
+    gap is found by evaluating each CDF (and its left limit) at the target points only.
+    The cost is O(m log n) for a target of size m and baseline of size n, which means a sorted
+    baseline can be reused against many targets without being rescanned.
+
+    Input:
+        baseline_sorted (np.ndarray): Sorted baseline values.
+        target_sorted (np.ndarray): Sorted target values.
+
+    Returns:
+        statistic (float): Maximum absolute distance between the two empirical CDFs.
+    """
+    n_base = len(baseline_sorted)
+    n_tar = len(target_sorted)
+
+    cdf_base_right = np.searchsorted(baseline_sorted, target_sorted, side="right") / n_base
+    cdf_base_left = np.searchsorted(baseline_sorted, target_sorted, side="left") / n_base
+    cdf_tar_right = np.searchsorted(target_sorted, target_sorted, side="right") / n_tar
+    cdf_tar_left = np.searchsorted(target_sorted, target_sorted, side="left") / n_tar
+
+    statistic = max(
+        np.max(np.abs(cdf_base_right - cdf_tar_right)),
+        np.max(np.abs(cdf_base_left - cdf_tar_left)),
+    )
+
+    return float(statistic)
+
+
+def ks_pvalues(statistics, n_baseline, n_target):
+    """ Asymptotic two-sided p-values for two-sample Kolmogorov-Smirnov statistics.
+
+    Matches scipy.stats.ks_2samp(..., mode="asymp"), which is what alibi-detect's KSDrift uses.
+
+    Input:
+        statistics (np.ndarray): Kolmogorov-Smirnov statistics.
+        n_baseline (np.ndarray or int): Number of baseline samples for each statistic.
+        n_target (np.ndarray or int): Number of target samples for each statistic.
+
+    Returns:
+        p_vals (np.ndarray): p-value for each statistic.
+    """
+    from scipy.stats import kstwo
+
+    n_baseline = np.asarray(n_baseline, dtype=float)
+    n_target = np.asarray(n_target, dtype=float)
+    # Empty samples give a nan p-value
+    with np.errstate(divide="ignore", invalid="ignore"):
+        en = np.round(n_baseline * n_target / (n_baseline + n_target))
+        p_vals = kstwo.sf(np.asarray(statistics, dtype=float), en)
+
+    return p_vals
+
+
+def value_counts_column(values, max_bincount_range=1000000):
+    """ Compress the values of a feature into its distinct values and their counts.
+
+    Integer-valued columns with a small range are counted with np.bincount in a single pass without
+    sorting. Other columns use np.unique, which only needs to order the values once.
+
+    Input:
+        values (np.ndarray): Values of the feature (nulls already removed).
+        max_bincount_range (int): Largest value range counted with np.bincount.
+
+    Returns:
+        unique_values (np.ndarray): Sorted distinct values.
+        counts (np.ndarray): Number of occurrences of each distinct value.
+    """
+    if len(values) > 0 and values.dtype.kind in "iuf":
+        low = values.min()
+        high = values.max()
+        is_integral = values.dtype.kind != "f" or (
+            np.isfinite(low)
+            and np.isfinite(high)
+            and np.array_equal(values, np.floor(values))
+        )
+        if is_integral and high - low < max_bincount_range:
+            counts = np.bincount((values - low).astype(np.int64))
+            present = np.flatnonzero(counts)
+            unique_values = (present + low).astype(values.dtype)
+            return unique_values, counts[present]
+
+    return np.unique(values, return_counts=True)
+
+
+def ks_statistic_counts(baseline_counts, target_counts):
+    """ Two-sample Kolmogorov-Smirnov statistic from distinct values and their counts.
+
+    The empirical CDFs are the cumulative counts, evaluated (with their left limits) at the distinct
+    target values, which gives exactly the same statistic as ks_statistic_sorted() on the full samples.
+
+    Input:
+        baseline_counts (tuple): (unique_values, counts) of the baseline, as returned by value_counts_column().
+        target_counts (tuple): (unique_values, counts) of the target.
+
+    Returns:
+        statistic (float): Maximum absolute distance between the two empirical CDFs.
+    """
+    base_values, base_counts = baseline_counts
+    tar_values, tar_counts = target_counts
+    cum_base = np.concatenate([[0], np.cumsum(base_counts)])
+    cum_tar = np.concatenate([[0], np.cumsum(tar_counts)])
+    n_base = cum_base[-1]
+    n_tar = cum_tar[-1]
+
+    cdf_base_right = cum_base[np.searchsorted(base_values, tar_values, side="right")] / n_base
+    cdf_base_left = cum_base[np.searchsorted(base_values, tar_values, side="left")] / n_base
+    cdf_tar_right = cum_tar[1:] / n_tar
+    cdf_tar_left = cum_tar[:-1] / n_tar
+
+    statistic = max(
+        np.max(np.abs(cdf_base_right - cdf_tar_right)),
+        np.max(np.abs(cdf_base_left - cdf_tar_left)),
+    )
+
+    return float(statistic)
+
+
+def ks_drift_predict_counts(baseline_count_cols, target_count_cols):
+    """ Feature-wise Kolmogorov-Smirnov drift test on (distinct values, counts) columns.
+
+    Gives the same results as ks_drift_predict_columns() on the full sorted columns.
+
+    Input:
+        baseline_count_cols (list of tuple): Baseline (unique_values, counts) for each feature.
+        target_count_cols (list of tuple): Target (unique_values, counts) for each feature.
+
+    Returns:
+        preds (dict): Prediction in the same layout as ks_drift_predict_columns().
+    """
+    distances = np.array(
+        [
+            ks_statistic_counts(baseline_counts, target_counts)
+            for baseline_counts, target_counts in zip(
+                baseline_count_cols, target_count_cols
+            )
+        ]
+    )
+    n_baseline = [counts.sum() for _, counts in baseline_count_cols]
+    n_target = [counts.sum() for _, counts in target_count_cols]
+
+    preds = {
+        "data": {
+            "p_val": ks_pvalues(distances, n_baseline, n_target),
+            "distance": distances,
+        }
+    }
+
+    return preds
+
+
+def ks_drift_predict_columns(baseline_cols, target_cols):
+    """ Feature-wise Kolmogorov-Smirnov drift test on columns that are each either sorted values or
+    (unique_values, counts) pairs.
+
+    Features tested with different strategies can be tested together, each with the same result as on its own.
+
+    Input:
+        baseline_cols (list): Baseline sorted values (np.ndarray) or (unique_values, counts) for each feature.
+        target_cols (list): Target columns, of the same kind as the baseline column of each feature.
+
+    Returns:
+        preds (dict): Prediction in the same layout as alibi-detect KSDrift.predict(), with the
+                      per-feature "p_val" and "distance" under "data".
+    """
+    distances = np.array(
+        [
+            ks_statistic_counts(baseline_col, target_col)
+            if isinstance(baseline_col, tuple)
+            else ks_statistic_sorted(baseline_col, target_col)
+            for baseline_col, target_col in zip(baseline_cols, target_cols)
+        ]
+    )
+
+    def n_samples(col):
+        return col[1].sum() if isinstance(col, tuple) else len(col)
+
+    preds = {
+        "data": {
+            "p_val": ks_pvalues(
+                distances,
+                [n_samples(col) for col in baseline_cols],
+                [n_samples(col) for col in target_cols],
+            ),
+            "distance": distances,
+        }
+    }
+
+    return preds
+
+
+# Ways of computing the Kolmogorov-Smirnov test of a feature, by name
+KS_STRATEGIES = ["exact", "weighted", "sampled"]
+
+
+def get_accuracy_sample_size(max_error, confidence=0.95):
+    """ Number of rows to sample so the Kolmogorov-Smirnov statistic is within max_error of its value on all rows.
+
+    By the Dvoretzky-Kiefer-Wolfowitz inequality, the empirical CDF of n rows drawn at random (with replacement)
+    is within eps of the CDF of all rows with probability at least 1 - 2 exp(-2 n eps^2). The statistic is the
+    largest gap between the baseline and target CDFs, so sampling both within max_error / 2 (each with half of
+    the allowed failure probability) keeps it within max_error.
+
+    Input:
+        max_error (float): Largest difference in the Kolmogorov-Smirnov statistic (e.g., 0.02).
+        confidence (float): Probability that the difference is within max_error.
+
+    Returns:
+        sample_size (int): Number of rows to sample from each of the baseline and target.
+    """
+    failure = (1 - confidence) / 2
+
+    return int(np.ceil(np.log(2 / failure) / (2 * (max_error / 2) ** 2)))
+
+
+def random_sample_indices(n_rows, n_samples, random_state=0):
+    """ Draw row positions at random with replacement, in O(n_samples) whatever the number of rows.
+
+    Input:
+        n_rows (int): Number of rows to sample from.
+        n_samples (int): Number of rows to sample. All rows are kept if there are fewer.
+        random_state (int): Seed for the random draw.
+
+    Returns:
+        indices (np.ndarray): Sorted positions of the sampled rows (a position can be drawn more than once).
+    """
+    if n_rows <= n_samples:
+        return np.arange(n_rows)
+
+    rng = np.random.RandomState(random_state)
+
+    return np.sort(rng.randint(0, n_rows, n_samples))
+
+
+def choose_ks_strategy(n_baseline, n_target, n_distinct, is_integer, sample_size):
+    """ Choose the cheapest way of computing the Kolmogorov-Smirnov test of a feature from cheap statistics.
+
+    Costs are counted in element operations: sorting n values takes n log n, counting integers with
+    np.bincount takes n, and the test compares each target value (or distinct value) to the baseline.
+
+    - exact: sort all baseline and target values.
+    - weighted: count the distinct values (exact results, cheap when values repeat).
+    - sampled: sort sample_size rows drawn at random from each window (see get_accuracy_sample_size()).
+      Only offered for windows larger than sample_size of features with more than sample_size distinct
+      values, for which counting doesn't help.
+
+    Input:
+        n_baseline (int): Number of baseline rows.
+        n_target (int): Number of target rows.
+        n_distinct (int): Number of distinct values of the feature (an upper bound is enough).
+        is_integer (bool): Whether the values are integers (or integer codes), which are counted without sorting.
+        sample_size (int): Rows sampled from each window by the sampled strategy, None to never sample.
+
+    Returns:
+        strategy (str): Cheapest strategy, from KS_STRATEGIES. Ties go to the earlier strategy.
+    """
+
+    def sort_cost(n):
+        return n * np.log2(n + 2.0)
+
+    def test_cost(n_base, n_tar):
+        return 4 * n_tar * np.log2(n_base + 2.0)
+
+    n_distinct = min(n_distinct, n_baseline + n_target)
+    costs = {
+        "exact": sort_cost(n_baseline) + sort_cost(n_target) + test_cost(n_baseline, n_target),
+        "weighted": (
+            n_baseline + n_target
+            if is_integer
+            else sort_cost(n_baseline) + sort_cost(n_target) + n_baseline + n_target
+        )
+        + test_cost(n_distinct, n_distinct),
+    }
+    if (
+        sample_size is not None
+        and max(n_baseline, n_target) > sample_size
+        and n_distinct > sample_size
+    ):
+        n_base = min(n_baseline, sample_size)
+        n_tar = min(n_target, sample_size)
+        costs["sampled"] = sort_cost(n_base) + sort_cost(n_tar) + test_cost(n_base, n_tar)
+
+    return min(costs, key=costs.get)
+
+
+# Additional drift metrics that can be requested, by name
+DRIFT_METRICS = ["psi", "wasserstein", "js"]
+
+
+def sorted_value_counts(sorted_values):
+    """ Distinct values and their counts of an already sorted array, in a single pass.
+
+    Input:
+        sorted_values (np.ndarray): Sorted values.
+
+    Returns:
+        unique_values (np.ndarray): Sorted distinct values.
+        counts (np.ndarray): Number of occurrences of each distinct value.
+    """
+    if len(sorted_values) == 0:
+        return sorted_values, np.zeros(0, dtype=np.int64)
+    is_first = np.concatenate([[True], sorted_values[1:] != sorted_values[:-1]])
+    starts = np.flatnonzero(is_first)
+
+    return sorted_values[starts], np.diff(np.append(starts, len(sorted_values)))
+
+
+def drift_metrics(baseline_col, target_col, metrics, categorical=False, n_bins=10):
+    """ Compute the requested drift metrics for one feature in a single pass.
+
+    Works on the columns already built for the Kolmogorov-Smirnov test, either sorted values or
+    (unique_values, counts) pairs, so nothing is re-read or re-sorted. Both samples are put on the
+    grid of their distinct values, from which the cumulative distributions give every metric.
+
+    - psi: Population Stability Index over the categories, or for numeric features over bins at the
+      baseline deciles. Empty bins are floored at a proportion of 0.0001.
+    - wasserstein: Wasserstein-1 (earth mover's) distance, the area between the two empirical CDFs.
+      Same as scipy.stats.wasserstein_distance. Not defined for categorical features (nan).
+    - js: Jensen-Shannon divergence (base 2, between 0 and 1) over the same bins as psi.
+
+    Input:
+        baseline_col (np.ndarray or tuple): Sorted baseline values, or (unique_values, counts).
+        target_col (np.ndarray or tuple): Sorted target values, or (unique_values, counts).
+        metrics (list of str): Metrics to compute, from DRIFT_METRICS.
+        categorical (bool): Whether the feature is categorical (values are categories, or their codes).
+        n_bins (int): Number of quantile bins for psi and js on numeric features.
+
+    Returns:
+        results (dict): Value of each requested metric.
+    """
+    base_values, base_counts = (
+        baseline_col if isinstance(baseline_col, tuple) else sorted_value_counts(baseline_col)
+    )
+    tar_values, tar_counts = (
+        target_col if isinstance(target_col, tuple) else sorted_value_counts(target_col)
+    )
+    n_base = base_counts.sum()
+    n_tar = tar_counts.sum()
+
+    # Cumulative distributions of both samples on the grid of all distinct values
+    grid = np.union1d(base_values, tar_values)
+    cum_base = np.concatenate([[0], np.cumsum(base_counts)])
+    cum_tar = np.concatenate([[0], np.cumsum(tar_counts)])
+    cdf_base = cum_base[np.searchsorted(base_values, grid, side="right")] / n_base
+    cdf_tar = cum_tar[np.searchsorted(tar_values, grid, side="right")] / n_tar
+
+    results = {}
+    if "wasserstein" in metrics:
+        if categorical:
+            results["wasserstein"] = np.nan
+        else:
+            results["wasserstein"] = float(
+                np.sum(np.abs(cdf_base - cdf_tar)[:-1] * np.diff(grid.astype(float)))
+            )
+
+    if "psi" in metrics or "js" in metrics:
+        if categorical:
+            # One bin per category
+            edges = np.arange(len(grid) - 1)
+        else:
+            # Bins at the baseline deciles, merged where values repeat
+            quantile_ranks = np.ceil(np.arange(1, n_bins) * n_base / n_bins)
+            quantile_idx = np.searchsorted(cum_base[1:], quantile_ranks, side="left")
+            edges = np.searchsorted(grid, np.unique(base_values[quantile_idx]), side="left")
+            edges = edges[edges < len(grid) - 1]
+        upper_cdf_base = np.append(cdf_base[edges], 1.0)
+        upper_cdf_tar = np.append(cdf_tar[edges], 1.0)
+        p_base = np.diff(np.concatenate([[0.0], upper_cdf_base]))
+        p_tar = np.diff(np.concatenate([[0.0], upper_cdf_tar]))
+
+        if "psi" in metrics:
+            q_base = np.maximum(p_base, 0.0001)
+            q_tar = np.maximum(p_tar, 0.0001)
+            results["psi"] = float(np.sum((q_tar - q_base) * np.log(q_tar / q_base)))
+
+        if "js" in metrics:
+            mixture = (p_base + p_tar) / 2
+            with np.errstate(divide="ignore", invalid="ignore"):
+                kl_base = np.where(p_base > 0, p_base * np.log2(p_base / mixture), 0.0)
+                kl_tar = np.where(p_tar > 0, p_tar * np.log2(p_tar / mixture), 0.0)
+            results["js"] = float(max(0.5 * kl_base.sum() + 0.5 * kl_tar.sum(), 0.0))
+
+    return results
+
+
+def ks_rolling_statistics(baseline_values, target_values, target_days, window_bounds):
+    """ Kolmogorov-Smirnov statistics of a fixed baseline against a rolling target window.
+
+    Values are mapped once onto the sorted grid of all distinct baseline and target values. A count
+    vector over that grid is then slid across the target days, adding the days entering and removing
+    the days leaving each window, so no step rescans the whole window. Both empirical CDFs can only
+    change at grid points, so the statistic is the largest gap between their cumulative counts.
+
+    Input:
+        baseline_values (np.ndarray): Baseline values (nulls removed).
+        target_values (np.ndarray): Target values (nulls removed).
+        target_days (np.ndarray): Integer day index (0, 1, ...) of each target value.
+        window_bounds (list of tuple): (first_day, last_day + 1) of each window, in increasing order.
+
+    Returns:
+        statistics (np.ndarray): Kolmogorov-Smirnov statistic for each window (nan if the window is empty).
+        n_target (np.ndarray): Number of target values in each window.
+    """
+    grid = np.unique(np.concatenate([baseline_values, target_values]))
+    n_grid = len(grid)
+
+    base_counts = np.bincount(np.searchsorted(grid, baseline_values), minlength=n_grid)
+    cdf_base = np.cumsum(base_counts) / len(baseline_values)
+
+    # Group target values by day, with offsets[day] pointing at the first value of each day
+    order = np.argsort(target_days, kind="stable")
+    codes = np.searchsorted(grid, target_values[order])
+    n_days = max([end for _, end in window_bounds] + [0])
+    offsets = np.searchsorted(target_days[order], np.arange(n_days + 1), side="left")
+
+    statistics = np.full(len(window_bounds), np.nan)
+    n_target = np.zeros(len(window_bounds), dtype=np.int64)
+
+    counts = np.zeros(n_grid, dtype=np.int64)
+    lo, hi = 0, 0
+    for i, (start, end) in enumerate(window_bounds):
+        if start >= hi:
+            # No overlap with the previous window, start over
+            counts = np.bincount(
+                codes[offsets[start] : offsets[end]], minlength=n_grid
+            )
+        else:
+            counts += np.bincount(codes[offsets[hi] : offsets[end]], minlength=n_grid)
+            counts -= np.bincount(
+                codes[offsets[lo] : offsets[start]], minlength=n_grid
+            )
+        lo, hi = start, end
+
+        n_target[i] = offsets[end] - offsets[start]
+        if n_target[i] > 0:
+            cdf_tar = np.cumsum(counts) / n_target[i]
+            statistics[i] = np.max(np.abs(cdf_base - cdf_tar))
+
+    return statistics, n_target
+
+
+def encode_feature_matrix(X_baseline, X_target):
+    """ Encode baseline and target feature data as numeric matrices on a common scale.
+
+    Numeric columns are standardized with the baseline mean and standard deviation. String columns
+    are one-hot encoded over the values present in either sample.
+
+    Input:
+        X_baseline (pd.DataFrame): Baseline feature data (nulls removed).
+        X_target (pd.DataFrame): Target feature data (nulls removed).
+
+    Returns:
+        Z_baseline (np.ndarray): Encoded baseline data with one row per sample.
+        Z_target (np.ndarray): Encoded target data with one row per sample.
+    """
+    cols_baseline = []
+    cols_target = []
+    for col in X_baseline.columns:
+        values_base = X_baseline[col].to_numpy()
+        values_tar = X_target[col].to_numpy()
+
+        if len(values_base) > 0 and type(values_base[0]) == str:
+            categories = np.unique(np.concatenate([values_base, values_tar]))
+            cols_baseline.append(
+                (values_base[:, None] == categories[None, :]).astype(float)
+            )
+            cols_target.append(
+                (values_tar[:, None] == categories[None, :]).astype(float)
+            )
+        else:
+            values_base = values_base.astype(float)
+            values_tar = values_tar.astype(float)
+            mean = values_base.mean()
+            std = values_base.std()
+            std = std if std > 0 else 1.0
+            cols_baseline.append(((values_base - mean) / std)[:, None])
+            cols_target.append(((values_tar - mean) / std)[:, None])
+
+    return np.hstack(cols_baseline), np.hstack(cols_target)
+
+
+def mmd_drift_test(
+    X_baseline,
+    X_target,
+    max_samples=5000,
+    n_random_features=256,
+    n_permutations=100,
+    random_state=0,
+):
+    """ Multivariate drift test using Maximum Mean Discrepancy (MMD) with a Gaussian kernel.
+
+    The kernel is approximated with random Fourier features, so the MMD is the squared distance
+    between the mean feature vectors of the two samples. The p-value comes from a permutation test
+    done as a single matrix product over all permutations. Each sample is randomly subsampled to at
+    most max_samples rows first, which bounds the cost regardless of group size.
+
+    Input:
+        X_baseline (pd.DataFrame): Baseline feature data (nulls removed).
+        X_target (pd.DataFrame): Target feature data (nulls removed).
+        max_samples (int): Maximum number of rows used from each of baseline and target.
+        n_random_features (int): Number of random Fourier features approximating the kernel.
+        n_permutations (int): Number of permutations used for the p-value.
+        random_state (int): Seed for subsampling, random features and permutations.
+
+    Returns:
+        result (dict): MMD estimate ("statistic"), permutation p-value ("p_val") and the number of
+                       baseline and target rows used ("n_baseline", "n_target").
+    """
+    rng = np.random.RandomState(random_state)
+
+    # Subsample to bound cost
+    if len(X_baseline) > max_samples:
+        X_baseline = X_baseline.iloc[
+            np.sort(rng.choice(len(X_baseline), max_samples, replace=False))
+        ]
+    if len(X_target) > max_samples:
+        X_target = X_target.iloc[
+            np.sort(rng.choice(len(X_target), max_samples, replace=False))
+        ]
+    n_base = len(X_baseline)
+    n_tar = len(X_target)
+
+    Z_baseline, Z_target = encode_feature_matrix(X_baseline, X_target)
+    Z = np.vstack([Z_baseline, Z_target])
+    n_total = n_base + n_tar
+
+    # Kernel bandwidth from the median pairwise distance of (a subsample of) the pooled data
+    Z_median = Z[rng.choice(n_total, min(n_total, 500), replace=False)]
+    sq_dists = ((Z_median[:, None, :] - Z_median[None, :, :]) ** 2).sum(axis=2)
+    sq_dists = sq_dists[np.triu_indices(len(Z_median), k=1)]
+    sigma = np.sqrt(np.median(sq_dists)) if np.median(sq_dists) > 0 else 1.0
+
+    # Random Fourier features for exp(-||x - y||^2 / (2 * sigma^2))
+    W = rng.normal(0, 1.0 / sigma, (Z.shape[1], n_random_features))
+    b = rng.uniform(0, 2 * np.pi, n_random_features)
+    phi = np.sqrt(2.0 / n_random_features) * np.cos(Z @ W + b)
+
+    phi_total = phi.sum(axis=0)
+    phi_base = phi[:n_base].sum(axis=0)
+    statistic = float(
+        (((phi_base / n_base) - (phi_total - phi_base) / n_tar) ** 2).sum()
+    )
+
+    # Permutations as rows of a 0/1 matrix selecting the pseudo-baseline samples
+    selected = np.argsort(rng.random_sample((n_permutations, n_total)), axis=1)[
+        :, :n_base
+    ]
+    S = np.zeros((n_permutations, n_total))
+    np.put_along_axis(S, selected, 1.0, axis=1)
+    perm_base = S @ phi
+    perm_statistics = (
+        ((perm_base / n_base) - (phi_total - perm_base) / n_tar) ** 2
+    ).sum(axis=1)
+    p_val = (1.0 + np.sum(perm_statistics >= statistic)) / (1.0 + n_permutations)
+
+    result = {
+        "statistic": statistic,
+        "p_val": float(p_val),
+        "n_baseline": n_base,
+        "n_target": n_tar,
+    }
+
+    return result
+
+
+def adjust_pvalues(p_vals, method="bonferroni"):
+    """ Adjust p-values for multiple testing.
+
+    Null p-values are ignored and do not count towards the number of tests.
+
+    Input:
+        p_vals (np.ndarray): p-values of all tests in the family.
+        method (str): "bonferroni" (family-wise error rate) or "bh" (Benjamini-Hochberg false discovery rate).
+
+    Returns:
+        adjusted (np.ndarray): Adjusted p-values, in the same order as p_vals.
+    """
+    p_vals = np.asarray(p_vals, dtype=float)
+    adjusted = np.full(p_vals.shape, np.nan)
+
+    valid = ~np.isnan(p_vals)
+    p_valid = p_vals[valid]
+    n_tests = len(p_valid)
+
+    if method == "bonferroni":
+        adjusted[valid] = np.minimum(p_valid * n_tests, 1.0)
+    elif method == "bh":
+        order = np.argsort(p_valid)
+        ranked = p_valid[order] * n_tests / np.arange(1, n_tests + 1)
+        # Enforce monotonicity from the largest p-value down
+        ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+        adjusted_valid = np.empty(n_tests)
+        adjusted_valid[order] = np.minimum(ranked, 1.0)
+        adjusted[valid] = adjusted_valid
+    else:
+        raise ValueError("Unknown multiple testing correction: {0}".format(method))
+
+    return adjusted
+
+
+def stratified_sample_indices(strata, max_samples, random_state=0):
+    """ Randomly sample row positions, keeping the share of each stratum (e.g., day).
+
+    Each stratum gets a number of samples proportional to its size (largest remainder rounding),
+    and rows are drawn at random without replacement within each stratum.
+
+    Input:
+        strata (np.ndarray): Stratum (e.g., date) of each row.
+        max_samples (int): Number of rows to sample. All rows are kept if there are fewer.
+        random_state (int): Seed for the random draw.
+
+    Returns:
+        indices (np.ndarray): Sorted positions of the sampled rows.
+    """
+    n_rows = len(strata)
+    if n_rows <= max_samples:
+        return np.arange(n_rows)
+
+    rng = np.random.RandomState(random_state)
+    _, codes, sizes = np.unique(strata, return_inverse=True, return_counts=True)
+    codes = codes.ravel()
+
+    # Proportional allocation per stratum
+    exact = sizes * max_samples / n_rows
+    quota = np.floor(exact).astype(np.int64)
+    remainder = max_samples - quota.sum()
+    quota[np.argsort(quota - exact)[:remainder]] += 1
+
+    # Random order within each stratum, keep the first quota rows of each
+    order = np.lexsort((rng.random_sample(n_rows), codes))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(n_rows) - starts[codes[order]]
+    keep = rank < quota[codes[order]]
+
+    return np.sort(order[keep])
+
+
+def get_null_matrix(df, features):
+    """ Null indicator matrix for the features of a window of data.
+
+    Computed once per window so that null counts, removed row counts and the rows without nulls
+    can all be derived from it without further passes over the data.
+
+    Input:
+        df (pd.DataFrame): Feature data for one group and date range.
+        features (list of str): Names of the features (columns) of interest.
+
+    Returns:
+        null_matrix (np.ndarray): Boolean array of shape (rows, features), True where a value is null.
+    """
+    null_matrix = np.empty((len(df), len(features)), dtype=bool)
+    for j, feature in enumerate(features):
+        null_matrix[:, j] = df[feature].isna().to_numpy()
+
+    return null_matrix
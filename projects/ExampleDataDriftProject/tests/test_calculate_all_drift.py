@@ -8,6 +8,7 @@ import numpy as np
 import datetime
 import decimal
 import pytest
+from scipy.stats import wasserstein_distance
 
 sys.path.append(os.getcwd())
 from distribution.calculate_all_drift import (  # noqa: E402
@@ -16,7 +17,31 @@ from distribution.calculate_all_drift import (  # noqa: E402
     initialize_df,
     retrieve_data,
     rank_feature_drift,
+    format_arg_windows,
+    resolve_windows,
+    detect_drift_by_ID,
+    get_time_series_windows,
+    initialize_time_series_df,
+    detect_drift_time_series,
+    apply_multiple_testing_correction,
+    check_feature_data,
+    get_completed_groups,
+    load_completed_results,
+    prepare_data,
+    retrieve_prepared_data,
+    get_window_eligibility,
+    detect_drift_from_cube,
+    get_rollup_groups,
+    estimate_group_costs,
+    estimate_group_memory,
+    get_memory_sample_caps,
+    get_feature_stats,
+    choose_group_strategies,
+    get_group_fingerprint,
+    load_result_cache,
+    save_result_cache,
 )
+from distribution.drift_cube import build_drift_cube  # noqa: E402
 
 
 @pytest.fixture
@@ -127,6 +152,61 @@ def test_validate_datetime_range_invalid(test_df):
     assert range_max == pd.Timestamp("2017-04-04 00:00:00")
 
 
+@pytest.mark.parametrize("missing_date", [False, True])
+def test_get_window_eligibility(test_df, missing_date):
+    # Arrange
+    df = test_df
+    if missing_date:
+        # A row without a datetime doesn't change the group's datetime range
+        missing_row = test_df[test_df["hospitalID"] == "exampleHospital01"].iloc[[0]].copy()
+        missing_row["hospitalDischargeDate"] = pd.NaT
+        df = pd.concat([missing_row, test_df, missing_row], ignore_index=True)
+    group_values = ["exampleHospital01", "exampleHospital02", "exampleHospital03", "missing"]
+    windows = [
+        {
+            "baselineStart": "2008-01-01",
+            "baselineEnd": "2013-12-31",
+            "targetStart": "2014-01-01",
+            "targetEnd": "2017-12-31",
+        },
+        {
+            "baselineStart": "2012-01-01",
+            "baselineEnd": "2016-12-31",
+            "targetStart": "2017-01-01",
+            "targetEnd": "2018-12-31",
+        },
+    ]
+    prepared = prepare_data(df, "hospitalDischargeDate", "hospitalID", ["avgHGB"])
+
+    # Act
+    eligibility = get_window_eligibility(prepared, group_values, windows)
+
+    # Assert
+    for g, group_value in enumerate(group_values[:3]):
+        for w, window in enumerate(windows):
+            baseline_status, _, _ = validate_datetime_range(
+                window["baselineStart"],
+                window["baselineEnd"],
+                test_df,
+                "hospitalDischargeDate",
+                "hospitalID",
+                group_value,
+            )
+            target_status, _, _ = validate_datetime_range(
+                window["targetStart"],
+                window["targetEnd"],
+                test_df,
+                "hospitalDischargeDate",
+                "hospitalID",
+                group_value,
+            )
+            assert eligibility["eligible"][g, w] == (baseline_status and target_status)
+    assert list(eligibility["eligible"][3]) == [False, False]
+    assert list(eligibility["baseline_counts"][:, 0]) == [0, 0, 4, 0]
+    assert list(eligibility["target_counts"][:, 0]) == [4, 2, 0, 0]
+    assert str(eligibility["range_min"][2])[:10] == "2008-08-12"
+
+
 def test_initialize_df():
     # Arrange
 
@@ -168,6 +248,77 @@ def test_retrieve_data(test_df):
     assert len(df_out) == 4
 
 
+def test_retrieve_data_does_not_modify_input(test_df):
+    # Arrange
+    df = test_df.copy()
+
+    # Act
+    df_out = retrieve_data(
+        ["avgHGB"], df, "hospitalDischargeDate", "", "", "2015-11-10", "2017-04-04",
+    )
+
+    # Assert
+    assert len(df_out) == 4
+    pd.testing.assert_frame_equal(df, test_df)
+
+
+@pytest.mark.parametrize(
+    "group_col, group_value, start_datetime, end_datetime, expected",
+    [
+        ("hospitalID", "exampleHospital01", "2015-11-10", "2017-04-04", 4),
+        ("hospitalID", "exampleHospital01", "2015-11-11", "2017-04-04", 2),
+        ("hospitalID", "exampleHospital03", "2008-01-01", "2013-07-23", 4),
+        ("hospitalID", "missingHospital", "2008-01-01", "2020-01-01", 0),
+        ("", "", "2012-01-01", "2015-12-31", 5),
+    ],
+)
+def test_retrieve_prepared_data(
+    test_df, group_col, group_value, start_datetime, end_datetime, expected
+):
+    # Arrange
+    features = ["avgHGB", "gcsTotalLast"]
+    datetime_col = "hospitalDischargeDate"
+    prepared = prepare_data(test_df, datetime_col, group_col, features)
+
+    # Act
+    df_out = retrieve_prepared_data(
+        prepared, group_value, start_datetime, end_datetime
+    )
+    df_expected = retrieve_data(
+        features,
+        test_df,
+        datetime_col,
+        group_col,
+        group_value,
+        start_datetime,
+        end_datetime,
+    )
+
+    # Assert
+    assert len(df_out) == expected
+    assert sorted(df_out.index) == sorted(df_expected.index)
+    assert df_out[datetime_col].is_monotonic_increasing
+
+
+def test_prepare_data_null_group():
+    # Arrange
+    df = pd.DataFrame(
+        {
+            "date": pd.date_range("2020-01-01", periods=12, freq="D").astype(str),
+            "grp": ["a", None, "b"] * 4,
+            "x": [1.0, 100.0, 2.0, 3.0, 200.0, 4.0, 5.0, 300.0, 6.0, 7.0, 400.0, 8.0],
+        }
+    )
+
+    # Act
+    prepared = prepare_data(df, "date", "grp", ["x"])
+    df_b = retrieve_prepared_data(prepared, "b", "2020-01-01", "2020-01-12")
+
+    # Assert
+    assert sorted(prepared["group_bounds"]) == ["a", "b"]
+    assert df_b["x"].tolist() == [2.0, 4.0, 6.0, 8.0]
+
+
 # ----------------------------------------------------------------------------------------------
 # Test various conditions for rank_feature_drift
 # Note: We are not using @pytest.mark.parameterize because the assertions are different by case
@@ -249,6 +400,1121 @@ def test_rank_feature_drift_five_features():
     assert len(drift_by_feature) == 5
 
 
+def test_rank_feature_drift_arrays():
+    # Arrange
+    preds = {
+        "data": {"p_val": np.array([0.7499942, 0.0000142, 0.0082934], dtype=np.float32)}
+    }
+    feature_names = ["gcsTotalLast", "dxGroup", "bmi"]
+    p_val = 0.05
+
+    # Act
+    drift_by_feature = rank_feature_drift(preds, feature_names, p_val, as_frame=False)
+
+    # Assert
+    assert abs(drift_by_feature["p_val"][1] - 0.0000142) < 0.0000001
+    assert list(drift_by_feature["is_significant_drift"]) == [False, True, True]
+    assert list(drift_by_feature["rank"]) == [1, 2, 0]
+
+
 @pytest.mark.skip(reason="Relied on SQL table data")
 def test_detect_drift_by_ID():
     print("Skip test_detect_drift_by_ID")
+
+
+def test_format_arg_windows():
+    # Arrange
+    windows = '[["2008-01-01", "2014-12-31", "2015-01-01", "2017-12-31"], {"windowID": "last7", "targetDays": 7}]'
+
+    # Act
+    list_of_windows = format_arg_windows(windows)
+
+    # Assert
+    assert list_of_windows[0]["baselineEnd"] == "2014-12-31"
+    assert list_of_windows[0]["targetStart"] == "2015-01-01"
+    assert list_of_windows[1] == {"windowID": "last7", "targetDays": 7}
+
+
+def test_resolve_windows(test_df):
+    # Arrange
+    windows = [{"windowID": "last30", "targetDays": 30}, {"targetStart": "2015-01-01"}]
+
+    # Act
+    resolved = resolve_windows(
+        test_df, "hospitalDischargeDate", windows, baseline_end="2014-12-31"
+    )
+
+    # Assert
+    assert resolved[0]["windowID"] == "last30"
+    assert resolved[0]["baselineStart"] == "2008-08-12"
+    assert resolved[0]["baselineEnd"] == "2014-12-31"
+    assert resolved[0]["targetStart"] == "2017-09-20"
+    assert resolved[0]["targetEnd"] == "2017-10-20"
+    assert resolved[1]["windowID"] == "2008-08-12_2014-12-31_2015-01-01_2017-10-20"
+
+
+def test_detect_drift_by_ID_windows(test_df):
+    # Arrange
+    features = ["avgHGB", "gcsTotalLast"]
+    windows = [
+        {
+            "windowID": "all",
+            "baselineStart": "2008-01-01",
+            "baselineEnd": "2014-12-31",
+            "targetStart": "2015-01-01",
+            "targetEnd": "2017-12-31",
+        },
+        {
+            "windowID": "2017",
+            "baselineStart": "2008-01-01",
+            "baselineEnd": "2014-12-31",
+            "targetStart": "2017-01-01",
+            "targetEnd": "2017-12-31",
+        },
+    ]
+
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem01"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=features,
+        baseline_start="",
+        baseline_end="",
+        target_start="",
+        target_end="",
+        output_df=initialize_df(),
+        p_val=0.05,
+        windows=windows,
+    )
+
+    # Assert
+    assert len(output_df) == 4
+    assert list(output_df["windowID"]) == ["all", "all", "2017", "2017"]
+    assert list(output_df["baselineSamples"]) == [4, 4, 4, 4]
+    assert list(output_df["targetSamples"]) == [6, 6, 4, 4]
+    assert output_df["pValue"].between(0, 1).all()
+
+
+def test_detect_drift_by_ID_multivariate(test_df):
+    # Arrange
+    features = ["avgHGB", "gcsTotalLast"]
+
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem01"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=features,
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_start="2015-01-01",
+        target_end="2017-12-31",
+        output_df=initialize_df(),
+        p_val=0.05,
+        multivariate_test="mmd",
+    )
+
+    # Assert
+    assert list(output_df["feature"]) == features + ["multivariate_mmd"]
+    assert 0 < output_df["pValue"].iloc[-1] <= 1
+
+
+@pytest.mark.parametrize(
+    "window_days, step, expected",
+    [
+        (7, "day", [("2020-01-01", "2020-01-07"), ("2020-01-02", "2020-01-08")]),
+        (
+            3,
+            "week",
+            [
+                ("2020-01-01", "2020-01-03"),
+                ("2020-01-08", "2020-01-10"),
+                ("2020-01-15", "2020-01-17"),
+            ],
+        ),
+        (30, "day", [("2020-01-01", "2020-01-20")]),
+    ],
+)
+def test_get_time_series_windows(window_days, step, expected):
+    # Arrange
+    target_start = "2020-01-01"
+    target_end = "2020-01-20"
+
+    # Act
+    windows = get_time_series_windows(target_start, target_end, window_days, step)
+
+    # Assert
+    if step == "day" and window_days == 7:
+        windows = windows[:2]
+    assert windows == [(pd.Timestamp(start), pd.Timestamp(end)) for start, end in expected]
+
+
+def test_detect_drift_time_series(test_df):
+    # Arrange
+    features = ["avgHGB", "gcsTotalLast"]
+
+    # Act
+    output_df = detect_drift_time_series(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem01"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=features,
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_start="2015-11-01",
+        target_end="2017-10-31",
+        output_df=initialize_time_series_df(),
+        p_val=0.05,
+        window_days=365,
+        step="week",
+    )
+
+    # Assert
+    assert set(output_df["feature"]) == set(features)
+    assert output_df["targetSamples"].isin([2, 4]).all()
+    assert (output_df["baselineSamples"] == 4).all()
+    assert output_df["pValue"].between(0, 1).all()
+
+
+def test_detect_drift_time_series_isolates_failures(test_df):
+    # Arrange
+    # A copy of the data as a second group, whose values of mixed types can't be ordered
+    mixed_df = test_df.assign(healthSystemID="exampleHealthSystem02")
+    mixed_df["avgHGB"] = mixed_df["avgHGB"].astype(object)
+    mixed_df.loc[mixed_df.index[::2], "avgHGB"] = "high"
+    df = pd.concat([test_df, mixed_df], ignore_index=True)
+    kwargs = dict(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem02", "exampleHealthSystem01"],
+        datetime_col="hospitalDischargeDate",
+        features=["avgHGB"],
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_start="2015-11-01",
+        target_end="2017-10-31",
+        p_val=0.05,
+        window_days=365,
+        step="week",
+    )
+
+    # Act
+    output_df = detect_drift_time_series(
+        df=df, output_df=initialize_time_series_df(), **kwargs
+    )
+
+    # Assert
+    assert set(output_df["group_value"]) == {"exampleHealthSystem01"}
+    with pytest.raises(ValueError):
+        detect_drift_time_series(
+            df=test_df,
+            output_df=initialize_time_series_df(),
+            **dict(kwargs, window_days=0),
+        )
+
+
+def test_apply_multiple_testing_correction():
+    # Arrange
+    output_df = initialize_df()
+    output_df["pValue"] = [0.01, 0.02, 0.3]
+    output_df["isSignificantDrift"] = [True, True, False]
+
+    # Act
+    corrected_df = apply_multiple_testing_correction(output_df, 0.05, "bonferroni")
+
+    # Assert
+    assert list(corrected_df.columns).index("adjustedPValue") == (
+        list(corrected_df.columns).index("pValue") + 1
+    )
+    np.testing.assert_allclose(corrected_df["adjustedPValue"], [0.03, 0.06, 0.9])
+    assert list(corrected_df["isSignificantDrift"]) == [True, False, False]
+    assert "adjustedPValue" not in output_df.columns
+
+
+def test_detect_drift_by_ID_max_samples(test_df):
+    # Arrange
+    features = ["avgHGB", "gcsTotalLast"]
+
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem01"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=features,
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_start="2015-01-01",
+        target_end="2017-12-31",
+        output_df=initialize_df(),
+        p_val=0.05,
+        max_baseline_samples=3,
+        max_target_samples=3,
+    )
+
+    # Assert
+    assert list(output_df["baselineSamples"]) == [4, 4]
+    assert list(output_df["baselineSamplesUsed"]) == [3, 3]
+    assert list(output_df["targetSamples"]) == [6, 6]
+    assert list(output_df["targetSamplesUsed"]) == [3, 3]
+
+
+def test_detect_drift_by_ID_compact(test_df):
+    # Arrange
+    features = ["dxGroup", "avgHGB", "gcsTotalLast"]
+    kwargs = dict(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem01"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=features,
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_start="2015-01-01",
+        target_end="2017-12-31",
+        p_val=0.05,
+    )
+
+    # Act
+    output_df = detect_drift_by_ID(output_df=initialize_df(), **kwargs)
+    compact_df = detect_drift_by_ID(output_df=initialize_df(), compact=True, **kwargs)
+
+    # Assert
+    assert list(compact_df["feature"]) == features
+    assert np.allclose(compact_df["pValue"], output_df["pValue"])
+    assert list(compact_df["baselineValues"]) == list(output_df["baselineValues"])
+
+
+def test_detect_drift_by_ID_weighted_ks(test_df):
+    # Arrange
+    features = ["dxGroup", "avgHGB", "gcsTotalLast"]
+    kwargs = dict(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem01"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=features,
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_start="2015-01-01",
+        target_end="2017-12-31",
+        p_val=0.05,
+    )
+
+    # Act
+    output_df = detect_drift_by_ID(output_df=initialize_df(), **kwargs)
+    weighted_df = detect_drift_by_ID(
+        output_df=initialize_df(), weighted_ks=True, **kwargs
+    )
+
+    # Assert
+    pd.testing.assert_frame_equal(weighted_df, output_df)
+
+
+def test_detect_drift_by_ID_metrics(test_df):
+    # Arrange
+    metrics = ["psi", "wasserstein", "js"]
+
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem01"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=["dxGroup", "avgHGB"],
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_start="2015-01-01",
+        target_end="2017-12-31",
+        output_df=initialize_df(metrics),
+        p_val=0.05,
+        metrics=metrics,
+    )
+
+    # Assert
+    columns = list(output_df.columns)
+    assert columns[columns.index("isSignificantDrift") + 1 :][:3] == [
+        "psi",
+        "wassersteinDistance",
+        "jsDivergence",
+    ]
+    assert np.isnan(output_df["wassersteinDistance"][0])
+    expected = wasserstein_distance(
+        [11.8, 12.45, 12.45, 13.3], [9.7, 9.7, 11.7, 11.7, 11.9, 11.9]
+    )
+    assert abs(output_df["wassersteinDistance"][1] - expected) < 1e-9
+    assert (output_df["psi"] > 0).all()
+    assert ((output_df["jsDivergence"] > 0) & (output_df["jsDivergence"] <= 1)).all()
+
+
+def test_check_feature_data():
+    # Arrange
+    df_window = pd.DataFrame(
+        {
+            "ok_float": [1.0, np.nan, 2.0],
+            "ok_str": ["a", "b", None],
+            "all_null": [np.nan, np.nan, np.nan],
+            "mixed": ["a", 1.0, 2],
+        }
+    )
+
+    # Act
+    skipped_features = check_feature_data(df_window, list(df_window.columns))
+
+    # Assert
+    assert skipped_features == {"all_null": "all_null", "mixed": "bad_dtype"}
+
+
+def test_detect_drift_by_ID_isolates_groups(test_df):
+    # Arrange
+    # exampleHospital02 has no baseline data and exampleHospital03 has no target data
+    features = ["avgHGB", "gcsTotalLast"]
+
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="hospitalID",
+        group_values=["exampleHospital02", "exampleHospital01", "exampleHospital03"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=features,
+        baseline_start="2008-01-01",
+        baseline_end="2016-12-31",
+        target_start="2017-01-01",
+        target_end="2017-12-31",
+        output_df=initialize_df(),
+        p_val=0.05,
+    )
+
+    # Assert
+    assert list(output_df["group_value"]) == ["exampleHospital02"] * 2 + [
+        "exampleHospital01"
+    ] * 2 + ["exampleHospital03"] * 2
+    assert list(output_df["skipReason"]) == [
+        "invalid_date_range",
+        "invalid_date_range",
+        "",
+        "",
+        "invalid_date_range",
+        "invalid_date_range",
+    ]
+    assert list(output_df["status"][2:4]) == ["ok", "ok"]
+
+
+def test_detect_drift_by_ID_empty_target(test_df):
+    # Arrange
+    # exampleHospital01 has data in 2015 and 2017, but not in 2016
+    windows = [
+        {
+            "windowID": "2016",
+            "baselineStart": "2015-01-01",
+            "baselineEnd": "2015-12-31",
+            "targetStart": "2016-01-01",
+            "targetEnd": "2016-12-31",
+        },
+        {
+            "windowID": "2017",
+            "baselineStart": "2015-01-01",
+            "baselineEnd": "2015-12-31",
+            "targetStart": "2017-01-01",
+            "targetEnd": "2017-12-31",
+        },
+    ]
+
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="hospitalID",
+        group_values=["exampleHospital01"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=["avgHGB"],
+        baseline_start="",
+        baseline_end="",
+        target_start="",
+        target_end="",
+        output_df=initialize_df(),
+        p_val=0.05,
+        windows=windows,
+    )
+
+    # Assert
+    assert list(output_df["windowID"]) == ["2016", "2017"]
+    assert list(output_df["skipReason"]) == ["empty_target", ""]
+
+
+def test_detect_drift_by_ID_all_null_feature(test_df):
+    # Arrange
+    features = ["avgHGB", "gcsTotalLast"]
+    df = test_df.copy()
+    df["gcsTotalLast"] = np.nan
+
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem01"],
+        df=df,
+        datetime_col="hospitalDischargeDate",
+        features=features,
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_start="2015-01-01",
+        target_end="2017-12-31",
+        output_df=initialize_df(),
+        p_val=0.05,
+    )
+
+    # Assert
+    assert list(output_df["feature"]) == ["gcsTotalLast", "avgHGB"]
+    assert list(output_df["skipReason"]) == ["all_null", ""]
+    assert output_df["pValue"].iloc[1] > 0
+
+
+def test_detect_drift_by_ID_completed_groups(test_df):
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="hospitalID",
+        group_values=["exampleHospital01", "exampleHospital03"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=["avgHGB"],
+        baseline_start="2008-01-01",
+        baseline_end="2013-12-31",
+        target_start="2014-01-01",
+        target_end="2017-12-31",
+        output_df=initialize_df(),
+        p_val=0.05,
+        completed_groups=["exampleHospital01"],
+    )
+
+    # Assert
+    assert list(output_df["group_value"]) == ["exampleHospital03"]
+
+
+def test_get_completed_groups():
+    # Arrange
+    output_df = pd.DataFrame(
+        {
+            "group_value": ["a", "a", "b", "b", "c"],
+            "skipReason": ["", "", "", "error: TypeError", "empty_target"],
+        }
+    )
+
+    # Act
+    completed_groups = get_completed_groups(output_df)
+
+    # Assert
+    assert completed_groups == ["a", "c"]
+
+
+def test_load_completed_results(tmp_path):
+    # Arrange
+    results_path = str(tmp_path / "results.csv")
+    previous_df = initialize_df()
+    previous_df["group_value"] = ["1", "2", "2"]
+    previous_df["skipReason"] = ["", "", "error: ValueError"]
+    previous_df["feature"] = ["cases", "cases", "deaths"]
+    previous_df.to_csv(results_path, index=False)
+
+    # Act
+    output_df, completed_groups = load_completed_results(results_path)
+
+    # Assert
+    assert completed_groups == ["1"]
+    assert list(output_df["group_value"]) == ["1"]
+    assert list(output_df.columns) == list(initialize_df().columns)
+
+
+def test_detect_drift_by_ID_checkpoint(test_df, tmp_path):
+    # Arrange
+    checkpoint_path = str(tmp_path / "checkpoint.csv")
+
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="hospitalID",
+        group_values=["exampleHospital01", "exampleHospital02", "exampleHospital03"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=["avgHGB"],
+        baseline_start="2008-01-01",
+        baseline_end="2013-12-31",
+        target_start="2014-01-01",
+        target_end="2017-12-31",
+        output_df=initialize_df(),
+        p_val=0.05,
+        checkpoint_path=checkpoint_path,
+        checkpoint_every=2,
+    )
+    checkpoint_df, completed_groups = load_completed_results(checkpoint_path)
+
+    # Assert
+    assert len(output_df) == 3
+    assert completed_groups == ["exampleHospital01", "exampleHospital02"]
+    assert len(checkpoint_df) == 2
+
+
+def test_detect_drift_by_ID_checkpoint_every(test_df, tmp_path):
+    # Arrange
+    checkpoint_path = str(tmp_path / "checkpoint.csv")
+
+    # Act / Assert
+    with pytest.raises(ValueError):
+        detect_drift_by_ID(
+            group_col="hospitalID",
+            group_values=["exampleHospital01"],
+            df=test_df,
+            datetime_col="hospitalDischargeDate",
+            features=["avgHGB"],
+            baseline_start="2008-01-01",
+            baseline_end="2013-12-31",
+            target_start="2014-01-01",
+            target_end="2017-12-31",
+            output_df=initialize_df(),
+            p_val=0.05,
+            checkpoint_path=checkpoint_path,
+            checkpoint_every=0,
+        )
+
+
+def test_detect_drift_from_cube(test_df):
+    # Arrange
+    features = ["dxGroup", "avgHGB", "gcsTotalLast"]
+    windows = [
+        {
+            "windowID": "w1",
+            "baselineStart": "2008-01-01",
+            "baselineEnd": "2014-12-31",
+            "targetStart": "2015-01-01",
+            "targetEnd": "2017-12-31",
+        },
+        {
+            "windowID": "w2",
+            "baselineStart": "2008-01-01",
+            "baselineEnd": "2013-12-31",
+            "targetStart": "2017-01-01",
+            "targetEnd": "2017-12-31",
+        },
+    ]
+    group_values = ["exampleHospital01", "exampleHospital03", "exampleHospital04"]
+    cube = build_drift_cube(test_df, "hospitalDischargeDate", "hospitalID", features)
+
+    # Act
+    expected_df = detect_drift_by_ID(
+        group_col="hospitalID",
+        group_values=group_values,
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=features,
+        baseline_start="",
+        baseline_end="",
+        target_start="",
+        target_end="",
+        output_df=initialize_df(["psi"]),
+        p_val=0.05,
+        windows=windows,
+        metrics=["psi"],
+    )
+    output_df = detect_drift_from_cube(
+        group_col="hospitalID",
+        group_values=group_values,
+        cube=cube,
+        features=features,
+        windows=windows,
+        output_df=initialize_df(["psi"]),
+        p_val=0.05,
+        metrics=["psi"],
+    )
+
+    # Assert
+    pd.testing.assert_frame_equal(output_df, expected_df, check_dtype=False)
+
+
+def test_get_rollup_groups(test_df):
+    # Arrange
+    shared_df = pd.DataFrame({"county": ["a", "a", "b"], "state": ["WA", "OR", "WA"]})
+
+    # Act
+    rollup_groups = get_rollup_groups(test_df, "hospitalID", "healthSystemID")
+
+    # Assert
+    assert list(rollup_groups) == ["exampleHealthSystem01"]
+    assert sorted(rollup_groups["exampleHealthSystem01"]) == [
+        "exampleHospital01",
+        "exampleHospital02",
+        "exampleHospital03",
+    ]
+    with pytest.raises(ValueError):
+        get_rollup_groups(shared_df, "county", "state")
+
+
+@pytest.mark.parametrize("use_cube", [False, True])
+def test_detect_drift_rollups(test_df, use_cube):
+    # Arrange
+    features = ["dxGroup", "avgHGB", "gcsTotalLast"]
+    kwargs = dict(
+        features=features,
+        windows=[
+            {
+                "windowID": "w1",
+                "baselineStart": "2008-01-01",
+                "baselineEnd": "2014-12-31",
+                "targetStart": "2015-01-01",
+                "targetEnd": "2017-12-31",
+            }
+        ],
+        output_df=initialize_df(),
+        p_val=0.05,
+    )
+    rollups = {
+        "healthSystemID": get_rollup_groups(test_df, "hospitalID", "healthSystemID")
+    }
+    hospitals = ["exampleHospital01", "exampleHospital02", "exampleHospital03"]
+
+    # Act
+    if use_cube:
+        cube = build_drift_cube(
+            test_df, "hospitalDischargeDate", "hospitalID", features, rollups
+        )
+        output_df = detect_drift_from_cube(
+            "hospitalID", hospitals, cube, rollups=rollups, **kwargs
+        )
+    else:
+        output_df = detect_drift_by_ID(
+            "hospitalID",
+            hospitals,
+            test_df,
+            "hospitalDischargeDate",
+            baseline_start="",
+            baseline_end="",
+            target_start="",
+            target_end="",
+            weighted_ks=True,
+            rollups=rollups,
+            **kwargs
+        )
+    expected_df = detect_drift_by_ID(
+        "healthSystemID",
+        ["exampleHealthSystem01"],
+        test_df,
+        "hospitalDischargeDate",
+        baseline_start="",
+        baseline_end="",
+        target_start="",
+        target_end="",
+        **kwargs
+    )
+
+    # Assert
+    assert list(output_df["group_col"]) == ["hospitalID"] * 9 + ["healthSystemID"] * 3
+    pd.testing.assert_frame_equal(
+        output_df.iloc[9:].reset_index(drop=True), expected_df, check_dtype=False
+    )
+
+
+def test_detect_drift_by_ID_workers(test_df):
+    # Arrange
+    df = test_df.copy()
+    df.loc[0, "avgHGB"] = np.nan
+    kwargs = dict(
+        group_col="hospitalID",
+        group_values=["exampleHospital01", "exampleHospital02", "exampleHospital03"],
+        df=df,
+        datetime_col="hospitalDischargeDate",
+        features=["dxGroup", "avgHGB", "gcsTotalLast"],
+        baseline_start="2008-01-01",
+        baseline_end="2015-12-31",
+        target_start="2016-01-01",
+        target_end="2017-12-31",
+        p_val=0.05,
+        rollups={"healthSystemID": get_rollup_groups(df, "hospitalID", "healthSystemID")},
+    )
+
+    # Act
+    output_df = detect_drift_by_ID(output_df=initialize_df(), **kwargs)
+    parallel_df = detect_drift_by_ID(output_df=initialize_df(), n_workers=3, **kwargs)
+
+    # Assert
+    pd.testing.assert_frame_equal(parallel_df, output_df)
+
+
+def test_estimate_group_costs(test_df):
+    # Arrange
+    prepared = prepare_data(
+        test_df, "hospitalDischargeDate", "healthSystemID", ["avgHGB"]
+    )
+    windows = resolve_windows(
+        test_df,
+        "hospitalDischargeDate",
+        [{"targetStart": "2015-01-01"}, {"targetStart": "2016-01-01"}],
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_end="2017-12-31",
+    )
+    eligibility = get_window_eligibility(
+        prepared, ["exampleHealthSystem01", "missing"], windows
+    )
+
+    # Act
+    costs = estimate_group_costs(eligibility, windows, n_features=2)
+
+    # Assert
+    # 4 baseline rows sorted once, then 6 and 4 target rows
+    assert costs[0] == 2 * (4 * np.log2(6) + 6 * np.log2(8) + 4 * np.log2(6))
+    assert costs[1] == 0
+
+
+def test_estimate_group_memory(test_df):
+    # Arrange
+    prepared = prepare_data(
+        test_df, "hospitalDischargeDate", "healthSystemID", ["avgHGB"]
+    )
+    windows = resolve_windows(
+        test_df,
+        "hospitalDischargeDate",
+        [{"targetStart": "2015-01-01"}, {"targetStart": "2016-01-01"}],
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_end="2017-12-31",
+    )
+    eligibility = get_window_eligibility(
+        prepared, ["exampleHealthSystem01", "missing"], windows
+    )
+
+    # Act
+    memory = estimate_group_memory(eligibility, windows, n_features=2)
+    sampled_memory = estimate_group_memory(
+        eligibility, windows, n_features=2, max_target_samples=2
+    )
+
+    # Assert
+    # 4 baseline rows kept, then the larger target window of 6 rows, at 1 + 3 * 8 bytes per row and feature
+    assert memory[0] == 2 * 4 * 25 + 2 * 6 * 25
+    assert memory[1] == 0
+    # Only 2 of the 6 target rows are sampled and copied
+    assert sampled_memory[0] == 2 * 4 * 25 + 2 * (6 * 9 + 2 * 16)
+
+
+def test_get_memory_sample_caps(test_df, monkeypatch):
+    # Arrange
+    monkeypatch.setattr("distribution.calculate_all_drift.MIN_MEMORY_SAMPLES", 1)
+    prepared = prepare_data(
+        test_df, "hospitalDischargeDate", "healthSystemID", ["avgHGB"]
+    )
+    windows = resolve_windows(
+        test_df,
+        "hospitalDischargeDate",
+        [{"targetStart": "2015-01-01"}, {"targetStart": "2016-01-01"}],
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_end="2017-12-31",
+    )
+    eligibility = get_window_eligibility(
+        prepared, ["exampleHealthSystem01", "missing"], windows
+    )
+
+    # Act
+    sample_caps = get_memory_sample_caps(
+        eligibility, windows, n_features=2, memory_budget=372
+    )
+
+    # Assert
+    # 3 rows per window: 2 * (4 * 9 + 3 * 16) + 2 * (6 * 9 + 3 * 16) = 372 bytes, 4 rows would be 436
+    assert list(sample_caps) == [3, 0]
+    assert list(
+        get_memory_sample_caps(eligibility, windows, n_features=2, memory_budget=500)
+    ) == [0, 0]
+
+
+def test_detect_drift_by_ID_memory_budget(test_df, monkeypatch):
+    # Arrange
+    monkeypatch.setattr("distribution.calculate_all_drift.MIN_MEMORY_SAMPLES", 2)
+    kwargs = dict(
+        group_col="healthSystemID",
+        group_values=["exampleHealthSystem01", "exampleHealthSystem02"],
+        df=test_df,
+        datetime_col="hospitalDischargeDate",
+        features=["avgHGB"],
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_start="2015-01-01",
+        target_end="2017-12-31",
+        p_val=0.05,
+    )
+
+    over_budget_groups = []
+    fitting_groups = []
+
+    # Act
+    output_df = detect_drift_by_ID(output_df=initialize_df(), **kwargs)
+    budget_df = detect_drift_by_ID(
+        output_df=initialize_df(),
+        memory_budget=1,
+        n_workers=2,
+        over_budget_groups=over_budget_groups,
+        **kwargs
+    )
+    detect_drift_by_ID(
+        output_df=initialize_df(),
+        memory_budget=10 ** 6,
+        over_budget_groups=fitting_groups,
+        **kwargs
+    )
+
+    # Assert
+    # Every group is over the budget, so each window is sampled down to the fewest rows allowed, which still
+    # doesn't fit the group with rows
+    assert over_budget_groups == [("healthSystemID", "exampleHealthSystem01")]
+    assert fitting_groups == []
+    assert (output_df["status"] == budget_df["status"]).all()
+    tested = budget_df["status"] == "ok"
+    assert (budget_df.loc[tested, "baselineSamplesUsed"] <= 2).all()
+    assert (budget_df.loc[tested, "targetSamplesUsed"] <= 2).all()
+    assert (
+        budget_df["baselineSamples"].tolist() == output_df["baselineSamples"].tolist()
+    )
+
+
+def test_choose_group_strategies(test_df):
+    # Arrange
+    prepared = prepare_data(
+        test_df, "hospitalDischargeDate", "healthSystemID", ["avgHGB", "dxGroup"]
+    )
+    windows = resolve_windows(
+        test_df,
+        "hospitalDischargeDate",
+        [{"targetStart": "2015-01-01"}],
+        baseline_start="2008-01-01",
+        baseline_end="2014-12-31",
+        target_end="2017-12-31",
+    )
+    eligibility = get_window_eligibility(
+        prepared, ["exampleHealthSystem01", "missing"], windows
+    )
+
+    # Act
+    feature_stats = get_feature_stats(prepared["df"], ["avgHGB", "dxGroup"])
+    strategies = choose_group_strategies(
+        eligibility, feature_stats, ["avgHGB", "dxGroup"], sample_size=None
+    )
+    sampled_strategies = choose_group_strategies(
+        eligibility, feature_stats, ["avgHGB", "dxGroup"], sample_size=2
+    )
+
+    # Assert
+    assert feature_stats["distinct"] == {"avgHGB": 6, "dxGroup": 6}
+    assert feature_stats["integer"] == {"avgHGB": False, "dxGroup": False}
+    assert strategies == [
+        {"avgHGB": "exact", "dxGroup": "exact"},
+        {"avgHGB": "exact", "dxGroup": "exact"},
+    ]
+    # Windows larger than the sample, with more distinct values, are sampled (not the group without rows)
+    assert sampled_strategies == [
+        {"avgHGB": "sampled", "dxGroup": "sampled"},
+        {"avgHGB": "exact", "dxGroup": "exact"},
+    ]
+
+
+def test_detect_drift_by_ID_auto_strategy():
+    # Arrange
+    rng = np.random.RandomState(0)
+    n_rows = 40000
+    df = pd.DataFrame(
+        {
+            "date": pd.Timestamp("2020-01-01")
+            + pd.to_timedelta(rng.randint(0, 200, n_rows), unit="D"),
+            "group": np.where(np.arange(n_rows) < 100, "small", "large"),
+            "continuous": rng.normal(0, 1, n_rows),
+            "counts": rng.poisson(3, n_rows),
+        }
+    )
+    kwargs = dict(
+        group_col="group",
+        group_values=["small", "large"],
+        df=df,
+        datetime_col="date",
+        features=["continuous", "counts"],
+        baseline_start="2020-01-01",
+        baseline_end="2020-03-31",
+        target_start="2020-04-01",
+        target_end="2020-07-31",
+        p_val=0.05,
+    )
+
+    # Act
+    output_df = detect_drift_by_ID(output_df=initialize_df(), **kwargs)
+    auto_df = detect_drift_by_ID(
+        output_df=initialize_df(strategy=True),
+        auto_strategy=True,
+        max_statistic_error=0.1,
+        **kwargs,
+    )
+
+    # Assert
+    strategies = auto_df.set_index(["group_value", "feature"])["ksStrategy"]
+    assert strategies[("small", "continuous")] == "exact"
+    assert strategies[("large", "continuous")] == "sampled"
+    assert strategies[("large", "counts")] == "weighted"
+    # 877 rows are drawn for a difference of at most 0.1 in the statistic
+    sampled = auto_df["ksStrategy"] == "sampled"
+    assert (auto_df.loc[sampled, "baselineSamplesUsed"] == 877).all()
+    assert (auto_df.loc[sampled, "targetSamplesUsed"] == 877).all()
+    # Exact and weighted tests give the same p-values as testing all rows
+    not_sampled = ~sampled.to_numpy()
+    assert np.allclose(
+        auto_df.loc[not_sampled, "pValue"].astype(float),
+        output_df.loc[not_sampled, "pValue"].astype(float),
+    )
+
+
+def test_get_group_fingerprint(test_df):
+    # Arrange
+    columns = ["dxGroup", "avgHGB", "hospitalDischargeDate"]
+    changed_df = test_df.copy()
+    changed_df.loc[test_df["hospitalID"] == "exampleHospital02", "avgHGB"] += 1
+    # Rows outside the fingerprinted range don't count
+    late_df = test_df.copy()
+    late_df.loc[len(late_df)] = late_df.iloc[0]
+    late_df.loc[len(late_df) - 1, "hospitalDischargeDate"] = "2030-01-01"
+
+    def fingerprint(df, group_value):
+        prepared = prepare_data(df, "hospitalDischargeDate", "hospitalID", columns)
+        return get_group_fingerprint(
+            prepared, group_value, columns, "2008-01-01", "2017-12-31"
+        )
+
+    # Act
+    fingerprint_01 = fingerprint(test_df, "exampleHospital01")
+    fingerprint_02 = fingerprint(test_df, "exampleHospital02")
+
+    # Assert
+    assert fingerprint(test_df.copy(), "exampleHospital01") == fingerprint_01
+    assert fingerprint(changed_df, "exampleHospital01") == fingerprint_01
+    assert fingerprint(changed_df, "exampleHospital02") != fingerprint_02
+    assert fingerprint(late_df, "exampleHospital01") == fingerprint_01
+    assert fingerprint(
+        test_df, ["exampleHospital01", "exampleHospital02"]
+    ) != fingerprint_01
+
+
+def test_detect_drift_by_ID_result_cache(test_df, tmp_path):
+    # Arrange
+    kwargs = dict(
+        group_col="hospitalID",
+        group_values=["exampleHospital01", "exampleHospital02", "exampleHospital03"],
+        datetime_col="hospitalDischargeDate",
+        features=["dxGroup", "avgHGB"],
+        baseline_start="2008-01-01",
+        baseline_end="2015-12-31",
+        target_start="2016-01-01",
+        target_end="2017-12-31",
+        p_val=0.05,
+    )
+    cache_path = str(tmp_path / "cache.csv")
+    result_cache = {}
+    first_df = detect_drift_by_ID(
+        df=test_df, output_df=initialize_df(), result_cache=result_cache, **kwargs
+    )
+    save_result_cache(cache_path, result_cache, first_df)
+
+    # Cached rows are marked, to tell them from recomputed rows
+    result_cache = load_result_cache(cache_path)
+    for rows in result_cache.values():
+        for row in rows:
+            row["skipReason"] = "cached"
+    changed_df = test_df.copy()
+    changed_df.loc[test_df["hospitalID"] == "exampleHospital02", "avgHGB"] += 1
+
+    # Act
+    output_df = detect_drift_by_ID(
+        df=changed_df, output_df=initialize_df(), result_cache=result_cache, **kwargs
+    )
+
+    # Assert
+    assert len(result_cache) == 3
+    assert len(output_df) == len(first_df)
+    from_cache = output_df.groupby("group_value")["skipReason"].apply(
+        lambda reasons: (reasons == "cached").all()
+    )
+    assert from_cache.to_dict() == {
+        "exampleHospital01": True,
+        "exampleHospital02": False,
+        "exampleHospital03": True,
+    }
+
+
+def test_detect_drift_by_ID_result_cache_global_inputs(test_df, tmp_path):
+    # Arrange
+    kwargs = dict(
+        group_col="hospitalID",
+        group_values=["exampleHospital01", "exampleHospital02"],
+        datetime_col="hospitalDischargeDate",
+        features=["dxGroup", "avgHGB"],
+        baseline_start="2008-01-01",
+        baseline_end="2015-12-31",
+        target_start="2016-01-01",
+        target_end="2017-12-31",
+        p_val=0.05,
+        compact=True,
+    )
+    cache_path = str(tmp_path / "cache.csv")
+    result_cache = {}
+    first_df = detect_drift_by_ID(
+        df=test_df, output_df=initialize_df(), result_cache=result_cache, **kwargs
+    )
+    save_result_cache(cache_path, result_cache, first_df)
+    cached_rows = [row for rows in load_result_cache(cache_path).values() for row in rows]
+
+    # A new category in another group changes the categories of all groups
+    changed_df = test_df.copy()
+    changed_df.loc[changed_df["hospitalID"] == "exampleHospital03", "dxGroup"] = "new"
+    result_cache = load_result_cache(cache_path)
+
+    # Act
+    detect_drift_by_ID(
+        df=changed_df, output_df=initialize_df(), result_cache=result_cache, **kwargs
+    )
+
+    # Assert
+    # Cached floats are read back exactly
+    first_p_vals = first_df.set_index(["group_value", "feature"])["pValue"]
+    for row in cached_rows:
+        p_val = first_p_vals[(row["group_value"], row["feature"])]
+        assert row["pValue"] == p_val or (np.isnan(row["pValue"]) and np.isnan(p_val))
+    assert len(result_cache) == 2
+    assert len(set(result_cache) & set(load_result_cache(cache_path))) == 0
+
+
+def test_detect_drift_by_ID_sampling_seeds():
+    # Arrange
+    # The target repeats the baseline values in the same order, one year later
+    values = np.random.RandomState(0).normal(0, 1, 200)
+    dates = pd.Timestamp("2019-01-01") + pd.to_timedelta(np.arange(200) // 10, unit="D")
+    df = pd.DataFrame(
+        {
+            "date": np.concatenate([dates, dates + pd.DateOffset(years=1)]),
+            "value": np.concatenate([values, values]),
+        }
+    )
+
+    # Act
+    output_df = detect_drift_by_ID(
+        group_col="",
+        group_values=[""],
+        df=df,
+        datetime_col="date",
+        features=["value"],
+        baseline_start="2019-01-01",
+        baseline_end="2019-12-31",
+        target_start="2020-01-01",
+        target_end="2020-12-31",
+        output_df=initialize_df(),
+        p_val=0.05,
+        max_baseline_samples=40,
+        max_target_samples=40,
+    )
+
+    # Assert
+    # The same positions drawn from both windows would give identical samples (a statistic of 0)
+    assert output_df["targetSamplesUsed"][0] == 40
+    assert output_df["pValue"][0] < 1
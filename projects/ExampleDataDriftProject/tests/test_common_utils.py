@@ -0,0 +1,240 @@
+""" Test ../common/common_utils.py
+"""
+
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.getcwd())
+from common.common_utils import (  # noqa: E402
+    format_arg_features,
+    to_local_path,
+    parse_memory_size,
+    start_peak_rss,
+    get_peak_rss,
+    get_run_key,
+    write_csv_atomic,
+    save_cached_column,
+    load_cached_column,
+    read_csv_cached,
+    factorize_groups,
+    label_groups,
+    read_grouped_data,
+    DATASET_CACHE,
+    LRUCache,
+)
+
+
+def test_format_arg_features():
+    # Act
+    list_of_features = format_arg_features('["fips", "cases",deaths]')
+
+    # Assert
+    assert list_of_features == ["fips", "cases", "deaths"]
+
+
+def test_to_local_path():
+    # Assert
+    assert to_local_path("dbfs:/tmp/checkpoints") == "/dbfs/tmp/checkpoints"
+    assert to_local_path("checkpoints") == "checkpoints"
+
+
+def test_parse_memory_size():
+    # Assert
+    assert parse_memory_size("4GB") == 4 * 1024 ** 3
+    assert parse_memory_size("1.5 mb") == 1.5 * 1024 ** 2
+    assert parse_memory_size("2048") == 2048
+
+
+def test_get_peak_rss():
+    # Act
+    peak_rss = get_peak_rss()
+
+    # Assert
+    assert peak_rss is None or peak_rss > 0
+
+
+def test_start_peak_rss():
+    # Arrange
+    baseline = start_peak_rss()
+
+    # Act
+    values = np.ones(10 * 1024 ** 2)
+    peak_rss = get_peak_rss(baseline)
+
+    # Assert
+    assert peak_rss is None or peak_rss >= values.nbytes
+    assert get_peak_rss(baseline=2 ** 62) is None
+
+
+def test_get_run_key():
+    # Act
+    run_key = get_run_key({"a": 1, "b": ["x", "y"]})
+
+    # Assert
+    assert run_key == get_run_key({"b": ["x", "y"], "a": 1})
+    assert run_key != get_run_key({"a": 2, "b": ["x", "y"]})
+
+
+def test_write_csv_atomic(tmp_path):
+    # Arrange
+    csv_name = str(tmp_path / "checkpoint.csv")
+    df = pd.DataFrame({"a": [1, 2]})
+
+    # Act
+    write_csv_atomic(csv_name, df)
+
+    # Assert
+    assert os.listdir(str(tmp_path)) == ["checkpoint.csv"]
+    assert list(pd.read_csv(csv_name)["a"]) == [1, 2]
+
+
+def test_read_csv_cached(tmp_path):
+    # Arrange
+    data_path = str(tmp_path / "data.csv")
+    cache_root = str(tmp_path / "cache")
+    pd.DataFrame(
+        {"state": ["WA", None, "CA"], "cases": [1, 2, 3], "fips": [1.0, np.nan, 3.5]}
+    ).to_csv(data_path, index=False)
+    expected = pd.read_csv(data_path)
+
+    # Act
+    df_first = read_csv_cached(data_path, columns=["cases", "state"], cache_root=cache_root)
+    df_cached = read_csv_cached(data_path, cache_root=cache_root)
+    df_again = read_csv_cached(data_path, cache_root=cache_root)
+
+    # Assert
+    pd.testing.assert_frame_equal(df_first, expected[["state", "cases"]])
+    pd.testing.assert_frame_equal(df_cached, expected)
+    pd.testing.assert_frame_equal(df_again, expected)
+    assert not df_again["cases"].to_numpy().flags.writeable
+
+
+def test_read_csv_cached_changed_file(tmp_path):
+    # Arrange
+    data_path = str(tmp_path / "data.csv")
+    cache_root = str(tmp_path / "cache")
+    pd.DataFrame({"cases": [1, 2]}).to_csv(data_path, index=False)
+    read_csv_cached(data_path, cache_root=cache_root)
+
+    # Act
+    pd.DataFrame({"cases": [5, 6, 7]}).to_csv(data_path, index=False)
+    df = read_csv_cached(data_path, cache_root=cache_root)
+
+    # Assert
+    assert list(df["cases"]) == [5, 6, 7]
+
+
+def test_save_cached_column_mixed_types(tmp_path):
+    # Arrange
+    cache_dir = str(tmp_path)
+    mixed = pd.Series([1, "a", 2.5, None], dtype=object)
+    strings = pd.Series(["a", None, "b"], dtype=object)
+
+    # Act
+    saved_mixed = save_cached_column(cache_dir, "col0", mixed)
+    saved_strings = save_cached_column(cache_dir, "col1", strings)
+
+    # Assert
+    assert not saved_mixed
+    assert load_cached_column(cache_dir, "col0") is None
+    assert saved_strings
+    assert list(load_cached_column(cache_dir, "col1")[[0, 2]]) == ["a", "b"]
+
+
+def test_read_grouped_data_cached(tmp_path):
+    # Arrange
+    data_path = str(tmp_path / "data.csv")
+    pd.DataFrame({"a": ["x", "x", "y"], "b": [1, 2, 1], "cases": [5, 6, 7]}).to_csv(
+        data_path, index=False
+    )
+    DATASET_CACHE.max_size = 4
+
+    # Act
+    try:
+        df, _ = read_grouped_data(data_path, ["cases"], "a,b")
+        df_again, group_labels = read_grouped_data(data_path, ["cases"], "a,b")
+    finally:
+        DATASET_CACHE.max_size = 0
+        DATASET_CACHE.entries.clear()
+
+    # Assert
+    assert df_again is df
+    assert group_labels.tolist() == ["x|1", "x|2", "y|1"]
+
+
+def test_lru_cache():
+    # Arrange
+    cache = LRUCache(max_size=2)
+
+    # Act
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    # Assert
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1}
+
+
+def test_lru_cache_disabled():
+    # Arrange
+    cache = LRUCache()
+
+    # Act
+    cache.put("a", 1)
+
+    # Assert
+    assert cache.get("a") is None
+
+
+def test_factorize_groups():
+    # Arrange
+    df = pd.DataFrame(
+        {
+            "hospitalID": ["h2", "h1", "h2", "h1", "h2"],
+            "dxGroup": ["CHF", "ACS", "CHF", "CHF", np.nan],
+        }
+    )
+
+    # Act
+    group_codes, group_labels = factorize_groups(df, ["hospitalID", "dxGroup"])
+
+    # Assert
+    assert group_codes.tolist() == [3, 0, 3, 1, 2]
+    assert group_labels.tolist() == ["h1|ACS", "h1|CHF", "h2|nan", "h2|CHF"]
+
+
+def test_label_groups():
+    # Arrange
+    results_df = pd.DataFrame(
+        {"group_col": ["a,b", "a,b", "state"], "group_value": [1, 0, "WA"]}
+    )
+
+    # Act
+    labeled_df = label_groups(results_df, "a,b", np.array(["x|y", "x|z"], dtype=object))
+
+    # Assert
+    assert labeled_df["group_value"].tolist() == ["x|z", "x|y", "WA"]
+
+
+def test_read_grouped_data(tmp_path):
+    # Arrange
+    data_path = str(tmp_path / "data.csv")
+    pd.DataFrame({"a": ["x", "x", "y"], "b": [1, 2, 1], "cases": [5, 6, 7]}).to_csv(
+        data_path, index=False
+    )
+
+    # Act
+    df, group_labels = read_grouped_data(data_path, ["cases"], "a,b")
+    single_df, single_labels = read_grouped_data(data_path, ["cases"], "a")
+
+    # Assert
+    assert df["a,b"].tolist() == [0, 1, 2]
+    assert group_labels.tolist() == ["x|1", "x|2", "y|1"]
+    assert single_labels is None
+    assert sorted(single_df.columns) == ["a", "cases"]
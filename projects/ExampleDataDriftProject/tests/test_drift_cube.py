@@ -0,0 +1,141 @@
+""" Test ../distribution/drift_cube.py
+"""
+
+import sys
+import os
+import pandas as pd
+import numpy as np
+import pytest
+
+sys.path.append(os.getcwd())
+from distribution import drift_cube  # noqa: E402
+from distribution.drift_cube import (  # noqa: E402
+    build_drift_cube,
+    save_drift_cube,
+    load_drift_cube,
+    get_cube_group_bounds,
+    get_cube_date_range,
+    query_drift_cube,
+    get_histogram_edges,
+    get_histogram_codes,
+)
+
+
+@pytest.fixture
+def cube_df():
+    return pd.DataFrame(
+        {
+            "date": [
+                "2020-01-01",
+                "2020-01-01",
+                "2020-01-02",
+                "2020-01-03",
+                "2020-01-03",
+                "2020-01-01",
+                "2020-01-04",
+            ],
+            "state": ["WA", "WA", "WA", "WA", "WA", "OR", "OR"],
+            "cases": [1.0, 2.0, 2.0, np.nan, 5.0, 3.0, 3.0],
+            "county": ["a", "b", "a", "a", "c", "d", "d"],
+        }
+    )
+
+
+def test_build_drift_cube(cube_df):
+    # Act
+    cube = build_drift_cube(cube_df, "date", "state", ["cases", "county"])
+
+    # Assert
+    assert list(cube["groups"]) == ["OR", "WA"]
+    assert cube["row_counts"].tolist() == [1, 1, 2, 1, 2]
+    assert cube["features"]["cases"]["nulls"].tolist() == [0, 0, 0, 0, 1]
+    assert cube["features"]["cases"]["values"].tolist() == [1.0, 2.0, 3.0, 5.0]
+    assert get_cube_date_range(cube) == (
+        pd.Timestamp("2020-01-01"),
+        pd.Timestamp("2020-01-04"),
+    )
+
+
+def test_query_drift_cube(cube_df):
+    # Arrange
+    cube = build_drift_cube(cube_df, "date", "state", ["cases", "county"])
+    group_bounds = get_cube_group_bounds(cube)
+
+    # Act
+    cases = query_drift_cube(
+        cube, group_bounds, "cases", "WA", "2020-01-01", "2020-01-03"
+    )
+    county = query_drift_cube(
+        cube, group_bounds, "county", "WA", "2020-01-02", "2020-01-03"
+    )
+    missing = query_drift_cube(
+        cube, group_bounds, "cases", "CA", "2020-01-01", "2020-01-03"
+    )
+
+    # Assert
+    assert (cases["rows"], cases["nulls"]) == (5, 1)
+    assert cases["values"].tolist() == [1.0, 2.0, 5.0]
+    assert cases["counts"].tolist() == [1, 2, 1]
+    assert county["values"].tolist() == ["a", "c"]
+    assert county["counts"].tolist() == [2, 1]
+    assert missing["rows"] == 0 and len(missing["values"]) == 0
+
+
+def test_get_histogram_codes():
+    # Arrange
+    values = np.arange(10, dtype=float)
+
+    # Act
+    edges = get_histogram_edges(values, n_bins=3)
+    codes = get_histogram_codes(values, edges)
+
+    # Assert
+    assert edges.tolist() == [0.0, 3.0, 6.0, 9.0]
+    assert codes.tolist() == [0, 0, 0, 1, 1, 1, 2, 2, 2, 2]
+
+
+def test_query_drift_cube_histogram(cube_df, monkeypatch):
+    # Arrange
+    monkeypatch.setattr(drift_cube, "CUBE_MAX_EXACT_VALUES", 2)
+    cube = build_drift_cube(
+        cube_df, "date", "state", ["cases", "county"], max_exact_values=2, n_bins=2
+    )
+    group_bounds = get_cube_group_bounds(cube)
+
+    # Act
+    cases = query_drift_cube(
+        cube, group_bounds, "cases", "WA", "2020-01-01", "2020-01-03"
+    )
+    county = query_drift_cube(
+        cube, group_bounds, "county", "WA", "2020-01-01", "2020-01-03"
+    )
+
+    # Assert
+    assert cube["features"]["cases"]["edges"].tolist() == [1.0, 2.5, 5.0]
+    assert "edges" not in cube["features"]["county"]
+    assert (cases["rows"], cases["nulls"]) == (5, 1)
+    assert cases["values"].tolist() == [1.75, 3.75]
+    assert cases["counts"].tolist() == [3, 1]
+    assert county["values"].tolist() == ["a", "b", "c"]
+    assert county["counts"].tolist() == [3, 1, 1]
+
+
+def test_save_load_drift_cube(cube_df, tmp_path):
+    # Arrange
+    cube = build_drift_cube(
+        cube_df, "date", "state", ["cases", "county"], max_exact_values=2
+    )
+    cube_dir = str(tmp_path / "cube")
+
+    # Act
+    save_drift_cube(cube, cube_dir, key="abc")
+    loaded = load_drift_cube(cube_dir, key="abc")
+    stale = load_drift_cube(cube_dir, key="def")
+
+    # Assert
+    assert stale is None
+    assert list(loaded["groups"]) == list(cube["groups"])
+    for feature in ["cases", "county"]:
+        for name, values in cube["features"][feature].items():
+            assert loaded["features"][feature][name].tolist() == values.tolist()
+    assert type(loaded["features"]["county"]["values"][0]) == str
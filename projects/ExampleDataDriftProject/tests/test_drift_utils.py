@@ -0,0 +1,462 @@
+""" Test ../distribution/drift_utils.py
+"""
+
+import sys
+import os
+import pytest
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp, wasserstein_distance
+
+sys.path.append(os.getcwd())
+from distribution.drift_utils import (  # noqa: E402
+    ks_statistic_sorted,
+    ks_pvalues,
+    ks_rolling_statistics,
+    encode_feature_matrix,
+    mmd_drift_test,
+    adjust_pvalues,
+    stratified_sample_indices,
+    get_null_matrix,
+    get_compact_categories,
+    compact_column,
+    value_counts_column,
+    ks_drift_predict_counts,
+    ks_drift_predict_columns,
+    get_accuracy_sample_size,
+    random_sample_indices,
+    choose_ks_strategy,
+    drift_metrics,
+)
+
+
+@pytest.fixture
+def samples(scope="module"):
+    rng = np.random.RandomState(42)
+    baseline = rng.normal(0, 1, 500)
+    target = rng.normal(0.3, 1, 200)
+
+    return baseline, target
+
+
+@pytest.mark.parametrize(
+    "baseline, target",
+    [
+        ([1, 2, 2, 3, 3, 3, 4], [2, 3, 3, 5]),
+        ([0.5, 0.5, 0.5], [0.1, 0.9]),
+        ([1, 2, 3, 4, 5], [1, 2, 3, 4, 5]),
+    ],
+)
+def test_ks_statistic_sorted_ties(baseline, target):
+    # Arrange
+    expected = ks_2samp(baseline, target).statistic
+
+    # Act
+    statistic = ks_statistic_sorted(np.sort(baseline), np.sort(target))
+
+    # Assert
+    assert abs(statistic - expected) < 1e-12
+
+
+def test_ks_statistic_sorted_strings():
+    # Arrange
+    baseline = np.sort(np.array(["15", "15", "10", "11"], dtype=object))
+    target = np.sort(np.array(["15", "15", "15", "15"], dtype=object))
+
+    # Act
+    statistic = ks_statistic_sorted(baseline, target)
+
+    # Assert
+    assert statistic == 0.5
+
+
+def test_ks_pvalues_matches_scipy(samples):
+    # Arrange
+    baseline, target = samples
+    expected = ks_2samp(baseline, target, method="asymp")
+
+    # Act
+    statistic = ks_statistic_sorted(np.sort(baseline), np.sort(target))
+    p_vals = ks_pvalues(np.array([statistic]), len(baseline), len(target))
+
+    # Assert
+    assert abs(statistic - expected.statistic) < 1e-12
+    assert abs(p_vals[0] - expected.pvalue) < 1e-9
+
+
+def test_ks_drift_predict_columns_sorted(samples):
+    # Arrange
+    baseline, target = samples
+    baseline_sorted_cols = [np.sort(baseline), np.sort(baseline)]
+    target_sorted_cols = [np.sort(target), np.sort(baseline[:200])]
+
+    # Act
+    preds = ks_drift_predict_columns(baseline_sorted_cols, target_sorted_cols)
+
+    # Assert
+    assert len(preds["data"]["p_val"]) == 2
+    assert preds["data"]["p_val"][0] < 0.05
+    assert preds["data"]["p_val"][1] > 0.05
+
+
+@pytest.mark.parametrize(
+    "window_bounds",
+    [
+        [(0, 7), (1, 8), (2, 9), (3, 10)],
+        [(0, 7), (7, 14), (14, 20)],
+        [(0, 3), (10, 13), (11, 14), (25, 30)],
+    ],
+)
+def test_ks_rolling_statistics_matches_scipy(window_bounds):
+    # Arrange
+    rng = np.random.RandomState(0)
+    baseline = rng.poisson(10, 300).astype(float)
+    target = rng.poisson(11, 600).astype(float)
+    target_days = rng.randint(0, 30, 600)
+
+    # Act
+    statistics, n_target = ks_rolling_statistics(
+        baseline, target, target_days, window_bounds
+    )
+
+    # Assert
+    for i, (start, end) in enumerate(window_bounds):
+        in_window = (target_days >= start) & (target_days < end)
+        assert n_target[i] == in_window.sum()
+        expected = ks_2samp(baseline, target[in_window]).statistic
+        assert abs(statistics[i] - expected) < 1e-12
+
+
+def test_ks_rolling_statistics_empty_window():
+    # Arrange
+    baseline = np.array([1.0, 2.0, 3.0])
+    target = np.array([1.0, 2.0])
+    target_days = np.array([0, 5])
+
+    # Act
+    statistics, n_target = ks_rolling_statistics(
+        baseline, target, target_days, [(1, 3)]
+    )
+
+    # Assert
+    assert n_target[0] == 0
+    assert np.isnan(statistics[0])
+
+
+def test_encode_feature_matrix():
+    # Arrange
+    X_baseline = pd.DataFrame({"a": [1.0, 3.0], "b": ["x", "y"]})
+    X_target = pd.DataFrame({"a": [5.0], "b": ["z"]})
+
+    # Act
+    Z_baseline, Z_target = encode_feature_matrix(X_baseline, X_target)
+
+    # Assert
+    assert Z_baseline.shape == (2, 4)
+    assert Z_target.shape == (1, 4)
+    assert list(Z_baseline[:, 0]) == [-1.0, 1.0]
+    assert list(Z_target[0]) == [3.0, 0.0, 0.0, 1.0]
+
+
+def test_mmd_drift_test_joint_shift():
+    # Arrange
+    # Same marginals in baseline and target, but the correlation flips sign
+    rng = np.random.RandomState(1)
+    x = rng.normal(0, 1, 2000)
+    y = rng.normal(0, 1, 2000)
+    X_baseline = pd.DataFrame({"a": x, "b": x + 0.1 * rng.normal(0, 1, 2000)})
+    X_target = pd.DataFrame({"a": y, "b": -y + 0.1 * rng.normal(0, 1, 2000)})
+
+    # Act
+    result = mmd_drift_test(X_baseline, X_target, max_samples=1000)
+
+    # Assert
+    assert result["p_val"] < 0.05
+    assert result["n_baseline"] == 1000
+    assert result["n_target"] == 1000
+
+
+def test_mmd_drift_test_no_shift():
+    # Arrange
+    rng = np.random.RandomState(2)
+    X_baseline = pd.DataFrame({"a": rng.normal(0, 1, 500), "b": rng.choice(["x", "y"], 500)})
+    X_target = pd.DataFrame({"a": rng.normal(0, 1, 300), "b": rng.choice(["x", "y"], 300)})
+
+    # Act
+    result = mmd_drift_test(X_baseline, X_target)
+
+    # Assert
+    assert result["p_val"] > 0.05
+    assert result["n_baseline"] == 500
+    assert result["n_target"] == 300
+
+
+@pytest.mark.parametrize(
+    "method, expected",
+    [
+        ("bonferroni", [0.04, 0.16, 0.12, 0.8, np.nan]),
+        ("bh", [0.04, 0.16 / 3, 0.16 / 3, 0.2, np.nan]),
+    ],
+)
+def test_adjust_pvalues(method, expected):
+    # Arrange
+    p_vals = np.array([0.01, 0.04, 0.03, 0.2, np.nan])
+
+    # Act
+    adjusted = adjust_pvalues(p_vals, method)
+
+    # Assert
+    np.testing.assert_allclose(adjusted, expected)
+
+
+def test_adjust_pvalues_unknown_method():
+    with pytest.raises(ValueError):
+        adjust_pvalues(np.array([0.01]), "holm")
+
+
+def test_stratified_sample_indices():
+    # Arrange
+    strata = np.array(["2020-01-01"] * 600 + ["2020-01-02"] * 300 + ["2020-01-03"] * 100)
+
+    # Act
+    indices = stratified_sample_indices(strata, 100, random_state=3)
+    indices_again = stratified_sample_indices(strata, 100, random_state=3)
+
+    # Assert
+    assert len(indices) == 100
+    assert len(np.unique(indices)) == 100
+    assert list(indices) == sorted(indices)
+    assert list(indices) == list(indices_again)
+    _, counts = np.unique(strata[indices], return_counts=True)
+    assert list(counts) == [60, 30, 10]
+
+
+def test_stratified_sample_indices_small():
+    # Act
+    indices = stratified_sample_indices(np.array([1, 1, 2]), 10)
+
+    # Assert
+    assert list(indices) == [0, 1, 2]
+
+
+def test_get_null_matrix():
+    # Arrange
+    df = pd.DataFrame(
+        {"a": [1.0, np.nan, 3.0, np.nan], "b": ["x", "y", None, "z"], "c": [1, 2, 3, 4]}
+    )
+
+    # Act
+    null_matrix = get_null_matrix(df, ["a", "b", "c"])
+
+    # Assert
+    assert null_matrix.shape == (4, 3)
+    assert list(null_matrix.sum(axis=0)) == [2, 1, 0]
+    assert list(~null_matrix.any(axis=1)) == list(df.notna().all(axis=1))
+
+
+def test_compact_column():
+    # Arrange
+    df = pd.DataFrame({"x": [0.5, 1.25, np.nan], "y": ["b", None, "a"]})
+
+    # Act
+    categories = get_compact_categories(df, ["x", "y"])
+    x = compact_column(df["x"].dropna().to_numpy(), categories.get("x"))
+    y = compact_column(df["y"].dropna().to_numpy(), categories.get("y"))
+
+    # Assert
+    assert list(categories) == ["y"]
+    assert x.dtype == np.float32
+    assert list(x) == [0.5, 1.25]
+    assert y.dtype == np.int32
+    assert list(y) == [1, 0]
+
+
+def test_compact_column_ks(samples):
+    # Arrange
+    baseline, target = samples
+    rng = np.random.RandomState(0)
+    df_baseline = pd.DataFrame({"x": baseline, "y": rng.choice(["a", "b", "c"], 500)})
+    df_target = pd.DataFrame({"x": target, "y": rng.choice(["a", "b", "c"], 200)})
+    categories = get_compact_categories(pd.concat([df_baseline, df_target]), ["x", "y"])
+
+    def sorted_cols(df, categories=None):
+        return [
+            np.sort(
+                df[col].to_numpy()
+                if categories is None
+                else compact_column(df[col].to_numpy(), categories.get(col))
+            )
+            for col in df.columns
+        ]
+
+    # Act
+    preds = ks_drift_predict_columns(sorted_cols(df_baseline), sorted_cols(df_target))
+    preds_compact = ks_drift_predict_columns(
+        sorted_cols(df_baseline, categories), sorted_cols(df_target, categories)
+    )
+
+    # Assert
+    assert np.allclose(preds_compact["data"]["p_val"], preds["data"]["p_val"], atol=1e-6)
+    assert preds_compact["data"]["distance"][1] == preds["data"]["distance"][1]
+
+
+@pytest.mark.parametrize(
+    "baseline, target",
+    [
+        (np.array([0, 1, 1, 2, 5, 5, 5]), np.array([1, 2, 2, 2, 3, 9])),
+        (np.array([0.5, 1.0, 1.0, 2.5]), np.array([1.0, 2.5, 2.5, 4.0])),
+        (np.array([3.0, 3.0, 4.0, 7.0]), np.array([3.0, 5.0, 5.0])),
+        (np.array(["a", "b", "b", "c"], dtype=object), np.array(["b", "c", "c"], dtype=object)),
+    ],
+)
+def test_ks_drift_predict_counts(baseline, target):
+    # Act
+    preds = ks_drift_predict_columns([np.sort(baseline)], [np.sort(target)])
+    preds_counts = ks_drift_predict_counts(
+        [value_counts_column(baseline)], [value_counts_column(target)]
+    )
+
+    # Assert
+    assert preds_counts["data"]["distance"][0] == preds["data"]["distance"][0]
+    assert preds_counts["data"]["p_val"][0] == preds["data"]["p_val"][0]
+
+
+def test_ks_drift_predict_columns(samples):
+    # Arrange
+    baseline, target = samples
+    baseline_ints = np.round(baseline * 2)
+    target_ints = np.round(target * 2)
+
+    # Act
+    preds = ks_drift_predict_columns(
+        [np.sort(baseline), value_counts_column(baseline_ints)],
+        [np.sort(target), value_counts_column(target_ints)],
+    )
+
+    # Assert
+    # Each feature matches the test of its own kind
+    statistic = ks_statistic_sorted(np.sort(baseline), np.sort(target))
+    preds_counts = ks_drift_predict_counts(
+        [value_counts_column(baseline_ints)], [value_counts_column(target_ints)]
+    )
+    assert preds["data"]["distance"][0] == statistic
+    p_val = ks_pvalues([statistic], len(baseline), len(target))[0]
+    assert preds["data"]["p_val"][0] == p_val
+    assert preds["data"]["distance"][1] == preds_counts["data"]["distance"][0]
+    assert preds["data"]["p_val"][1] == preds_counts["data"]["p_val"][0]
+
+
+def test_get_accuracy_sample_size():
+    # Arrange
+    rng = np.random.RandomState(0)
+    baseline = rng.normal(0, 1, 200000)
+    target = rng.normal(0.05, 1, 100000)
+    sample_size = get_accuracy_sample_size(0.02)
+
+    # Act
+    statistic = ks_statistic_sorted(np.sort(baseline), np.sort(target))
+    sampled_statistic = ks_statistic_sorted(
+        np.sort(baseline[random_sample_indices(len(baseline), sample_size, 1)]),
+        np.sort(target[random_sample_indices(len(target), sample_size, 2)]),
+    )
+
+    # Assert
+    # ln(2 / 0.025) / (2 * 0.01 ** 2) rows
+    assert sample_size == 21911
+    assert abs(sampled_statistic - statistic) <= 0.02
+
+
+def test_random_sample_indices():
+    # Act
+    indices = random_sample_indices(1000, 50, random_state=3)
+
+    # Assert
+    assert len(indices) == 50
+    assert np.all(np.diff(indices) >= 0)
+    assert indices.min() >= 0 and indices.max() < 1000
+    assert list(random_sample_indices(5, 50)) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize(
+    "n_baseline, n_target, n_distinct, is_integer, expected",
+    [
+        # Tiny group: sorting everything is cheapest
+        (20, 10, 1000000, False, "exact"),
+        # Heavily repeated integers: counted without sorting
+        (1000000, 500000, 50, True, "weighted"),
+        # Repeated strings: sorted either way, but tested on few distinct values
+        (1000000, 500000, 50, False, "weighted"),
+        # Large continuous feature: sampled
+        (1000000, 500000, 1000000, False, "sampled"),
+        # Continuous feature, but the windows are no larger than the sample
+        (20000, 10000, 1000000, False, "exact"),
+    ],
+)
+def test_choose_ks_strategy(n_baseline, n_target, n_distinct, is_integer, expected):
+    # Act
+    strategy = choose_ks_strategy(
+        n_baseline, n_target, n_distinct, is_integer, sample_size=21911
+    )
+
+    # Assert
+    assert strategy == expected
+
+
+def test_choose_ks_strategy_without_sampling():
+    # Act
+    strategy = choose_ks_strategy(1000000, 500000, 1000000, False, sample_size=None)
+
+    # Assert
+    assert strategy == "exact"
+
+
+def test_value_counts_column():
+    # Act
+    values, counts = value_counts_column(np.array([7, 3, 3, 7, 7, 10]))
+    float_values, float_counts = value_counts_column(np.array([0.5, 0.5, 2.0]))
+
+    # Assert
+    assert list(values) == [3, 7, 10]
+    assert list(counts) == [2, 3, 1]
+    assert list(float_values) == [0.5, 2.0]
+    assert list(float_counts) == [2, 1]
+
+
+def test_drift_metrics(samples):
+    # Arrange
+    baseline, target = samples
+    edges = np.quantile(baseline, np.arange(1, 10) / 10, method="inverted_cdf")
+    p_base = np.bincount(np.searchsorted(edges, baseline), minlength=10) / len(baseline)
+    p_tar = np.bincount(np.searchsorted(edges, target), minlength=10) / len(target)
+    mixture = (p_base + p_tar) / 2
+
+    # Act
+    results = drift_metrics(
+        np.sort(baseline), np.sort(target), ["psi", "wasserstein", "js"]
+    )
+    results_counts = drift_metrics(
+        value_counts_column(baseline), value_counts_column(target), ["wasserstein"]
+    )
+
+    # Assert
+    assert abs(results["wasserstein"] - wasserstein_distance(baseline, target)) < 1e-12
+    assert abs(results["psi"] - np.sum((p_tar - p_base) * np.log(p_tar / p_base))) < 1e-12
+    expected_js = 0.5 * np.sum(p_base * np.log2(p_base / mixture)) + 0.5 * np.sum(
+        p_tar * np.log2(p_tar / mixture)
+    )
+    assert abs(results["js"] - expected_js) < 1e-12
+    assert results_counts == {"wasserstein": results["wasserstein"]}
+
+
+def test_drift_metrics_categorical():
+    # Arrange
+    baseline = np.array(["a", "a", "b", "b"], dtype=object)
+    target = np.array(["a", "b", "b", "b"], dtype=object)
+
+    # Act
+    results = drift_metrics(baseline, target, ["psi", "wasserstein", "js"], categorical=True)
+
+    # Assert
+    assert np.isnan(results["wasserstein"])
+    assert abs(results["psi"] - (-0.25 * np.log(0.5) + 0.25 * np.log(1.5))) < 1e-12
+    assert 0 < results["js"] < 1
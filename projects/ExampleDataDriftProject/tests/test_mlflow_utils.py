@@ -0,0 +1,61 @@
+""" Test ../common/mlflow_utils.py
+"""
+
+import sys
+import os
+import pytest
+import mlflow
+from mlflow.tracking import MlflowClient
+
+sys.path.append(os.getcwd())
+from common.mlflow_utils import AsyncMlflowLogger  # noqa: E402
+
+
+@pytest.fixture
+def tracking_uri(tmp_path, monkeypatch):
+    monkeypatch.setenv("MLFLOW_ALLOW_FILE_STORE", "true")
+    uri = (tmp_path / "mlruns").as_uri()
+    mlflow.set_tracking_uri(uri)
+    yield uri
+    mlflow.set_tracking_uri(None)
+
+
+def test_async_mlflow_logger(tracking_uri, tmp_path):
+    # Arrange
+    artifact_names = ["results_{0}.csv".format(i) for i in range(5)]
+    for name in artifact_names:
+        (tmp_path / name).write_text("a,b\n1,2\n")
+
+    # Act
+    with mlflow.start_run() as run:
+        with AsyncMlflowLogger(max_queue_size=2, metric_batch_size=3) as logger:
+            for name in artifact_names:
+                logger.log_artifact(str(tmp_path / name))
+            for step in range(4):
+                logger.log_metrics({"rowsTested": step, "rowsSkipped": 1}, step=step)
+
+    # Assert
+    client = MlflowClient()
+    logged = sorted(artifact.path for artifact in client.list_artifacts(run.info.run_id))
+    history = client.get_metric_history(run.info.run_id, "rowsTested")
+    assert logged == artifact_names
+    assert sorted(metric.value for metric in history) == [0, 1, 2, 3]
+    assert len(client.get_metric_history(run.info.run_id, "rowsSkipped")) == 4
+
+
+def test_async_mlflow_logger_error(tracking_uri, tmp_path):
+    # Act and Assert
+    with mlflow.start_run():
+        logger = AsyncMlflowLogger()
+        logger.log_artifact(str(tmp_path / "missing.csv"))
+        with pytest.raises(Exception):
+            logger.close()
+    assert len(logger.pending) == 0
+
+
+def test_async_mlflow_logger_body_error(tracking_uri, tmp_path):
+    # Act and Assert
+    with pytest.raises(KeyError):
+        with mlflow.start_run(), AsyncMlflowLogger() as logger:
+            logger.log_artifact(str(tmp_path / "missing.csv"))
+            raise KeyError("groupID")
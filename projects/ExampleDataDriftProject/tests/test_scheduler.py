@@ -0,0 +1,95 @@
+""" Test ../common/scheduler.py
+"""
+
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.getcwd())
+from common.scheduler import run_tasks, split_costly_tasks  # noqa: E402
+
+
+def test_run_tasks_largest_first():
+    # Arrange
+    started = []
+
+    def run(task):
+        started.append(task)
+        return task * 2
+
+    # Act
+    results = list(run_tasks(run, [1, 5, 3], costs=[1, 5, 3]))
+
+    # Assert
+    assert started == [5, 3, 1]
+    assert [(i, result, error) for i, result, error in results] == [
+        (1, 10, None),
+        (2, 6, None),
+        (0, 2, None),
+    ]
+
+
+def test_run_tasks_threads():
+    # Arrange
+    thread_names = set()
+
+    def run(task):
+        if task == "fail":
+            raise ValueError("bad task")
+        thread_names.add(threading.current_thread().name)
+        time.sleep(task)
+        return task
+
+    tasks = [0.2, 0.05, 0.05, 0.05, 0.05, "fail"]
+
+    # Act
+    results = {
+        i: (result, error)
+        for i, result, error in run_tasks(
+            run, tasks, costs=[4, 1, 1, 1, 1, 0], n_workers=2
+        )
+    }
+
+    # Assert
+    assert len(thread_names) == 2
+    assert [results[i][0] for i in range(5)] == tasks[:5]
+    assert isinstance(results[5][1], ValueError)
+
+
+def test_run_tasks_memory_budget():
+    # Arrange
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def run(task):
+        with lock:
+            running.append(task)
+            peak.append(sum(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(task)
+        return task
+
+    # The largest task is over the budget and runs alone
+    tasks = [12, 6, 5, 4, 3]
+
+    # Act
+    results = list(
+        run_tasks(run, tasks, costs=tasks, n_workers=3, sizes=tasks, budget=10)
+    )
+
+    # Assert
+    assert sorted(result for _, result, _ in results) == sorted(tasks)
+    assert peak[0] == 12
+    assert max(peak[1:]) <= 10
+
+
+def test_split_costly_tasks():
+    # Act
+    n_parts = split_costly_tasks([90, 5, 5], n_workers=4, max_parts=3)
+
+    # Assert
+    assert n_parts == [3, 1, 1]
+    assert split_costly_tasks([90, 5, 5], n_workers=1, max_parts=3) == [1, 1, 1]
@@ -4,6 +4,7 @@
 import sys
 import os
 import pytest
+import numpy as np
 import pandas as pd
 
 sys.path.append(os.getcwd())
@@ -13,6 +14,7 @@ from validation.model_input.validation_utils import (  # noqa: E402
     update_json_dict,
     construct_schema_drift_row,
     create_dataframe,
+    label_validation_groups,
 )
 
 
@@ -204,3 +206,20 @@ def test_create_dataframe_append(dict_gcsTotalLast, dict_dxGroup):
 
     # Assert
     assert type(metrics_df) == pd.DataFrame
+
+
+def test_label_validation_groups():
+    # Arrange
+    output_dict = initialize_validation_output_dict(1, "cases", "state,county", [1, 0])
+    output_dict["schema_validation"]["state,county"][1] = {"cases": {"status": "valid"}}
+
+    # Act
+    output_dict, group_values = label_validation_groups(
+        output_dict, "state,county", np.array(["WA|a", "WA|b"], dtype=object)
+    )
+
+    # Assert
+    assert group_values == ["WA|b", "WA|a"]
+    assert output_dict["schema_validation"]["state,county"]["WA|b"] == {
+        "cases": {"status": "valid"}
+    }
@@ -0,0 +1,125 @@
+""" Test ../common/worker.py
+"""
+
+import sys
+import os
+import threading
+import types
+import pytest
+import pandas as pd
+
+sys.path.append(os.getcwd())
+from common.worker import (  # noqa: E402
+    create_worker,
+    submit_to_worker,
+    run_job,
+    is_loopback_host,
+    JOB_MODULES,
+)
+from common.common_utils import DATASET_CACHE  # noqa: E402
+
+
+@pytest.fixture
+def worker_url(tmp_path, monkeypatch):
+    server = create_worker(port=0, max_datasets=2, max_prepared=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = "http://{0}:{1}".format(*server.server_address)
+    monkeypatch.setenv("DRIFT_WORKER_URL", url)
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", (tmp_path / "mlruns").as_uri())
+    monkeypatch.setenv("MLFLOW_ALLOW_FILE_STORE", "true")
+    monkeypatch.setenv("DATA_CACHE_DIR", str(tmp_path / "cache"))
+    yield url
+    server.shutdown()
+    server.server_close()
+    DATASET_CACHE.max_size = 0
+    DATASET_CACHE.entries.clear()
+
+
+def test_submit_to_worker_not_set(monkeypatch):
+    # Arrange
+    monkeypatch.delenv("DRIFT_WORKER_URL", raising=False)
+
+    # Act and Assert
+    assert submit_to_worker("validate_fips", ["-i", "1"]) is None
+
+
+@pytest.mark.parametrize(
+    "host, expected",
+    [
+        ("localhost", True),
+        ("127.0.0.1", True),
+        ("127.1.2.3", True),
+        ("::1", True),
+        ("10.0.0.5", False),
+        ("0.0.0.0", False),
+        ("worker.example.com", False),
+        (None, False),
+    ],
+)
+def test_is_loopback_host(host, expected):
+    # Act and Assert
+    assert is_loopback_host(host) == expected
+
+
+def test_submit_to_worker_remote(monkeypatch):
+    # Arrange
+    sent = []
+    monkeypatch.setenv("DRIFT_WORKER_URL", "http://10.0.0.5:8765")
+    monkeypatch.setenv("AZURE_CLIENT_SECRET", "secret")
+    monkeypatch.setattr("urllib.request.urlopen", lambda request: sent.append(request))
+
+    # Act
+    returncode = submit_to_worker("validate_fips", ["-i", "1"])
+
+    # Assert
+    assert returncode is None
+    assert sent == []
+
+
+def test_create_worker_remote():
+    # Act and Assert
+    with pytest.raises(ValueError):
+        create_worker(host="0.0.0.0", port=0)
+
+
+def test_submit_to_worker(worker_url, tmp_path, monkeypatch):
+    # Arrange
+    monkeypatch.chdir(tmp_path)
+    data_path = str(tmp_path / "data.csv")
+    pd.DataFrame({"state": ["WA", "WA", "CA"], "fips": [1.0, 2.0, 3.0]}).to_csv(
+        data_path, index=False
+    )
+    argv = ["-i", "1", "-p", data_path, "-g", "state"]
+
+    # Act
+    returncode = submit_to_worker("validate_fips", argv)
+    returncode_again = submit_to_worker("validate_fips", argv)
+    returncode_bad = submit_to_worker("validate_fips", ["-i", "1"])
+
+    # Assert
+    assert returncode == 0
+    assert returncode_again == 0
+    assert returncode_bad == 2
+    assert os.path.isfile(str(tmp_path / "model-1_schema_validation_results.csv"))
+    assert DATASET_CACHE.stats()["hits"] >= 1
+
+
+def test_run_job_env(tmp_path, monkeypatch):
+    # Arrange
+    job_module = types.ModuleType("env_job")
+    job_module.main = lambda argv, use_worker: print(
+        os.environ.get("MLFLOW_TRACKING_TOKEN"), os.environ.get("DATA_CACHE_DIR")
+    )
+    monkeypatch.setitem(sys.modules, "env_job", job_module)
+    monkeypatch.setitem(JOB_MODULES, "env_job", "env_job")
+    monkeypatch.setenv("MLFLOW_TRACKING_TOKEN", "worker-token")
+    monkeypatch.setenv("DATA_CACHE_DIR", "/worker/cache")
+
+    # Act
+    result = run_job("env_job", [], str(tmp_path), {"DATA_CACHE_DIR": "/client/cache"})
+
+    # Assert
+    assert result["output"] == "None /client/cache\n"
+    assert os.environ["MLFLOW_TRACKING_TOKEN"] == "worker-token"
+    assert os.environ["DATA_CACHE_DIR"] == "/worker/cache"
@@ -71,6 +71,8 @@ if __name__ == "__main__":
     modelID = args.modelID
     features = format_arg_features(args.features)
     group_col = args.group_col
+    if group_col != "":
+        group_col = ",".join(format_arg_features(group_col))
 
     # ------------------------------------
     # 1. Read results JSON file
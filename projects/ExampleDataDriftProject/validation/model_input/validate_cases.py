@@ -2,18 +2,21 @@
 """
 
 import argparse
-import mlflow
 import os
 import sys
-import pandas as pd
 import numpy as np
-from environs import Env
-from validation_utils import (
+
+sys.path.append(os.getcwd())
+from common.common_utils import format_arg_features, read_grouped_data  # noqa: E402
+from common.mlflow_utils import AsyncMlflowLogger  # noqa: E402
+from common.worker import submit_to_worker  # noqa: E402
+from validation_utils import (  # noqa: E402
     get_unique_vals,
     initialize_validation_output_dict,
     write_out_to_json,
     write_out_to_csv,
     create_dataframe,
+    label_validation_groups,
 )
 
 # ----------------------
@@ -76,7 +79,13 @@ def validate_schema_cases(group_col, group_values, df, feature, output_dict):
 # Main
 # ----------------------
 
-if __name__ == "__main__":
+def main(argv=None, use_worker=True):
+    """ Validate the schema of cases with the given command line arguments.
+
+    Input:
+        argv (list of str): Command line arguments. Defaults to sys.argv[1:].
+        use_worker (bool): Run on the worker daemon set by DRIFT_WORKER_URL, if any.
+    """
     # Read in arguments
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -95,9 +104,25 @@ if __name__ == "__main__":
         type=str,
         required=False,
         default="",
-        help="Name of column in data to group by.",
+        help=(
+            "Name of column in data to group by, or comma separated names of several columns to group by their "
+            "combinations (e.g., hospitalID,dxGroup)"
+        ),
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    # Hand the job to the worker daemon if one is set (see common/worker.py)
+    if use_worker:
+        returncode = submit_to_worker(
+            "validate_cases", sys.argv[1:] if argv is None else argv
+        )
+        if returncode is not None:
+            sys.exit(returncode)
+
+    # Deferred so that importing this module and argument errors don't pay for mlflow's startup
+    import mlflow
+    from environs import Env
+
     env = Env()
     env.read_env()
 
@@ -105,19 +130,24 @@ if __name__ == "__main__":
     modelID = args.modelID
     data_path = args.dataPath
     group_col = args.group_col
+    if group_col != "":
+        group_col = ",".join(format_arg_features(group_col))
 
-    with mlflow.start_run():
+    # Artifacts are uploaded in the background and flushed before the run ends
+    with mlflow.start_run(), AsyncMlflowLogger() as mlflow_logger:
         # ------------------------------------
-        # 1. Load in data
+        # 1. Specify what feature to retrieve from the specified table
         # ------------------------------------
 
-        df = pd.read_csv(data_path)
+        feature = "cases"
 
         # ------------------------------------
-        # 2. Specify what feature to retrieve from the specified table
+        # 2. Load in data
         # ------------------------------------
 
-        feature = "cases"
+        # Only the needed columns, from the local columnar cache after the first read,
+        # with several grouping columns turned into one integer group key
+        df, group_labels = read_grouped_data(data_path, [feature], group_col)
 
         # ------------------------------------
         # 3. Initialize output dictionary
@@ -147,12 +177,18 @@ if __name__ == "__main__":
             "Schema validation check for {0} complete for all groups.".format(feature)
         )
 
+        # Group keys are only turned into readable labels for the output
+        if group_labels is not None:
+            output_dict, group_values = label_validation_groups(
+                output_dict, group_col, group_labels
+            )
+
         # ------------------------------------
         # 5. Output dictionary to JSON file
         # ------------------------------------
         out_file_name = "model-{0}_schema_validation_results.json".format(modelID)
         write_out_to_json(out_file_name, output_dict)
-        mlflow.log_artifact(out_file_name)
+        mlflow_logger.log_artifact(out_file_name)
 
         # ------------------------------------
         # 6. Write to SQL Server Tables
@@ -163,5 +199,12 @@ if __name__ == "__main__":
 
         csv_name = "model-{0}_schema_validation_results.csv".format(modelID)
         write_out_to_csv(csv_name, schema_drift_df)
-        mlflow.log_artifact(csv_name)
+        mlflow_logger.log_artifact(csv_name)
+        mlflow_logger.log_metric(
+            "invalidGroups",
+            schema_drift_df["statusMsg"].str.startswith("invalid").sum(),
+        )
 
+
+if __name__ == "__main__":
+    main()
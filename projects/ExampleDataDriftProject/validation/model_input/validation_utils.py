@@ -44,6 +44,27 @@ def initialize_validation_output_dict(modelID, feature, group_col, group_values)
     return new_dict
 
 
+def label_validation_groups(output_dict, group_col, group_labels):
+    """ Replace the group keys from factorize_groups() in the validation results with their labels.
+
+    Inputs:
+        output_dict (dict): Dictionary containing schema validation results, keyed by group key.
+        group_col (str): Name of the grouping columns (e.g., 'hospitalID,dxGroup').
+        group_labels (np.ndarray): Label of each group key, returned by factorize_groups().
+
+    Returns:
+        output_dict (dict): The dictionary, keyed by group label.
+        group_values (list of str): Labels of the groups, in the same order as in output_dict.
+    """
+    output_dict["schema_validation"][group_col] = {
+        group_labels[int(group_value)]: results
+        for group_value, results in output_dict["schema_validation"][group_col].items()
+    }
+    group_values = list(output_dict["schema_validation"][group_col])
+
+    return output_dict, group_values
+
+
 def update_json_dict(dict1, dict2):
     """ Update the results json file with new results.
 